@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import io
+import random
+import unittest
+
+from tools import benchmark
+from tools import corpus
+from tools import extraction
+
+from . import util
+
+
+class CorpusTest(util.TempDirTestCase):
+  def test_corpus_is_reproducible(self):
+    self.assertEqual(corpus.synthetic_document(random.Random(3)), corpus.synthetic_document(random.Random(3)))
+    self.assertNotEqual(corpus.synthetic_document(random.Random(3)), corpus.synthetic_document(random.Random(4)))
+
+  def test_generated_templates_contain_messages(self):
+    fnames = corpus.generate_corpus(self.tmp_dir, seed=1, num_files=3)
+    self.assertEqual(len(fnames), 3)
+    for fname in fnames:
+      with io.open(fname, "rt", encoding="utf-8") as f:
+        self.assertIn("i18n", f.read())
+      self.assertTrue(extraction.extract_messages_from_html_file(fname))
+
+  def test_unknown_options_are_rejected(self):
+    with self.assertRaises(corpus.Error):
+      corpus.corpus_options({"num_flies": 3})
+
+
+class BenchmarkTest(unittest.TestCase):
+  def test_fingerprinting_baseline_matches_the_md5_scheme(self):
+    results = benchmark.measure_fingerprinting(count=50, repeat=1)
+    self.assertEqual(results["messages"], 50)
+    self.assertIn("generator_md5", results)
+    self.assertIn("v1_md5", results)
+
+  def test_ng_lexer(self):
+    results = benchmark.measure_ng_lexer(count=50, repeat=1)
+    self.assertEqual(list(results["literals"]), ["regex_split", "lexer"])
+
+  def test_regex_split_baseline(self):
+    self.assertEqual(benchmark._split_ng_expressions("a {{ b // i18n-ph(B|x) }} c {{d}}"),
+                     [("a ", "b", "B", "x"), (" c ", "d", None, None), ("", "", None, None)])
+
+  def test_compare_suites_flags_regressions(self):
+    old = {"corpus": {"seed": 0}, "phases": {"parse": {"seconds": 1.0}, "build": {"seconds": 1.0}}}
+    new = {"corpus": {"seed": 0}, "phases": {"parse": {"seconds": 1.05}, "build": {"seconds": 1.5}}}
+    self.assertEqual([(name, regressed) for (name, old_seconds, new_seconds, ratio, regressed)
+                      in benchmark.compare_suites(old, new)],
+                     [("parse", False), ("build", True)])
+    with self.assertRaises(benchmark.Error):
+      benchmark.compare_suites(old, dict(new, corpus={"seed": 1}))
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from tools import binary_catalog
+from tools import fingerprint
+
+from . import util
+
+
+_HTML = util.template(
+    '<p i18n="greeting|the greeting">Hello <b>{{user}}</b></p>',
+    '<p i18n="farewell">Bye {{user}}</p>',
+    '<input i18n-title="tooltip" title="Name">')
+
+
+class BinaryCatalogTest(util.TempDirTestCase):
+  def setUp(self):
+    super(BinaryCatalogTest, self).setUp()
+    self.messages = util.parse_messages(_HTML)
+    self.fname = self.path("messages.cat")
+    binary_catalog.write_catalog(self.fname, self.messages)
+    self.catalog = binary_catalog.BinaryCatalog(self.fname)
+    self.addCleanup(self.catalog.close)
+
+  def test_round_trip(self):
+    self.assertEqual(list(self.catalog), list(self.messages))
+    for (message_id, msg) in self.messages.items():
+      decoded = self.catalog[message_id]
+      self.assertEqual(decoded.id, message_id)
+      self.assertEqual(decoded.comment, msg.comment)
+      self.assertEqual(decoded.unparse(), msg.unparse())
+    self.assertIn(message_id, self.catalog)
+    self.assertNotIn("0" * 32, self.catalog)
+    self.assertIsNone(self.catalog.get("0" * 32))
+    with self.assertRaises(KeyError):
+      self.catalog["0" * 32]
+
+  def test_views_follow_the_mapping_contract(self):
+    items = self.catalog.items()
+    values = self.catalog.values()
+    self.assertEqual(len(items), 3)
+    self.assertEqual(len(values), 3)
+    # Views can be iterated more than once.
+    self.assertEqual([message_id for (message_id, msg) in items], list(self.messages))
+    self.assertEqual([message_id for (message_id, msg) in items], list(self.messages))
+    self.assertEqual([msg.id for msg in values], [msg.id for msg in values])
+    self.assertEqual(self.catalog.keys() & set(list(self.messages)[:1]), set(list(self.messages)[:1]))
+    msg = next(iter(self.messages.values()))
+    self.assertIn((msg.id, msg), items)
+    self.assertNotIn((msg.id, next(reversed(self.messages.values()))), items)
+    self.assertNotIn(("0" * 32, msg), items)
+    self.assertIn(msg, values)
+    self.assertIn(self.catalog[msg.id], values)
+    self.assertNotIn(util.build_message("Not in the catalog"), values)
+    self.assertNotIn("not a message", values)
+
+  def test_empty_files_are_rejected(self):
+    for data in ("", "too short"):
+      with self.assertRaises(binary_catalog.Error):
+        binary_catalog.BinaryCatalog(self.write("bad.cat", data))
+
+  def test_iter_messages_decodes_in_order(self):
+    self.assertEqual([msg.id for msg in self.catalog.iter_messages()], list(self.messages))
+
+  def test_duplicate_ids_are_rejected(self):
+    msg = next(iter(self.messages.values()))
+    with self.assertRaises(binary_catalog.Error):
+      binary_catalog.write_catalog(self.path("dup.cat"), [msg, msg])
+
+  def test_fingerprint_version_must_match(self):
+    fingerprint.set_default_version(2)
+    with self.assertRaises(binary_catalog.Error):
+      binary_catalog.BinaryCatalog(self.fname)
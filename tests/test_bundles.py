@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import io
+import json
+import os
+
+from tools import bundles
+from tools import extraction
+from tools import pseudo_translation
+
+from . import util
+
+
+_HELLO = '<p i18n="greeting">Hello <b>{{user}}</b></p>'
+_BYE = '<p i18n="farewell">Bye</p>'
+_HELP = '<p i18n="help">Help</p>'
+
+
+class BundlesTest(util.TempDirTestCase):
+  def setUp(self):
+    super(BundlesTest, self).setUp()
+    self.src_dir = self.path("src")
+    fnames = [self.write("src/home.html", util.template(_HELLO, _BYE)),
+              self.write("src/admin/users.html", util.template(_HELLO, _HELP)),
+              self.write("src/admin/help.html", util.template(_HELP))]
+    self.catalog = extraction.merge_extractions(extraction.extract_files(fnames, jobs=1))
+    (self.hello_id, self.bye_id, self.help_id) = list(self.catalog)
+
+  def test_a_shard_per_template(self):
+    self.assertEqual(bundles.shard_message_ids(self.catalog, self.src_dir),
+                     {"home": [self.hello_id, self.bye_id],
+                      "admin/users": [self.hello_id, self.help_id],
+                      "admin/help": [self.help_id]})
+
+  def test_routes_and_common_messages(self):
+    routes = {"home": ["home.html"], "admin": ["admin/*.html"]}
+    self.assertEqual(bundles.shard_message_ids(self.catalog, self.src_dir, routes=routes),
+                     {"home": [self.hello_id, self.bye_id], "admin": [self.hello_id, self.help_id]})
+    self.assertEqual(bundles.shard_message_ids(self.catalog, self.src_dir, routes=routes, common_threshold=2),
+                     {"home": [self.bye_id], "admin": [self.help_id], "common": [self.hello_id]})
+
+  def test_write_bundles(self):
+    out_dir = self.path("out")
+    shards = bundles.shard_message_ids(self.catalog, self.src_dir)
+    translators = {"zz": pseudo_translation.PseudoTranslator(), "en": lambda msg: None}
+    manifest = bundles.write_bundles(out_dir, self.catalog, translators, shards)
+    with io.open(os.path.join(out_dir, "manifest.json"), "rt", encoding="utf-8") as f:
+      self.assertEqual(json.load(f), manifest)
+    with io.open(os.path.join(out_dir, *manifest["en"]["admin/help"].split("/")), "rb") as f:
+      data = f.read()
+    self.assertIn(bundles.content_hash(data), manifest["en"]["admin/help"])
+    self.assertEqual(json.loads(data.decode("utf-8")),
+                     {"locale": "en", "shard": "admin/help", "messages": {self.help_id: ["Help"]}})
+    self.assertNotEqual(manifest["zz"]["home"].split(".")[1], manifest["en"]["home"].split(".")[1])
+
+  def test_js_bundles(self):
+    data = bundles.encode_bundle("de", "home", {}, fmt="js", js_callback="load")
+    self.assertEqual(data, b'load({"locale":"de","shard":"home","messages":{}});\n')
+    with self.assertRaises(bundles.Error):
+      bundles.encode_bundle("de", "home", {}, fmt="xml")
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from tools import catalog
+from tools import extraction
+from tools import message
+
+from . import util
+
+
+def _extraction(filename, *bodies):
+  data = util.template(*bodies).replace("><", ">\n<").encode("utf-8")
+  (messages, occurrences) = extraction.extract_occurrences_from_html_bytes(data)
+  return extraction.FileExtraction(filename=filename, messages=messages, occurrences=occurrences,
+                                   elapsed=0, blob_sha=None, cached=False)
+
+
+_HELLO = '<p i18n="greeting">Hello</p>'
+_BYE = '<p i18n="farewell">Bye</p>'
+
+
+class CatalogTest(unittest.TestCase):
+  def setUp(self):
+    self.catalog = catalog.catalog_from_extractions([
+        _extraction("a.html", _HELLO, _BYE, _HELLO),
+        _extraction("b.html", _HELLO)])
+    (self.hello_id, self.bye_id) = list(self.catalog)
+
+  def test_messages_are_stored_once_with_every_occurrence(self):
+    self.assertEqual(len(self.catalog), 2)
+    self.assertEqual([(ref.source_file.filename, ref.line) for ref in self.catalog.sources(self.hello_id)],
+                     [("a.html", 3), ("a.html", 5), ("b.html", 3)])
+    self.assertEqual([source_file.filename for source_file in self.catalog.files], ["a.html", "b.html"])
+
+  def test_message_ids_by_file(self):
+    self.assertEqual(self.catalog.message_ids_in_file("a.html"), [self.hello_id, self.bye_id])
+    self.assertEqual(self.catalog.message_ids_in_file("b.html"), [self.hello_id])
+    self.assertEqual(self.catalog.message_ids_in_file("c.html"), [])
+    self.assertEqual(self.catalog.message_ids_by_file(),
+                     {"a.html": [self.hello_id, self.bye_id], "b.html": [self.hello_id]})
+
+  def test_remove_file_drops_messages_that_no_longer_occur(self):
+    self.assertEqual(self.catalog.remove_file("a.html"), [self.bye_id])
+    self.assertEqual(list(self.catalog), [self.hello_id])
+    self.assertEqual([ref.source_file.filename for ref in self.catalog.sources(self.hello_id)], ["b.html"])
+    self.assertEqual(self.catalog.remove_file("a.html"), [])
+
+  def test_conflicting_extraction_is_not_added(self):
+    conflicting = _extraction("c.html", '<p i18n="new">New</p>', _BYE)
+    new_msg = conflicting.messages.pop(next(iter(conflicting.messages)))
+    bye_msg = conflicting.messages.pop(self.bye_id)
+    # A message with the ID of greeting but different text.
+    conflicting.messages[new_msg.id] = new_msg
+    conflicting.messages[self.hello_id] = message.Message(
+        id=self.hello_id, meaning=bye_msg.meaning, comment=bye_msg.comment,
+        parts=bye_msg.parts, placeholders_by_name=bye_msg.placeholders_by_name)
+    with self.assertRaises(message.MessageIdConflictError):
+      self.catalog.add_extraction(conflicting)
+    self.assertEqual(list(self.catalog), [self.hello_id, self.bye_id])
+    self.assertIsNone(self.catalog.get_file("c.html"))
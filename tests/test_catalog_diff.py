@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import io
+
+from tools import binary_catalog
+from tools import catalog_diff
+from tools import message_printer
+
+from . import util
+
+
+_OLD = util.template(
+    '<p i18n="greeting|Shown on login">Hello {{user // i18n-ph(USER|Bob)}}</p>',
+    '<p i18n="farewell">See you soon</p>',
+    '<p i18n="help">Ask for help</p>',
+    '<p i18n="gone">Old text here</p>')
+
+_NEW = util.template(
+    '<p i18n="greeting|Shown on login">Hello {{user // i18n-ph(USER|Alice)}}</p>',
+    '<p i18n="farewell on logout">See you soon</p>',
+    '<p i18n="help">Ask for help</p>',
+    '<p i18n="new">A brand new message</p>')
+
+
+class CatalogDiffTest(util.TempDirTestCase):
+  def setUp(self):
+    super(CatalogDiffTest, self).setUp()
+    self.old_messages = util.parse_messages(_OLD)
+    self.new_messages = util.parse_messages(_NEW)
+    (self.greeting_id, self.farewell_id, self.help_id, self.gone_id) = list(self.old_messages)
+    self.new_id = list(self.new_messages)[3]
+
+  def write_binary(self, name, messages):
+    fname = self.path(name + ".cat")
+    binary_catalog.write_catalog(fname, messages)
+    return fname
+
+  def write_jsonl(self, name, messages):
+    fname = self.path(name + ".jsonl")
+    with io.open(fname, "wt", encoding="utf-8") as f:
+      with message_printer.JsonLinesPrinter(out=f) as printer:
+        for msg in messages.values():
+          printer.print_message(msg)
+    return fname
+
+  def diff(self, write, **kwargs):
+    old = catalog_diff.open_catalog_index(write("old", self.old_messages))
+    new = catalog_diff.open_catalog_index(write("new", self.new_messages))
+    self.addCleanup(old.close)
+    self.addCleanup(new.close)
+    summary = {}
+    return (list(catalog_diff.diff_catalogs(old, new, summary=summary, **kwargs)), summary)
+
+  def check_diff(self, write):
+    (entries, summary) = self.diff(write)
+    self.assertEqual(entries, [
+        catalog_diff.DiffEntry(catalog_diff.EXAMPLES_CHANGED, self.greeting_id, 1),
+        catalog_diff.DiffEntry(catalog_diff.COMMENT_CHANGED, self.farewell_id, 3),
+        catalog_diff.DiffEntry(catalog_diff.ADDED, self.new_id, 4),
+        catalog_diff.DiffEntry(catalog_diff.REMOVED, self.gone_id, 3)])
+    self.assertEqual(summary, {catalog_diff.ADDED: [1, 4], catalog_diff.REMOVED: [1, 3],
+                               catalog_diff.COMMENT_CHANGED: [1, 3], catalog_diff.EXAMPLES_CHANGED: [1, 1],
+                               catalog_diff.UNCHANGED: [1, 0]})
+
+  def test_binary_catalogs(self):
+    self.check_diff(self.write_binary)
+
+  def test_json_lines_catalogs(self):
+    self.check_diff(self.write_jsonl)
+
+  def test_unchanged_messages(self):
+    (entries, summary) = self.diff(self.write_binary, unchanged=True)
+    self.assertIn(catalog_diff.DiffEntry(catalog_diff.UNCHANGED, self.help_id, 3), entries)
+    self.assertEqual(summary[catalog_diff.UNCHANGED], [1, 3])
+    self.assertIn("workload                    3            8", catalog_diff.format_summary(summary))
+
+  def test_formats_must_match(self):
+    old = catalog_diff.open_catalog_index(self.write_binary("old", self.old_messages))
+    new = catalog_diff.open_catalog_index(self.write_jsonl("new", self.new_messages))
+    self.addCleanup(old.close)
+    self.addCleanup(new.close)
+    with self.assertRaises(catalog_diff.Error):
+      list(catalog_diff.diff_catalogs(old, new))
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import io
+
+from tools import catalog_formats
+from tools import pseudo_translation
+
+from . import util
+
+
+_HTML = util.template(
+    '<p i18n="greeting|the greeting">Hello <b>{{user}}</b>, <i>see <a href="/x">this</a></i></p>',
+    '<p i18n="count">{{n}} items</p>')
+
+
+class CatalogFormatsTest(util.TempDirTestCase):
+  def setUp(self):
+    super(CatalogFormatsTest, self).setUp()
+    self.messages = util.parse_messages(_HTML)
+    translator = pseudo_translation.PseudoTranslator()
+    self.translations = dict((message_id, translator(msg)) for (message_id, msg) in self.messages.items())
+
+  def assertTranslationsEqual(self, actual, expected):
+    self.assertEqual(list(actual), list(expected))
+    for (message_id, msg) in expected.items():
+      self.assertEqual(actual[message_id].unparse(), msg.unparse())
+
+  def test_xliff_round_trip(self):
+    fname = self.path("de.xlf")
+    catalog_formats.write_xliff(fname, self.messages.values(), target_language="de",
+                                translations=self.translations)
+    self.assertTranslationsEqual(catalog_formats.read_translations(fname, self.messages), self.translations)
+
+  def test_xliff_declares_the_namespace_once(self):
+    out = io.BytesIO()
+    catalog_formats.write_xliff(out, self.messages.values(), translations=self.translations)
+    self.assertEqual(out.getvalue().count(b"xmlns"), 1)
+
+  def test_xliff_units_without_target_are_skipped(self):
+    out = io.BytesIO()
+    catalog_formats.write_xliff(out, self.messages.values())
+    out.seek(0)
+    self.assertEqual(list(catalog_formats.read_xliff(out, self.messages)), [])
+
+  def test_xmb_round_trip(self):
+    out = io.BytesIO()
+    catalog_formats.write_xmb(out, self.messages.values())
+    out.seek(0)
+    self.assertTranslationsEqual(
+        dict((msg.id, msg) for msg in catalog_formats.read_xmb(out, self.messages)), self.messages)
+
+  def test_xtb_round_trip(self):
+    fname = self.path("de.xtb")
+    catalog_formats.write_xtb(fname, self.translations.values(), "de")
+    self.assertTranslationsEqual(catalog_formats.read_translations(fname, self.messages), self.translations)
+
+  def test_unknown_placeholders_are_reported(self):
+    message_id = next(iter(self.messages))
+    fname = self.write("bad.xtb", '<translationbundle><translation id="%s">Hi <ph name="NOPE"/></translation>'
+                       '</translationbundle>' % message_id)
+    with self.assertRaises(catalog_formats.Error):
+      catalog_formats.read_translations(fname, self.messages)
+    errors = []
+    translations = catalog_formats.read_translations(fname, self.messages,
+                                                     on_error=lambda *args: errors.append(args))
+    self.assertEqual(translations, {})
+    self.assertEqual([message_id for (message_id, e) in errors], [message_id])
+
+  def test_unknown_formats_are_rejected(self):
+    with self.assertRaises(catalog_formats.Error):
+      catalog_formats.read_translations(self.path("de.po"), self.messages)
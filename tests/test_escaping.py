@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import unittest
+
+import lxml.html
+
+from tools import escaping
+from tools import translation
+
+from . import util
+
+
+class EscapingTest(unittest.TestCase):
+  def test_escapers_match_the_old_cgi_escape(self):
+    text = 'a & b < c > d "e" \'f\''
+    self.assertEqual(escaping.escape(text, escaping.CONTEXT_RAW), text)
+    self.assertEqual(escaping.escape(text, escaping.CONTEXT_HTML), 'a &amp; b &lt; c &gt; d "e" \'f\'')
+    self.assertEqual(escaping.escape(text, escaping.CONTEXT_ATTRIBUTE_VALUE),
+                     "a &amp; b &lt; c &gt; d &quot;e&quot; 'f'")
+
+  def test_plain_text_is_returned_as_is(self):
+    text = "nothing to escape here"
+    self.assertIs(escaping.escape_html(text), text)
+    self.assertIs(escaping.escape_attribute_value(text), text)
+
+  def test_unknown_contexts_are_rejected(self):
+    with self.assertRaises(escaping.Error):
+      escaping.escaper(42)
+
+  def test_escape_message(self):
+    (msg,) = util.parse_messages(util.template('<p i18n="x">a &amp; "b" <b>c &lt; d</b> {{e}}</p>')).values()
+    self.assertEqual(escaping.escape_message(msg, escaping.CONTEXT_HTML), 'a &amp; "b" <b>c &lt; d</b> {{e}}')
+    self.assertEqual(escaping.escape_message(msg, escaping.CONTEXT_ATTRIBUTE_VALUE),
+                     'a &amp; &quot;b&quot; <b>c &lt; d</b> {{e}}')
+
+  def test_cache_escapes_once_per_context(self):
+    (msg,) = util.parse_messages(util.template('<p i18n="x">a &amp; b</p>')).values()
+    cache = escaping.EscapedMessageCache()
+    self.assertIsNone(cache.get(msg.id, escaping.CONTEXT_HTML))
+    self.assertEqual(cache.add(msg.id, msg, escaping.CONTEXT_HTML), "a &amp; b")
+    self.assertEqual(cache.get(msg.id, escaping.CONTEXT_HTML), "a &amp; b")
+    self.assertIsNone(cache.get(msg.id, escaping.CONTEXT_RAW))
+    self.assertEqual(len(cache), 1)
+
+  def test_rewritten_attributes_and_text_round_trip(self):
+    html = util.template('<p i18n="x">a &amp; b &lt;c&gt;</p>', '<input i18n-title="t" title="1 &amp; &quot;2&quot;">')
+    root = util.parse_html(html)
+    translation.translate_document(root, lambda msg: msg)
+    self.assertEqual(root.find(".//p").text, "a & b <c>")
+    self.assertEqual(root.find(".//input").get("title"), '1 & "2"')
+    reparsed = lxml.html.document_fromstring(lxml.html.tostring(root))
+    self.assertEqual(reparsed.find(".//input").get("title"), '1 & "2"')
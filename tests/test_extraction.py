@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import unittest
+from unittest import mock
+
+from tools import extraction
+from tools import extraction_cache
+
+from . import util
+
+
+class ExtractFilesTest(util.TempDirTestCase):
+  def setUp(self):
+    super(ExtractFilesTest, self).setUp()
+    self.fnames = [
+        self.write("a.html", util.template('<p i18n="greeting">Hello {{user}}</p>')),
+        self.write("sub/b.html", util.template('<p i18n="farewell">Goodbye</p>',
+                                               '<input i18n-title="tooltip" title="Name">')),
+        self.write("sub/c.html", util.template('<p i18n="greeting">Hello {{user}}</p>')),
+        self.write("sub/skipped.txt", "not a template"),
+    ]
+
+  def test_find_template_files_walks_directories(self):
+    self.assertEqual(extraction.find_template_files([self.tmp_dir]),
+                     sorted([self.path("a.html"), self.path("sub", "b.html"), self.path("sub", "c.html")]))
+
+  def test_parallel_extraction_matches_serial_extraction(self):
+    fnames = extraction.find_template_files([self.tmp_dir])
+    serial = list(extraction.extract_files(fnames, jobs=1))
+    parallel = list(extraction.extract_files(fnames, jobs=2))
+    self.assertEqual([e.filename for e in parallel], fnames)
+    self.assertEqual([list(e.messages) for e in parallel], [list(e.messages) for e in serial])
+    catalog = extraction.merge_extractions(parallel)
+    self.assertEqual(len(catalog), 3)
+
+
+class ExtractionCacheTest(util.TempDirTestCase):
+  def setUp(self):
+    super(ExtractionCacheTest, self).setUp()
+    self.fnames = [self.write("a.html", util.template('<p i18n="greeting">Hello {{user}}</p>')),
+                   self.write("b.html", util.template('<p i18n="farewell">Goodbye</p>'))]
+    self.cache = extraction_cache.ExtractionCache(self.path("cache"))
+
+  def test_blob_sha_matches_git(self):
+    # "printf 'hello\n' | git hash-object --stdin"
+    self.assertEqual(extraction_cache.blob_sha(b"hello\n"), "ce013625030ba8dba906f756967f9e9ca394464a")
+
+  def test_second_run_is_served_from_the_cache(self):
+    first = list(extraction.extract_files(self.fnames, jobs=1, cache=self.cache))
+    self.assertEqual([e.cached for e in first], [False, False])
+    self.write("b.html", util.template('<p i18n="farewell">Goodbye!</p>'))
+    second = list(extraction.extract_files(self.fnames, jobs=1, cache=self.cache))
+    self.assertEqual([e.cached for e in second], [True, False])
+    self.assertEqual(list(second[0].messages), list(first[0].messages))
+    self.assertNotEqual(list(second[1].messages), list(first[1].messages))
+
+  def test_cache_misses_read_each_file_once(self):
+    with mock.patch.object(extraction, "_read_file", wraps=extraction._read_file) as read_file:
+      list(extraction.extract_files(self.fnames, jobs=1, cache=self.cache))
+    self.assertEqual(sorted(call[0][0] for call in read_file.call_args_list), sorted(self.fnames))
+
+  def test_failed_put_leaves_no_temporary_file(self):
+    for error in (OSError("disk full"), KeyboardInterrupt()):
+      with mock.patch.object(extraction_cache.pickle, "dump", side_effect=error):
+        with self.assertRaises(type(error)):
+          self.cache.put("ab" * 20, ("messages", "occurrences"))
+    # Unpicklable values raise AttributeError or TypeError rather than
+    # PicklingError.
+    with self.assertRaises((AttributeError, TypeError, extraction_cache.pickle.PicklingError)):
+      self.cache.put("cd" * 20, lambda: None)
+    leftovers = [fname for (dirpath, dirnames, fnames) in os.walk(self.path("cache")) for fname in fnames]
+    self.assertEqual(leftovers, [])
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from tools import extraction
+from tools import fingerprint
+
+from . import util
+
+
+# IDs computed by the code before the fingerprint schemes were introduced.
+# Version 1 must keep producing them.
+_DEMO_IDS = [
+    "b4b7373f1d3da5029ff6961136a38197",
+    "898ec4bc998ecc818ea43a03128f7841",
+    "bfdd122998670e26ac5b5ebf9cd5a228",
+    "904bcbbdbc34d586e1115eb7e722e314",
+    "44c908fab77d1ba37deb307cb5695188",
+    "c33a28cd55317721c85bb04699b21a96",
+]
+
+_HTML = util.template(
+    '<p i18n="greeting|the greeting">Hello <b>{{user}}</b>, <i>see <a href="/x">this</a></i></p>',
+    '<p i18n="m|c">{{a}} and {{b}} <span>{{name}}</span></p>')
+_IDS = ["3c707dc4633d8c7de46389d63ce05730", "243eeab08142afcd17f59ea897d5cd0f"]
+
+
+class FingerprintTest(util.TempDirTestCase):
+  def test_version_1_ids_are_unchanged(self):
+    self.assertEqual(fingerprint.DEFAULT_VERSION, 1)
+    self.assertEqual(list(extraction.extract_messages_from_html_file(util.DEMO_HTML)), _DEMO_IDS)
+    self.assertEqual(list(util.parse_messages(_HTML)), _IDS)
+
+  def test_comments_do_not_change_the_id(self):
+    self.assertEqual(list(util.parse_messages(_HTML.replace("the greeting", "another comment"))), _IDS)
+    self.assertNotEqual(list(util.parse_messages(_HTML.replace("greeting|", "salutation|"))), _IDS)
+
+  def test_version_2_ids(self):
+    fingerprint.set_default_version(2)
+    ids = list(util.parse_messages(_HTML))
+    self.assertEqual(len(set(ids) | set(_IDS)), 4)
+    self.assertTrue(all(len(message_id) == 32 for message_id in ids))
+
+  def test_recompute_ids_migrates_between_versions(self):
+    messages = util.parse_messages(_HTML)
+    to_v2 = fingerprint.recompute_ids(messages.values(), version=2)
+    self.assertEqual(list(to_v2), _IDS)
+    fingerprint.set_default_version(2)
+    self.assertEqual(list(to_v2.values()), list(util.parse_messages(_HTML)))
+    migrated = [msg for (old_id, msg) in fingerprint.iter_recomputed(messages.values(), version=2)]
+    self.assertEqual(list(fingerprint.recompute_ids(migrated, version=1).values()), _IDS)
+
+  def test_batches_match_single_messages(self):
+    messages = list(util.parse_messages(_HTML).values())
+    with open(util.DEMO_HTML, encoding="utf-8") as f:
+      messages += list(util.parse_messages(f.read()).values())
+    for scheme in fingerprint.SCHEMES.values():
+      # The same serializer hashes every message of the batch.
+      self.assertEqual([new_id for (msg, new_id) in scheme.iter_ids(messages)],
+                       [scheme.compute_id(msg.meaning, msg.parts) for msg in messages])
+
+  def test_unknown_versions_are_rejected(self):
+    with self.assertRaises(fingerprint.Error):
+      fingerprint.set_default_version(99)
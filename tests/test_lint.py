@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import subprocess
+import unittest
+
+from tools import extraction_cache
+from tools import lint
+
+from . import util
+
+
+def _lint(*lines, **kwargs):
+  html = "<html><body>\n%s\n</body></html>" % "\n".join(lines)
+  return [(line, rule, description) for (line, rule, severity, description)
+          in lint.Linter(**kwargs).lint_html_bytes(html.encode("utf-8"))]
+
+
+class LinterTest(unittest.TestCase):
+  def test_clean_template(self):
+    self.assertEqual(_lint('<p i18n="greeting">Hello {{user}}</p>'), [])
+
+  def test_rules(self):
+    self.assertEqual(_lint('<p i18n="a">{{ x // i18n-ph(lower) }}</p>',
+                           '<input i18n-title="tip">',
+                           '<p i18n="">Hi</p>',
+                           '<p i18n="x">   </p>',
+                           '<p i18n="first">Same</p>',
+                           '<p i18n="second">Same</p>',
+                           '<p i18n="e">Empty {{ }}</p>'),
+                     [(2, "invalid-message", "invalid placeholder name: 'lower': It may only be composed "
+                                            "of capital letters, digits and underscores."),
+                      (3, "missing-attribute", "i18n-title without a title attribute on <input>"),
+                      (4, "missing-comment", "message has no description for the translators"),
+                      (5, "empty-message", "message is empty"),
+                      (7, "comment-conflict", "the same message is described as 'first'"),
+                      (8, "ng-expression", "empty {{ }}")])
+
+  def test_disabled_rules(self):
+    self.assertEqual(_lint('<p i18n="">Hi</p>', rules=["empty-message"]), [])
+    with self.assertRaises(lint.Error):
+      lint.Linter(["no-such-rule"])
+
+  def test_custom_rules(self):
+    @lint.rule("test-no-todo", lint.WARNING, "TODO in a message")
+    def check_no_todo(msg, node, attr):
+      if "TODO" in msg.unparse():
+        yield "message contains a TODO"
+    self.addCleanup(lint.RULES.pop, "test-no-todo")
+    self.assertEqual(_lint('<p i18n="x">TODO</p>'), [(2, "test-no-todo", "message contains a TODO")])
+    with self.assertRaises(lint.Error):
+      lint.add_rule("test-no-todo", lint.WARNING, "again")
+
+
+class LintFilesTest(util.TempDirTestCase):
+  def setUp(self):
+    super(LintFilesTest, self).setUp()
+    self.linter = lint.Linter()
+    self.cache = lint.LintCache(self.path("cache"), self.linter)
+    self.good = self.write("good.html", util.template('<p i18n="greeting">Hello</p>'))
+    self.bad = self.write("bad.html", util.template('<p i18n="">Hello</p>'))
+
+  def lint_files(self, changed, committed_shas):
+    stats = {}
+    diagnostics = list(lint.lint_files([self.good, self.bad], self.linter, cache=self.cache, changed=changed,
+                                       committed_shas=committed_shas, stats=stats))
+    return ([(os.path.basename(d.filename), d.rule) for d in diagnostics], stats)
+
+  def committed_shas(self):
+    shas = {}
+    for fname in (self.good, self.bad):
+      with open(fname, "rb") as f:
+        shas[lint._normpath(fname)] = extraction_cache.blob_sha(f.read())
+    return shas
+
+  def test_unchanged_files_missing_from_the_cache_are_linted(self):
+    (diagnostics, stats) = self.lint_files(set(), self.committed_shas())
+    self.assertEqual(diagnostics, [("bad.html", "missing-comment")])
+    self.assertEqual(stats, {"linted": 2, "cached": 0})
+    # Now they come from the cache without being read.
+    (diagnostics, stats) = self.lint_files(set(), self.committed_shas())
+    self.assertEqual(diagnostics, [("bad.html", "missing-comment")])
+    self.assertEqual(stats, {"linted": 0, "cached": 2})
+
+  def test_changed_files_are_linted(self):
+    self.lint_files(set(), self.committed_shas())
+    shas = self.committed_shas()
+    self.write("bad.html", util.template('<p i18n="">Hello again</p>'))
+    (diagnostics, stats) = self.lint_files(set([lint._normpath(self.bad)]), shas)
+    self.assertEqual(diagnostics, [("bad.html", "missing-comment")])
+    self.assertEqual(stats, {"linted": 1, "cached": 1})
+
+  def test_unreadable_files(self):
+    os.unlink(self.good)
+    (diagnostics, stats) = self.lint_files(None, None)
+    self.assertEqual(diagnostics, [("good.html", "parse-error"), ("bad.html", "missing-comment")])
+
+
+@unittest.skipUnless(shutil.which("git"), "git is not installed")
+class GitTest(util.TempDirTestCase):
+  def git(self, *args):
+    subprocess.check_call(("git", "-c", "user.name=test", "-c", "user.email=test@example.com") + args,
+                          cwd=self.tmp_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+  def test_changed_files_and_committed_shas(self):
+    self.write("a.html", "a")
+    self.write("b.html", "b")
+    self.git("init", "-q")
+    self.git("add", "a.html", "b.html")
+    self.git("commit", "-q", "-m", "initial")
+    self.write("b.html", "b2")
+    self.write("c.html", "c")
+    self.addCleanup(os.chdir, os.getcwd())
+    os.chdir(self.tmp_dir)
+    self.assertEqual(lint.changed_files(), set(["b.html", "c.html"]))
+    self.assertEqual(lint.committed_blob_shas(), {"a.html": extraction_cache.blob_sha(b"a"),
+                                                  "b.html": extraction_cache.blob_sha(b"b")})
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import pickle
+import random
+import unittest
+
+from tools import corpus
+from tools import extraction
+from tools import message
+
+from . import util
+
+
+class IterMessagesTest(util.TempDirTestCase):
+  def test_yields_the_messages_of_parse_messages_in_document_order(self):
+    html = util.template('<div><p i18n="outer">Hello <b>{{user}}</b></p></div>',
+                         '<input i18n-title="tooltip" title="Your name">',
+                         '<p i18n="outer">Hello <b>{{user}}</b></p>',
+                         '<p i18n="last">Goodbye</p>')
+    fname = self.write("page.html", html)
+    streamed = list(extraction.iter_messages_from_html_file(fname))
+    parsed = util.parse_messages(html)
+    self.assertEqual(sorted(msg.id for msg in streamed), sorted(parsed))
+    self.assertEqual([msg.unparse() for msg in streamed],
+                     ["Hello <b>{{user}}</b>", "Your name", "Goodbye"])
+
+  def test_demo_document(self):
+    streamed = list(extraction.iter_messages_from_html_file(util.DEMO_HTML))
+    parsed = extraction.extract_messages_from_html_file(util.DEMO_HTML)
+    self.assertEqual(sorted(msg.id for msg in streamed), sorted(parsed))
+
+
+class SlotsTest(unittest.TestCase):
+  def test_messages_have_no_instance_dict(self):
+    msg = util.build_message(util.parse_html(util.template(
+        '<p>Hello <b>{{user}}</b></p>')).find(".//p"))
+    objects = [msg, msg.parts[1], msg.parts[1].parts[0], msg.parts[1].ph_begin]
+    for obj in objects:
+      self.assertFalse(hasattr(obj, "__dict__"), type(obj).__name__)
+
+  def test_messages_survive_pickling(self):
+    # The extraction cache and the worker processes pickle messages.
+    messages = util.parse_messages(util.template('<p i18n="greeting">Hello <b>{{user}}</b></p>'))
+    unpickled = pickle.loads(pickle.dumps(messages))
+    self.assertEqual(list(unpickled), list(messages))
+    for (message_id, msg) in messages.items():
+      self.assertEqual(unpickled[message_id].unparse(), msg.unparse())
+      self.assertEqual(unpickled[message_id].comment, msg.comment)
+      self.assertEqual(sorted(unpickled[message_id].placeholders_by_name), sorted(msg.placeholders_by_name))
+
+
+def _placeholders(html):
+  (msg,) = util.parse_messages(util.template(html)).values()
+  return msg.placeholders_by_name
+
+
+class PlaceholderRegistryTest(unittest.TestCase):
+  def test_made_up_names_do_not_clash_with_explicit_names(self):
+    self.assertEqual(list(_placeholders('<p i18n="x">{{b}} {{a // i18n-ph(EXPRESSION)}} {{c}}</p>')),
+                     ["EXPRESSION_1", "EXPRESSION", "EXPRESSION_2"])
+
+  def test_tag_names(self):
+    self.assertEqual(list(_placeholders('<p i18n="x"><a href="/">x</a> <b>y</b> <b class="k">z</b></p>')),
+                     ["LINK_BEGIN", "LINK_END", "B_BEGIN", "B_END", "B_BEGIN_1", "B_END_1"])
+
+  def test_repeated_placeholders_share_the_name_and_merge_examples(self):
+    placeholders = _placeholders('<p i18n="x">{{a // i18n-ph(NAME|Bob)}} and {{a // i18n-ph(NAME|Alice)}} '
+                                 '{{a}} {{a // i18n-ph(NAME|Bob)}}</p>')
+    self.assertEqual(list(placeholders), ["NAME"])
+    self.assertEqual(placeholders["NAME"].examples, ["Bob", "Alice"])
+
+  def test_examples_are_capped(self):
+    html = " ".join("{{a // i18n-ph(NAME|e%d)}}" % i for i in range(message.MAX_PLACEHOLDER_EXAMPLES + 2))
+    self.assertEqual(_placeholders('<p i18n="x">%s</p>' % html)["NAME"].examples,
+                     ["e%d" % i for i in range(message.MAX_PLACEHOLDER_EXAMPLES)])
+
+  def test_different_names_for_the_same_placeholder_are_rejected(self):
+    with self.assertRaises(message.Error):
+      _placeholders('<p i18n="x">{{a // i18n-ph(NAME)}} {{a // i18n-ph(OTHER)}}</p>')
+
+
+class _RecordingOnParse(message.OnParseBase):
+  def __init__(self):
+    self.calls = []
+
+  def on_node(self, message, node):
+    self.calls.append(("node", message.id))
+
+  def on_attrib(self, message, node, attr):
+    self.calls.append((attr, message.id))
+
+
+class DiscoveryTest(unittest.TestCase):
+  def assertSameDiscovery(self, html):
+    results = []
+    for discovery in message.DISCOVERY_MODES:
+      on_parse = _RecordingOnParse()
+      messages = message.parse_messages(util.parse_html(html), on_parse=on_parse, discovery=discovery)
+      results.append((list(messages), on_parse.calls))
+    self.assertEqual(results[0], results[1])
+    return results[0]
+
+  def test_modes_find_the_same_messages_in_the_same_order(self):
+    (ids, calls) = self.assertSameDiscovery(util.template(
+        '<div><div><p i18n="deep">Deep</p></div><input i18n-title="tip" title="Tip"></div>',
+        '<p i18n="outer">Outer <span i18n-title="inner" title="Inner">x</span></p>',
+        '<p i18n="shallow">Shallow</p>'))
+    self.assertEqual([kind for (kind, message_id) in calls], ["node", "node", "title", "node"])
+    self.assertEqual(len(ids), 4)
+
+  def test_synthetic_pages(self):
+    for seed in range(3):
+      self.assertSameDiscovery(corpus.synthetic_document(random.Random(seed), i18n_density=0.3))
+
+  def test_unknown_modes_are_rejected(self):
+    with self.assertRaises(message.Error):
+      message.parse_messages(util.parse_html(util.template("")), discovery="css")
+
+
+class MessageSlotsTest(unittest.TestCase):
+  def test_tag_pairs_are_flattened(self):
+    (msg,) = util.parse_messages(util.template(
+        '<p i18n="x">Hello <b>{{user}}</b>, see <a href="/">here</a></p>')).values()
+    self.assertEqual(message.message_slots(msg),
+                     ["Hello ", ["B_BEGIN"], ["EXPRESSION"], ["B_END"], ", see ", ["LINK_BEGIN"], "here",
+                      ["LINK_END"]])
+
+
+def _warnings(text):
+  warnings = []
+  list(message.lex_ng_expressions(text, on_warning=warnings.append))
+  return [(warning.offset, warning.message) for warning in warnings]
+
+
+class _WarningRecorder(message.OnParseBase):
+  def __init__(self):
+    self.warnings = []
+
+  def on_warning(self, warning, node):
+    self.warnings.append((warning.message, node.tag))
+
+
+class NgExpressionLexerTest(unittest.TestCase):
+  def test_tokens(self):
+    self.assertEqual(list(message.lex_ng_expressions("Hi {{ user.name }}, {{n // i18n-ph(COUNT|3)}} left")),
+                     [message.NgTextToken(0, "Hi "),
+                      message.NgExprToken(3, "user.name", None, None),
+                      message.NgTextToken(18, ", "),
+                      message.NgExprToken(20, "n", "COUNT", "3"),
+                      message.NgTextToken(45, " left")])
+
+  def test_expressions_do_not_span_lines(self):
+    self.assertEqual([token.text for token in message.lex_ng_expressions("{{a\nb}} {{\n c \n}}")],
+                     ["{{a\nb}} ", "c"])
+
+  def test_empty_expression(self):
+    self.assertEqual(_warnings("a {{ }} b"), [(2, "empty {{ }}")])
+    self.assertEqual([token.text for token in message.lex_ng_expressions("a {{}} b", lambda w: None)],
+                     ["a ", " b"])
+
+  def test_nested_expression(self):
+    self.assertEqual(_warnings('x {{ foo + "{{x}}" }}'), [(2, "nested {{ in an expression")])
+    self.assertEqual(list(message.lex_ng_expressions('x {{ foo + "{{x}}" }} y', lambda w: None)),
+                     [message.NgTextToken(0, "x "),
+                      message.NgExprToken(2, 'foo + "{{x}}"', None, None),
+                      message.NgTextToken(21, " y")])
+
+  def test_braces_and_strings_in_expressions(self):
+    def texts(text):
+      return [token.text for token in message.lex_ng_expressions(text, lambda w: None)]
+    self.assertEqual(texts("{{ {a: {b: 1}} }}!"), ["{a: {b: 1}}", "!"])
+    self.assertEqual(texts("{{ {a: 1}.a}}}"), ["{a: 1}.a", "}"])
+    self.assertEqual(texts("{{ x | date:'}}' }} {{ 'it\\'s }}' }}"), ["x | date:'}}'", " ", "'it\\'s }}'"])
+    self.assertEqual(list(message.lex_ng_expressions("{{ f('}}') // i18n-ph(F|it's) }}")),
+                     [message.NgExprToken(0, "f('}}')", "F", "it's")])
+    # Unbalanced braces and stray quotes fall back to the first "}}".
+    self.assertEqual(texts("{{ a } b {{ c }}"), ["a } b {{ c"])
+    self.assertEqual(texts("{{ { }} b"), ["{", " b"])
+    self.assertEqual(texts("{{ it's }} {{ b }}"), ["it's", " ", "b"])
+
+  def test_spaces_in_i18n_ph(self):
+    self.assertEqual(_warnings("{{ a // i18n-ph(NAME | Bob) }}"),
+                     [(0, "space before or after the | in i18n-ph()")])
+    self.assertEqual(_warnings("{{ a // i18n-ph( NAME|Bob) }}"),
+                     [(0, "i18n-ph() begins or ends with a space")])
+    self.assertEqual(_warnings("{{ a // i18n-ph(NAME|Bob) }}"), [])
+
+  def test_invalid_i18n_ph(self):
+    with self.assertRaises(message.Error):
+      list(message.lex_ng_expressions("{{ a // NAME }}"))
+    with self.assertRaises(message.Error):
+      list(message.lex_ng_expressions("{{ a // i18n-ph(name) }}"))
+
+  def test_parse_messages_reports_warnings_with_the_element(self):
+    recorder = _WarningRecorder()
+    message.parse_messages(util.parse_html(util.template(
+        '<p i18n="x">Hi {{ }}</p>', '<input i18n-title="t" title="{{ a // i18n-ph(A |b) }}">')),
+        on_parse=recorder)
+    self.assertEqual(sorted(recorder.warnings),
+                     [("empty {{ }}", "p"), ("space before or after the | in i18n-ph()", "input")])
+
+
+if __name__ == "__main__":
+  unittest.main()
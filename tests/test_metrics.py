@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import sys
+import threading
+import unittest
+
+from tools import metrics
+from tools import pseudo_translation
+from tools import translation
+
+from . import util
+
+
+_HTML = util.template('<p i18n="greeting">Hello <b>{{user}}</b></p>', '<input i18n-title="tooltip" title="Name">')
+
+
+class MetricsTest(unittest.TestCase):
+  def test_disabled_by_default(self):
+    self.assertIs(metrics.active(), metrics.NULL_METRICS)
+    util.parse_messages(_HTML)
+
+  def test_collects_phases_and_counters(self):
+    with metrics.collecting(metrics.Metrics()) as collected:
+      self.assertIs(metrics.active(), collected)
+      translation.translate_document(util.parse_html(_HTML), pseudo_translation.PseudoTranslator())
+    self.assertIs(metrics.active(), metrics.NULL_METRICS)
+    result = collected.to_dict()
+    for phase in ("parse_messages", "fingerprint", "rewrite"):
+      self.assertIn(phase, result["phases"])
+      self.assertGreater(result["phases"][phase]["calls"], 0)
+    self.assertEqual(result["counters"]["messages"], 2)
+    self.assertEqual(result["counters"]["rewritten_nodes"], 1)
+    self.assertEqual(result["counters"]["rewritten_attribs"], 1)
+
+  def test_prometheus_exposition(self):
+    collected = metrics.Metrics()
+    with collected.phase("rewrite"):
+      collected.count("messages", 3)
+    text = collected.to_prometheus()
+    self.assertIn('ng_i18n_phase_calls_total{phase="rewrite"} 1\n', text)
+    self.assertIn("ng_i18n_messages_total 3\n", text)
+
+  def test_concurrent_updates_are_not_lost(self):
+    collected = metrics.Metrics()
+    def work():
+      for i in range(2000):
+        with collected.phase("rewrite"):
+          collected.count("messages")
+    self.addCleanup(sys.setswitchinterval, sys.getswitchinterval())
+    sys.setswitchinterval(1e-6)
+    threads = [threading.Thread(target=work) for i in range(8)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    result = collected.to_dict()
+    self.assertEqual(result["phases"]["rewrite"]["calls"], 16000)
+    self.assertEqual(result["counters"]["messages"], 16000)
+
+  def test_memory_tracing(self):
+    with metrics.collecting(metrics.Metrics(trace_memory=True, top_allocations=3)) as collected:
+      util.parse_messages(_HTML)
+    memory = collected.to_dict()["memory"]
+    self.assertGreater(memory["peak_bytes"], 0)
+    self.assertLessEqual(len(memory["top_allocations"]), 3)
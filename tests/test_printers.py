@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import gc
+import io
+import json
+import unittest
+
+from tools import message_printer
+from tools import term_printer
+
+from . import util
+
+
+class TermPrinterTest(unittest.TestCase):
+  def test_output_is_buffered_until_flushed(self):
+    out = io.StringIO()
+    printer = term_printer.TermPrinter(out=out)
+    printer.print("title")
+    with printer.indent():
+      printer.write("a\nb")
+    printer.print()
+    self.assertEqual(out.getvalue(), "")
+    printer.flush()
+    self.assertEqual(out.getvalue(), "title\n  a\n  b\n")
+
+  def test_small_buffers_write_through(self):
+    out = io.StringIO()
+    printer = term_printer.TermPrinter(out=out, buffer_size=1)
+    printer.print("x")
+    self.assertEqual(out.getvalue(), "x\n")
+
+  def test_context_manager_flushes(self):
+    out = io.StringIO()
+    with term_printer.TermPrinter(out=out) as printer:
+      printer.print("x")
+    self.assertEqual(out.getvalue(), "x\n")
+
+  def test_unflushed_output_is_written_when_the_printer_goes_away(self):
+    out = io.StringIO()
+    printer = term_printer.TermPrinter(out=out)
+    printer.print("x")
+    del printer
+    gc.collect()
+    self.assertEqual(out.getvalue(), "x\n")
+
+
+class JsonLinesPrinterTest(unittest.TestCase):
+  def test_a_line_per_message(self):
+    messages = util.parse_messages(util.template('<p i18n="a">Hello {{user}}</p>', '<p i18n="b">Bye</p>'))
+    out = io.StringIO()
+    with message_printer.JsonLinesPrinter(out=out) as printer:
+      for msg in messages.values():
+        printer.print_message(msg)
+    lines = [json.loads(line) for line in out.getvalue().splitlines()]
+    self.assertEqual([line["id"] for line in lines], list(messages))
+    self.assertEqual(lines[0]["parts"], ["Hello ", ["EXPRESSION"]])
+    self.assertEqual(lines[0]["placeholders"][0]["text"], "user")
+
+  def test_unflushed_lines_are_written_when_the_printer_goes_away(self):
+    out = io.StringIO()
+    printer = message_printer.JsonLinesPrinter(out=out)
+    printer.print_message(next(iter(util.parse_messages(util.template('<p i18n="b">Bye</p>')).values())))
+    del printer
+    gc.collect()
+    self.assertEqual(len(out.getvalue().splitlines()), 1)
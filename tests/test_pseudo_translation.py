@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from tools import pseudo_translation
+
+from . import util
+
+
+def _message(html):
+  (msg,) = util.parse_messages(util.template(html)).values()
+  return msg
+
+
+class PseudoTranslatorTest(unittest.TestCase):
+  def setUp(self):
+    self.msg = _message('<p i18n="greeting">Hello <b>{{user}}</b></p>')
+
+  def test_default_output(self):
+    self.assertEqual(pseudo_translation.pseudo_translate(self.msg).unparse(),
+                     "Hello H\u0308e\u0308l\u0308l\u0308o\u0308 <b>{{user}}</b>")
+
+  def test_source_message_is_not_modified(self):
+    before = self.msg.unparse()
+    translated = pseudo_translation.PseudoTranslator(brackets=True, expansion=1)(self.msg)
+    self.assertEqual(self.msg.unparse(), before)
+    self.assertIsNot(translated.parts, self.msg.parts)
+    self.assertIsNot(translated.parts[1], self.msg.parts[1])
+    self.assertEqual(translated.id, self.msg.id)
+
+  def test_strategies(self):
+    msg = _message('<p i18n="x">Hi <b>there</b></p>')
+    def translate(**kwargs):
+      return pseudo_translation.PseudoTranslator(**kwargs)(msg).unparse()
+    self.assertEqual(translate(accents=False, keep_source_words=False), "Hi <b>there</b>")
+    self.assertEqual(translate(accents=False, keep_source_words=False, expansion=0.5), "Hi~ <b>there~~</b>")
+    self.assertEqual(translate(accents=False, keep_source_words=False, brackets=True), "⟦Hi <b>there</b>⟧")
+    self.assertEqual(translate(accents=False, keep_source_words=False, bidi=True),
+                     "\u202eHi\u202c <b>\u202ethere\u202c</b>")
+    with self.assertRaises(pseudo_translation.Error):
+      pseudo_translation.PseudoTranslator(expansion=-1)
+
+  def test_brackets_around_placeholders(self):
+    msg = _message('<p i18n="x">{{a}}</p>')
+    self.assertEqual(pseudo_translation.PseudoTranslator(brackets=True)(msg).unparse(), "⟦{{a}}⟧")
+
+  def test_text_is_memoized(self):
+    translator = pseudo_translation.PseudoTranslator()
+    translator(self.msg)
+    translator(self.msg)
+    self.assertEqual(translator.translate_text.cache_info().hits, 1)
+
+  def test_memos_are_bounded(self):
+    translator = pseudo_translation.PseudoTranslator()
+    translator.translate_text("one two one")
+    self.assertEqual(translator.translate_word.cache_info().hits, 1)
+    self.assertIsNotNone(translator.translate_word.cache_info().maxsize)
+    self.assertIsNotNone(translator.translate_text.cache_info().maxsize)
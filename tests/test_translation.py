@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import io
+import unittest
+
+import lxml.html
+
+from tools import message
+from tools import pseudo_translation
+from tools import translation
+
+from . import util
+
+
+def _to_html(root):
+  return lxml.html.tostring(root, method="html", encoding="unicode")
+
+
+class TranslateDocumentTest(unittest.TestCase):
+  def test_pseudo_translation_of_the_demo_matches_the_checked_in_output(self):
+    (translated_html, result) = translation.translate_html_file(
+        util.DEMO_HTML, pseudo_translation.PseudoTranslator())
+    with io.open(util.DEMO_HTML.replace("index.html", "index-zz.html"), "rt", encoding="utf-8") as f:
+      self.assertEqual(translated_html, f.read())
+    self.assertEqual(len(result.messages), 6)
+    self.assertEqual(result.missing_ids, set())
+
+  def test_rewrites_nodes_and_attributes_in_a_single_pass(self):
+    root = util.parse_html(util.template('<p i18n="greeting">Hello <b>{{user}}</b></p>',
+                                         '<input i18n-title="tooltip" title="Name">'))
+    result = translation.translate_document(root, pseudo_translation.PseudoTranslator(keep_source_words=False))
+    self.assertEqual(len(result.messages), 2)
+    html = _to_html(root)
+    self.assertIn('<p>Ḧël̈l̈ö <b>{{user}}</b></p>', html)
+    self.assertIn('title="N̈äm̈ë"', html)
+    self.assertNotIn("i18n", html)
+
+  def test_missing_translations_are_collected(self):
+    root = util.parse_html(util.template('<p i18n="greeting">Hello</p>', '<p i18n="farewell">Bye</p>'))
+    result = translation.translate_document(root, lambda msg: None)
+    self.assertEqual(result.missing_ids, set(result.messages))
+    self.assertIn("<p>Hello</p>", _to_html(root))
+
+
+class FragmentCacheTest(unittest.TestCase):
+  def test_repeated_messages_are_translated_and_parsed_once(self):
+    translator = pseudo_translation.PseudoTranslator()
+    calls = []
+    def counting_translator(msg):
+      calls.append(msg.id)
+      return translator(msg)
+    fragment_cache = translation.FragmentCache()
+    for i in range(2):
+      root = util.parse_html(util.template('<p i18n="greeting">Hello <b>{{user}}</b></p>' * 3))
+      translation.translate_document(root, counting_translator, fragment_cache)
+      self.assertEqual(_to_html(root).count("<b>{{user}}</b>"), 3)
+    self.assertEqual(len(calls), 1)
+    self.assertEqual(len(fragment_cache), 1)
+
+  def test_fragments_are_copied_into_each_node(self):
+    root = util.parse_html(util.template('<p i18n="greeting">Hello <b>{{user}}</b></p>' * 2))
+    translation.translate_document(root, pseudo_translation.PseudoTranslator())
+    (first, second) = root.iter("b")
+    self.assertIsNot(first, second)
+
+
+class RenderLocalesTest(util.TempDirTestCase):
+  def test_every_locale_matches_a_separate_translation(self):
+    translators = {"zz": pseudo_translation.PseudoTranslator(),
+                   "xx": pseudo_translation.PseudoTranslator(brackets=True)}
+    analyzed = translation.AnalyzedDocument.from_file(util.DEMO_HTML)
+    results = translation.render_locales(analyzed, translators, self.path("{locale}", "index.html"), jobs=2)
+    self.assertEqual(sorted(results), ["xx", "zz"])
+    for (locale, translator) in translators.items():
+      (expected_html, result) = translation.translate_html_file(util.DEMO_HTML, translator)
+      with io.open(self.path(locale, "index.html"), "rt", encoding="utf-8") as f:
+        self.assertEqual(f.read(), expected_html)
+    # The analyzed document is not modified by rendering.
+    self.assertIn('i18n=', _to_html(analyzed.root))
+
+  def test_merge_analyzed_messages(self):
+    first = translation.AnalyzedDocument(util.parse_html(util.template('<p i18n="a">Hello</p>')))
+    second = translation.AnalyzedDocument(util.parse_html(util.template(
+        '<p i18n="a">Hello</p>', '<p i18n="b">Bye</p>')))
+    merged = translation.merge_analyzed_messages({"first.html": first, "second.html": second})
+    self.assertEqual(list(merged), list(second.messages))
+    (hello_id, bye_id) = list(second.messages)
+    bye = second.messages.pop(bye_id)
+    second.messages[hello_id] = message.Message(id=hello_id, meaning=bye.meaning, comment=bye.comment,
+                                                parts=bye.parts, placeholders_by_name=bye.placeholders_by_name)
+    with self.assertRaisesRegex(message.MessageIdConflictError, "second.html"):
+      translation.merge_analyzed_messages({"first.html": first, "second.html": second})
+
+
+if __name__ == "__main__":
+  unittest.main()
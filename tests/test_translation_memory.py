@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import random
+import unittest
+from unittest import mock
+
+from tools import message
+from tools import translation_memory
+
+from . import util
+
+
+def _slots(html):
+  (msg,) = util.parse_messages(util.template(html)).values()
+  return message.message_slots(msg)
+
+
+# The matches of a lookup computed by scoring every entry.
+# entry_grams are the n-grams of the source slots of every entry.
+def _brute_force_lookup(memory, entries, entry_grams, slots, k, min_score):
+  grams = memory.ngrams(slots)
+  scored = []
+  for (i, grams_i) in enumerate(entry_grams):
+    if not grams or not grams_i:
+      continue
+    score = len(grams & grams_i) / len(grams | grams_i)
+    if score >= min_score:
+      scored.append((score, -i))
+  matches = []
+  seen = set()
+  for (score, negative_i) in sorted(scored, reverse=True):
+    (source_id, source_slots, translation_slots) = entries[-negative_i]
+    key = (translation_memory.normalized_text(source_slots), translation_memory.normalized_text(translation_slots))
+    if key not in seen:
+      seen.add(key)
+      matches.append(translation_memory.Match(score, source_id, key[0], key[1]))
+  return matches[:k]
+
+
+class TranslationMemoryTest(unittest.TestCase):
+  def test_normalized_text(self):
+    slots = _slots('<p i18n="x">Hello <b>{{user}}</b></p>')
+    self.assertEqual(translation_memory.normalized_text(slots), "Hello {B_BEGIN}{EXPRESSION}{B_END}")
+
+  def test_lookup(self):
+    memory = translation_memory.TranslationMemory()
+    memory.add("a", ["Save the file"], ["Datei speichern"])
+    memory.add("b", ["Open the file"], ["Datei öffnen"])
+    memory.add("c", ["Save"], ["Speichern"])
+    memory.add("d", ["  "], ["nothing"])
+    self.assertEqual(len(memory), 3)
+    stats = {}
+    self.assertEqual(memory.lookup(["save the FILE"], stats=stats),
+                     [translation_memory.Match(1.0, "a", "Save the file", "Datei speichern"),
+                      translation_memory.Match(0.5, "b", "Open the file", "Datei öffnen")])
+    # "Save" is too short to reach min_score and is not even scored.
+    self.assertEqual(stats["candidates"], 2)
+    self.assertEqual(memory.lookup(["save the file"], k=1, min_score=0.2),
+                     [translation_memory.Match(1.0, "a", "Save the file", "Datei speichern")])
+    self.assertEqual(memory.lookup(["close the window"]), [])
+    with self.assertRaises(translation_memory.Error):
+      memory.lookup(["save"], min_score=0)
+
+  def test_placeholders_count_by_name(self):
+    memory = translation_memory.TranslationMemory()
+    source = _slots('<p i18n="x">Hello <b>{{user}}</b></p>')
+    memory.add("x", source, source)
+    (match,) = memory.lookup(_slots('<p i18n="x">Hello {{user}}</p>'))
+    self.assertEqual(match.score, 0.5)
+
+  def test_character_ngrams(self):
+    memory = translation_memory.TranslationMemory(mode=translation_memory.CHAR_NGRAMS)
+    self.assertEqual(memory.ngrams(["Hi"]), set([" hi", "hi "]))
+    memory.add("a", ["colour"], ["Farbe"])
+    (match,) = memory.lookup(["color"], min_score=0.3)
+    self.assertEqual(match.source_id, "a")
+    with self.assertRaises(translation_memory.Error):
+      translation_memory.TranslationMemory(mode="syllable")
+
+  # Lookups skip long posting lists and filter candidates by their n-gram
+  # counts; the results must still be those of scoring every entry.
+  def test_lookup_matches_brute_force(self):
+    rng = random.Random(42)
+    words = ["w%d" % i for i in range(40)] + ["common"] * 20
+    for (mode, n) in ((translation_memory.WORD_NGRAMS, 1), (translation_memory.WORD_NGRAMS, 2),
+                      (translation_memory.CHAR_NGRAMS, 3)):
+      memory = translation_memory.TranslationMemory(mode=mode, n=n)
+      entries = []
+      for i in range(500):
+        source = [" ".join(rng.choice(words) for _ in range(rng.randint(1, 8)))]
+        entries.append(("id%d" % i, source, ["t%d" % (i % 50)]))
+        memory.add(*entries[-1])
+      entry_grams = [memory.ngrams(source_slots) for (source_id, source_slots, translation_slots) in entries]
+      with mock.patch.object(translation_memory, "_MIN_LONG_POSTINGS", 20):
+        for _ in range(100):
+          query = [" ".join(rng.choice(words) for _ in range(rng.randint(1, 8)))]
+          k = rng.randint(1, 5)
+          min_score = rng.choice([0.2, 0.5, 0.8, 1.0])
+          self.assertEqual(memory.lookup(query, k=k, min_score=min_score),
+                           _brute_force_lookup(memory, entries, entry_grams, query, k, min_score),
+                           (mode, n, query, k, min_score))
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from tools import catalog_formats
+from tools import pseudo_translation
+from tools import validation
+
+from . import util
+
+
+_HTML = util.template(
+    '<p i18n="greeting|the greeting">Hello <b>{{user}}</b>, <i>see <a href="/x">this</a></i></p>',
+    '<p i18n="count">{{n}} items</p>')
+
+
+def _tokens(*tokens):
+  return [token if token.islower() else catalog_formats.PlaceholderName(token) for token in tokens]
+
+
+class SignatureTest(unittest.TestCase):
+  def setUp(self):
+    (self.greeting, self.count) = util.parse_messages(_HTML).values()
+    self.signature = validation.structural_signature(self.greeting)
+
+  def test_structural_signature(self):
+    self.assertEqual(self.signature, validation.Signature(
+        (("EXPRESSION", 1),), (("B_BEGIN", "B_END", ()), ("I_BEGIN", "I_END", (("LINK_BEGIN", "LINK_END", ()),)))))
+
+  def test_check_tokens(self):
+    def check(*tokens):
+      return validation.check_tokens(self.signature, _tokens(*tokens))
+    # Text and the order of sibling tag pairs may change.
+    self.assertEqual(check("I_BEGIN", "siehe", "LINK_BEGIN", "das", "LINK_END", "I_END",
+                           "hallo", "B_BEGIN", "EXPRESSION", "B_END"), [])
+    self.assertEqual(check("B_BEGIN", "B_END", "I_BEGIN", "LINK_BEGIN", "LINK_END", "I_END", "NOPE"),
+                     ["missing placeholder EXPRESSION", "unexpected placeholder NOPE"])
+    self.assertEqual(check("B_BEGIN", "EXPRESSION", "B_END", "I_BEGIN", "I_END", "LINK_BEGIN", "LINK_END"),
+                     ["tags B_BEGIN I_BEGIN LINK_BEGIN instead of B_BEGIN I_BEGIN(LINK_BEGIN)"])
+    self.assertEqual(check("B_BEGIN", "EXPRESSION", "I_BEGIN", "B_END", "I_END"), ["unexpected B_END"])
+    self.assertEqual(check("B_BEGIN", "EXPRESSION"), ["B_BEGIN is never closed"])
+
+  def test_check_message(self):
+    self.assertEqual(validation.check_message(self.count, self.count), [])
+    self.assertEqual(validation.check_message(self.count, self.greeting),
+                     ["tags B_BEGIN I_BEGIN(LINK_BEGIN) instead of none"])
+
+
+class ImportTranslationsTest(util.TempDirTestCase):
+  def setUp(self):
+    super(ImportTranslationsTest, self).setUp()
+    self.messages = util.parse_messages(_HTML)
+    translator = pseudo_translation.PseudoTranslator()
+    self.translations = dict((message_id, translator(msg)) for (message_id, msg) in self.messages.items())
+    self.xlf = self.path("de.xlf")
+    catalog_formats.write_xliff(self.xlf, self.messages.values(), target_language="de",
+                                translations=self.translations)
+    self.xtb = self.path("fr.xtb")
+    catalog_formats.write_xtb(self.xtb, self.translations.values(), "fr")
+
+  def check_import(self, jobs):
+    translations_by_locale = validation.import_translations({"de": self.xlf, "fr": self.xtb}, self.messages,
+                                                            jobs=jobs)
+    self.assertEqual(list(translations_by_locale), ["de", "fr"])
+    for translations in translations_by_locale.values():
+      self.assertEqual(list(translations), list(self.messages))
+      for (message_id, translated_message) in translations.items():
+        self.assertEqual(translated_message.unparse(), self.translations[message_id].unparse())
+
+  def test_import(self):
+    self.check_import(jobs=1)
+
+  def test_import_in_worker_processes(self):
+    self.check_import(jobs=2)
+
+  def test_every_problem_is_reported(self):
+    (greeting_id, count_id) = self.messages
+    bad = self.write("it.xtb", '<translationbundle>'
+                     '<translation id="%s">Ciao <ph name="B_BEGIN"/><ph name="EXPRESSION"/></translation>'
+                     '<translation id="%s"><ph name="NOPE"/> cose</translation>'
+                     '<translation id="unknown">Ignored</translation>'
+                     '</translationbundle>' % (greeting_id, count_id))
+    for jobs in (1, 2):
+      with self.assertRaises(validation.ValidationError) as cm:
+        validation.import_translations({"de": self.xlf, "it": bad, "es": self.path("es.po")}, self.messages,
+                                       jobs=jobs)
+      self.assertEqual([(violation.fname, violation.message_id, violation.problem)
+                        for violation in cm.exception.violations],
+                       [(bad, greeting_id, "B_BEGIN is never closed"),
+                        (bad, count_id, "missing placeholder EXPRESSION"),
+                        (bad, count_id, "unexpected placeholder NOPE"),
+                        (self.path("es.po"), None, "Unknown translation file format: " + self.path("es.po"))])
+
+  def test_translation_args(self):
+    self.assertEqual(list(validation.parse_translation_args(["de=a.xlf", "fr=b=c.xtb"]).items()),
+                     [("de", "a.xlf"), ("fr", "b=c.xtb")])
+    with self.assertRaises(validation.Error):
+      validation.parse_translation_args(["de"])
+    translations_by_locale = validation.import_translation_args(["de=" + self.xlf], self.messages, jobs=1)
+    self.assertEqual(list(translations_by_locale["de"]), list(self.messages))
+    with self.assertLogs(validation.logger, "ERROR") as cm:
+      with self.assertRaises(validation.ValidationError):
+        validation.import_translation_args(["de=" + self.xlf, "es=" + self.path("es.po")], self.messages, jobs=1)
+    self.assertEqual(cm.output, ["ERROR:tools.validation:{0}: Unknown translation file format: {0}".format(
+        self.path("es.po"))])
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import unittest
+from unittest import mock
+
+from tools import extraction
+from tools import watch
+
+from . import util
+
+
+class WatchedCatalogTest(util.TempDirTestCase):
+  def setUp(self):
+    super(WatchedCatalogTest, self).setUp()
+    self.write("a.html", util.template('<p i18n="a">Alpha</p>'))
+    self.write("b.html", util.template('<p i18n="b">Beta</p>'))
+    watcher = watch.TemplateWatcher([self.tmp_dir], use_inotify=False)
+    self.addCleanup(watcher.close)
+    self.watched = watch.WatchedCatalog(watcher)
+    self.first = self.watched.update()
+
+  # Writes a template with a new mtime so that the next scan sees it.
+  def touch(self, name, text):
+    fname = self.write(name, text)
+    st = os.stat(fname)
+    os.utime(fname, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+  def texts(self):
+    return sorted(self.watched.catalog[message_id].unparse() for message_id in self.watched.catalog)
+
+  def test_initial_scan(self):
+    self.assertEqual(self.first.revision, 1)
+    self.assertEqual(len(self.first.added_ids), 2)
+    self.assertEqual(self.texts(), ["Alpha", "Beta"])
+    self.assertIsNone(self.watched.update())
+
+  def test_updates_changed_and_removed_files(self):
+    self.touch("a.html", util.template('<p i18n="a">Alpha two</p>'))
+    self.write("c.html", util.template('<p i18n="c">Gamma</p>'))
+    os.unlink(self.path("b.html"))
+    change = self.watched.update()
+    self.assertEqual(self.texts(), ["Alpha two", "Gamma"])
+    self.assertEqual((len(change.added_ids), len(change.removed_ids)), (2, 2))
+    (revision, (added_ids, removed_ids)) = self.watched.changes_since(0)
+    self.assertEqual(revision, 2)
+    self.assertEqual(added_ids, set(self.watched.catalog))
+
+  def test_a_bad_template_does_not_hold_up_the_others(self):
+    self.touch("a.html", util.template('<p i18n="a">Alpha two</p>'))
+    self.touch("b.html", util.template('<p i18n="b">Beta {{x // i18n-ph(bad)}}</p>'))
+    self.write("c.html", util.template('<p i18n="c">Gamma</p>'))
+    with self.assertLogs(watch.logger, "ERROR"):
+      change = self.watched.update()
+    self.assertEqual(self.texts(), ["Alpha two", "Gamma"])
+    self.assertEqual(self.watched.catalog.message_ids_in_file(self.path("b.html")), [])
+    self.assertEqual(len(change.removed_ids), 2)
+    # The bad template is picked up again once it is fixed.
+    self.touch("b.html", util.template('<p i18n="b">Beta</p>'))
+    self.watched.update()
+    self.assertEqual(self.texts(), ["Alpha two", "Beta", "Gamma"])
+
+  def test_saving_without_message_changes_keeps_the_revision(self):
+    self.touch("a.html", util.template('<p i18n="a">Alpha</p>', "<div>layout only</div>"))
+    self.assertIsNone(self.watched.update())
+    self.assertEqual(self.watched.revision, 1)
+    self.assertEqual(self.watched.changes_since(1), (1, (set(), set())))
+
+  def test_file_json(self):
+    (entry,) = self.watched.file_json(self.path("a.html"))
+    self.assertEqual(entry["sources"], [{"file": self.path("a.html"), "line": 1}])
+    self.assertIsNone(self.watched.file_json(self.path("missing.html")))
+
+
+def _has_inotify():
+  inotify = watch._Inotify.create()
+  if inotify is None:
+    return False
+  inotify.close()
+  return True
+
+
+@unittest.skipUnless(_has_inotify(), "inotify is not available")
+class InotifyTest(util.TempDirTestCase):
+  def setUp(self):
+    super(InotifyTest, self).setUp()
+    self.write("a.html", util.template('<p i18n="a">Alpha</p>'))
+    self.write("sub/b.html", util.template('<p i18n="b">Beta</p>'))
+    self.watcher = watch.TemplateWatcher([self.tmp_dir], poll_interval=0)
+    self.addCleanup(self.watcher.close)
+
+  def test_a_scan_walks_the_tree_once(self):
+    with mock.patch.object(extraction.os, "walk", wraps=os.walk) as walk:
+      self.watcher.scan()
+    self.assertEqual(walk.call_count, 1)
+    self.assertEqual(set(self.watcher._inotify._watched), set([self.tmp_dir, self.path("sub")]))
+
+  def test_watches_are_kept_across_events(self):
+    self.watcher.scan()
+    inotify = self.watcher._inotify
+    watched = dict(inotify._watched)
+    self.write("a.html", util.template('<p i18n="a">Alpha two</p>'))
+    self.assertTrue(inotify.wait(1))
+    self.assertEqual(inotify._watched, watched)
+    # Directories that go away drop their watches.
+    shutil.rmtree(self.path("sub"))
+    self.assertTrue(inotify.wait(1))
+    self.assertEqual(set(inotify._watched), set([self.tmp_dir]))
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import io
+import shutil
+import tempfile
+import unittest
+
+import lxml.html
+
+from tools import fingerprint
+from tools import message
+
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEMO_HTML = os.path.join(REPO_DIR, "demo", "index.html")
+
+
+def parse_html(html):
+  return lxml.html.document_fromstring(html)
+
+
+# The messages of an HTML string as an OrderedDict of message ID -> Message.
+def parse_messages(html, **kwargs):
+  return message.parse_messages(parse_html(html), **kwargs)
+
+
+def build_message(raw_message, raw_comment="a comment"):
+  return message.MessageBuilder(raw_comment=raw_comment, raw_message=raw_message).build()
+
+
+def template(*bodies):
+  return "<html><body>%s</body></html>" % "".join(bodies)
+
+
+# A test case with a temporary directory (self.tmp_dir) that is removed after
+# each test.  The fingerprint version is restored as well since several tools
+# set it globally.
+class TempDirTestCase(unittest.TestCase):
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp(prefix="i18n-test-")
+    self.addCleanup(shutil.rmtree, self.tmp_dir, True)
+    self.addCleanup(fingerprint.set_default_version, fingerprint.default_version())
+
+  def path(self, *names):
+    return os.path.join(self.tmp_dir, *names)
+
+  def write(self, name, text):
+    fname = self.path(name)
+    os.makedirs(os.path.dirname(fname), exist_ok=True)
+    with io.open(fname, "wt", encoding="utf-8") as f:
+      f.write(text)
+    return fname
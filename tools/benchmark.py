@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import io
+import re
+import gc
+import time
+import random
+import hashlib
+import platform
+import subprocess
+import tempfile
+import tracemalloc
+from collections import OrderedDict
+
+import lxml.html
+import lxml.etree
+
+from . import message
+from . import fingerprint
+from . import corpus
+from . import translation
+from . import message_printer
+from . import pseudo_translation
+from . import term_printer
+
+
+class Error(Exception):
+  pass
+
+
+# Benchmarks for the extraction and translation tools.  Every benchmark returns
+# an OrderedDict of results that is meant to be dumped as JSON and compared
+# across commits (see tools/benchmark.)  All synthetic inputs are generated from
+# a seeded random.Random so that runs are reproducible (see corpus.)
+
+
+def build_message_from_html(html, raw_comment="Synthetic message"):
+  node = lxml.html.fragment_fromstring(html, create_parent="span")
+  return message.MessageBuilder(raw_comment=raw_comment, raw_message=node).build()
+
+
+def synthetic_messages(count, seed=0, **kwargs):
+  rng = random.Random(seed)
+  for i in range(count):
+    yield build_message_from_html(corpus.synthetic_message_html(rng, **kwargs))
+
+
+# Python heap bytes retained per Message (including its parts and
+# placeholders) for a catalog of count synthetic messages.
+def measure_message_memory(count=100000, seed=0):
+  rng = random.Random(seed)
+  htmls = [corpus.synthetic_message_html(rng, num_tags=rng.randrange(3)) for i in range(count)]
+  gc.collect()
+  tracemalloc.start()
+  try:
+    (before, peak) = tracemalloc.get_traced_memory()
+    messages = [build_message_from_html(html) for html in htmls]
+    gc.collect()
+    (after, peak) = tracemalloc.get_traced_memory()
+  finally:
+    tracemalloc.stop()
+  retained = after - before
+  return OrderedDict([
+      ("benchmark", "message_memory"),
+      ("messages", len(messages)),
+      ("bytes", retained),
+      ("bytes_per_message", round(retained / float(len(messages)), 1)),
+  ])
+
+
+# A re-implementation of the generator based md5 fingerprinting that
+# MessageBuilder used before the fingerprint engine (one hasher update per
+# piece, every piece formatted on its own.)  This is not the old code: that
+# computed the ID before the placeholders were named and cannot run on built
+# messages.  The pieces skip the auto generated names like the engine does so
+# that the IDs match; the baseline measures the serialization strategy only.
+def _generator_id_parts(parts):
+  placeholders = {}
+  for part in parts:
+    if isinstance(part, str):
+      yield "{0}{2}{1}".format(fingerprint.BEGIN_TEXT, fingerprint.ESCAPE_END,
+                               part.replace(fingerprint.ESCAPE_CHAR, fingerprint.ESCAPE_CHAR*2))
+    elif isinstance(part, message.Placeholder):
+      placeholders[None if part.auto_named else part.name] = part
+    elif isinstance(part, message.TagPair):
+      yield "{0}{1},{2}{3}".format(fingerprint.BEGIN_TAG, None if part.ph_begin.auto_named else part.ph_begin.name,
+                                   type(part).__name__, fingerprint.ESCAPE_END)
+      for i in _generator_id_parts(part.parts):
+        yield i
+  for name in sorted(placeholders, key=lambda name: (name is not None, name or "")):
+    placeholder = placeholders[name]
+    yield "{0}{1},{2}{3}".format(fingerprint.BEGIN_PH, name, type(placeholder).__name__, fingerprint.ESCAPE_END)
+
+
+def _generator_compute_id(meaning, parts):
+  hasher = hashlib.md5()
+  hasher.update((meaning or "").replace(fingerprint.ESCAPE_CHAR, fingerprint.ESCAPE_CHAR*2).encode("utf-8"))
+  for part in _generator_id_parts(parts):
+    hasher.update(part.encode("utf-8"))
+  return hasher.hexdigest()
+
+
+def _time(fn, repeat):
+  best = None
+  for i in range(repeat):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    best = elapsed if best is None else min(best, elapsed)
+  return best
+
+
+# Compares the fingerprinting throughput of the generator based baseline (see
+# _generator_compute_id) and the schemes of the fingerprint engine on count
+# synthetic messages.  Also checks that the md5 scheme produces the same IDs as
+# the baseline.
+def measure_fingerprinting(count=20000, seed=0, repeat=3):
+  rng = random.Random(seed)
+  messages = [build_message_from_html(corpus.synthetic_message_html(
+                  rng, num_words=20, num_expressions=rng.randrange(4), num_tags=rng.randrange(4)))
+              for i in range(count)]
+  baseline_ids = [_generator_compute_id(msg.meaning, msg.parts) for msg in messages]
+  if baseline_ids != [fingerprint.compute_id(msg.meaning, msg.parts, version=1) for msg in messages]:
+    raise Error("The md5 fingerprint scheme is not compatible with the generator based baseline")
+  results = OrderedDict([("benchmark", "fingerprinting"), ("messages", count)])
+  timings = OrderedDict()
+  timings["generator_md5"] = _time(lambda: [_generator_compute_id(msg.meaning, msg.parts) for msg in messages], repeat)
+  for scheme in fingerprint.SCHEMES.values():
+    timings["v{0}_{1}".format(scheme.version, scheme.name)] = _time(
+        lambda: [scheme.compute_id(msg.meaning, msg.parts) for msg in messages], repeat)
+    timings["v{0}_{1}_bulk".format(scheme.version, scheme.name)] = _time(
+        lambda: fingerprint.recompute_ids(messages, scheme.version), repeat)
+  for (name, elapsed) in timings.items():
+    results[name] = OrderedDict([("seconds", round(elapsed, 4)),
+                                 ("messages_per_second", int(count / elapsed))])
+  return results
+
+
+# Records the raw inputs of MessageBuilder for every message that
+# parse_messages visits so that building can be timed on its own.
+class _BuildInputRecorder(message.OnParseBase):
+  def __init__(self):
+    self.inputs = []
+
+  def on_attrib(self, message, node, attr):
+    self.inputs.append((node.get("i18n-" + attr), node.get(attr)))
+
+  def on_node(self, message, node):
+    self.inputs.append((node.get("i18n"), node))
+
+
+def _parse_documents(documents):
+  return [lxml.html.document_fromstring(data) for data in documents]
+
+
+def _build_messages(inputs):
+  return [message.MessageBuilder(raw_comment=raw_comment, raw_message=raw_message).build()
+          for (raw_comment, raw_message) in inputs]
+
+
+def _translate_documents(roots):
+  fragment_cache = translation.FragmentCache()
+  for root in roots:
+    translation.translate_document(root, pseudo_translation.pseudo_translate, fragment_cache)
+
+
+def _print_messages(messages):
+  printer = message_printer.MessagePrinter(term_printer.TermPrinter(out=io.StringIO()))
+  for msg in messages:
+    printer.print_message(msg)
+  printer.flush()
+
+
+# Like _time but calls setup() before every run and passes its result to fn.
+# Only fn is timed.
+def _time_with_setup(setup, fn, repeat):
+  best = None
+  for i in range(repeat):
+    arg = setup()
+    start = time.perf_counter()
+    fn(arg)
+    elapsed = time.perf_counter() - start
+    best = elapsed if best is None else min(best, elapsed)
+  return best
+
+
+def _git_commit():
+  try:
+    return subprocess.check_output(
+        ["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+        stderr=subprocess.DEVNULL, universal_newlines=True).strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+
+def _metadata():
+  return OrderedDict([
+      ("git_commit", _git_commit()),
+      ("python", platform.python_version()),
+      ("implementation", platform.python_implementation()),
+      ("lxml", ".".join(map(str, lxml.etree.LXML_VERSION))),
+      ("platform", platform.platform()),
+  ])
+
+
+# Times every phase of extraction and translation separately on the templates
+# in fnames (see corpus.generate_corpus):
+#   html_parse: lxml parse of the templates.
+#   parse_messages: finding the messages in the parsed trees and building them.
+#   build: MessageBuilder.build alone on the same nodes and attributes.
+#   pseudo_translate: pseudo translating every extracted message.
+#   rewrite: translating the trees in place with translation.OnParse.
+#   print: printing the messages with message_printer.MessagePrinter.
+# Every phase reports the best time of repeat runs.
+def measure_phases(fnames, repeat=3):
+  documents = []
+  for fname in fnames:
+    with io.open(fname, "rb") as f:
+      documents.append(f.read())
+  roots = _parse_documents(documents)
+  recorder = _BuildInputRecorder()
+  messages = []
+  for root in roots:
+    messages.extend(message.parse_messages(root, on_parse=recorder).values())
+  timings = OrderedDict()
+  timings["html_parse"] = _time(lambda: _parse_documents(documents), repeat)
+  timings["parse_messages"] = _time(lambda: [message.parse_messages(root) for root in roots], repeat)
+  timings["build"] = _time(lambda: _build_messages(recorder.inputs), repeat)
+  # A fresh translator per run so that its memoization starts out cold.
+  timings["pseudo_translate"] = _time(
+      lambda: list(map(pseudo_translation.PseudoTranslator(), messages)), repeat)
+  timings["rewrite"] = _time_with_setup(lambda: _parse_documents(documents), _translate_documents, repeat)
+  timings["print"] = _time(lambda: _print_messages(messages), repeat)
+  counts = OrderedDict([
+      ("files", len(documents)),
+      ("bytes", sum(len(data) for data in documents)),
+      ("occurrences", len(recorder.inputs)),
+      ("messages", len(messages)),
+  ])
+  # The throughput unit of each phase.
+  units = OrderedDict([
+      ("html_parse", "bytes"),
+      ("parse_messages", "occurrences"),
+      ("build", "occurrences"),
+      ("pseudo_translate", "messages"),
+      ("rewrite", "occurrences"),
+      ("print", "messages"),
+  ])
+  phases = OrderedDict()
+  for (name, elapsed) in timings.items():
+    unit = units[name]
+    phases[name] = OrderedDict([("seconds", round(elapsed, 4)),
+                                ("{0}_per_second".format(unit), int(counts[unit] / elapsed) if elapsed else None)])
+  return (counts, phases)
+
+
+# Generates a synthetic corpus (see corpus.DEFAULT_OPTIONS for the options) in
+# a temporary directory and runs measure_phases on it.
+def run_suite(seed=0, repeat=3, **corpus_options):
+  options = corpus.corpus_options(corpus_options)
+  with tempfile.TemporaryDirectory(prefix="i18n-benchmark-") as corpus_dir:
+    fnames = corpus.generate_corpus(corpus_dir, seed=seed, **options)
+    (counts, phases) = measure_phases(fnames, repeat=repeat)
+  corpus_info = OrderedDict([("seed", seed)])
+  corpus_info.update(options)
+  corpus_info.update(counts)
+  return OrderedDict([
+      ("benchmark", "suite"),
+      ("metadata", _metadata()),
+      ("repeat", repeat),
+      ("corpus", corpus_info),
+      ("phases", phases),
+  ])
+
+
+# Compares two run_suite results.  Returns a list of (phase, old seconds, new
+# seconds, ratio, regressed) where regressed means that the phase got slower
+# by more than tolerance (a fraction, e.g. 0.1 for 10%.)  Raises Error if the
+# results were measured on different corpora.
+def compare_suites(old, new, tolerance=0.1):
+  if old.get("corpus") != new.get("corpus"):
+    raise Error("The results were measured on different corpora")
+  rows = []
+  for (name, new_phase) in new["phases"].items():
+    old_phase = old["phases"].get(name)
+    if old_phase is None:
+      continue
+    (old_seconds, new_seconds) = (old_phase["seconds"], new_phase["seconds"])
+    ratio = new_seconds / old_seconds if old_seconds else float("inf")
+    rows.append((name, old_seconds, new_seconds, ratio, ratio > 1 + tolerance))
+  return rows
+
+
+# A re-implementation of the regex based lexing of Angular expressions that
+# parse_message_text_for_ng_expressions used before the lexer (a split on the
+# first "}}" after every "{{", then an rsplit and a regex match for the
+# i18n-ph comment.)  Returns (text, code, ph_name, example) tuples.
+_SPLIT_NG_EXPR_RE = re.compile(r"\{\{\s*(.*?)\s*\}\}")
+_SPLIT_NG_EXPR_PH_RE = re.compile(r"i18n-ph\((.*)\)")
+
+def _split_ng_expressions(text):
+  tokens = []
+  splits = iter(_SPLIT_NG_EXPR_RE.split(text) + [""])
+  for (txt, expr) in zip(splits, splits):
+    expr = expr.strip()
+    code, ph_name, example = expr, None, None
+    if "//" in expr:
+      (code, raw_comment) = expr.rsplit("//", 1)
+      m = _SPLIT_NG_EXPR_PH_RE.match(raw_comment.strip())
+      if not m:
+        raise Error("Angular expression has a comment but it wasn't valid i18n-ph() syntax")
+      (ph_name, sep, example) = m.group(1).strip().partition("|")
+      (code, ph_name, example) = (code.strip(), ph_name.strip(), example.strip())
+    tokens.append((txt, code, ph_name, example))
+  return tokens
+
+
+def _synthetic_ng_text(rng, num_expressions, expressions):
+  chunks = [corpus.synthetic_message_html(rng, num_words=4, num_expressions=0, num_tags=0)
+            for i in range(num_expressions + 1)]
+  for i in range(num_expressions):
+    chunks[rng.randrange(len(chunks))] += " {{ %s }} " % rng.choice(expressions)
+  return " ".join(chunks)
+
+
+# Compares message.lex_ng_expressions's lexer with the regex split baseline
+# (see _split_ng_expressions) on count synthetic message texts of each kind:
+#   plain: no expressions at all.
+#   simple: member expressions, some with an i18n-ph comment.
+#   literals: expressions with object literals and quoted filter arguments,
+#     which the baseline splits at the wrong "}}" (and the lexer scans.)
+def measure_ng_lexer(count=20000, seed=0, repeat=5):
+  rng = random.Random(seed)
+  simple = ["user.name", "item.count", "total // i18n-ph(TOTAL|42)", "a.b.c"]
+  literals = ["x | date:'MMM d, y'", "{a: 1}[key]", "name | translate:{count: n}", 'label + "}}"']
+  kinds = OrderedDict([
+      ("plain", [corpus.synthetic_message_html(rng, num_words=12, num_expressions=0, num_tags=0)
+                 for i in range(count)]),
+      ("simple", [_synthetic_ng_text(rng, rng.randint(1, 3), simple) for i in range(count)]),
+      ("literals", [_synthetic_ng_text(rng, rng.randint(1, 3), literals) for i in range(count)])])
+  results = OrderedDict([("benchmark", "ng_lexer"), ("texts", count)])
+  on_warning = lambda warning: None
+  for (kind, texts) in kinds.items():
+    timings = OrderedDict()
+    timings["regex_split"] = _time(lambda: [_split_ng_expressions(text) for text in texts], repeat)
+    timings["lexer"] = _time(lambda: [message._lex_ng_expressions(text, on_warning) for text in texts], repeat)
+    results[kind] = OrderedDict((name, OrderedDict([("seconds", round(elapsed, 4)),
+                                                    ("texts_per_second", int(count / elapsed))]))
+                                for (name, elapsed) in timings.items())
+  return results
+
+
+# Times parse_messages with every message.DISCOVERY_MODES on synthetic pages
+# (see corpus.DEFAULT_OPTIONS for the options.)  The defaults are large pages
+# where few elements carry i18n markup.  Also checks that all modes find the
+# same messages in the same order.
+def measure_discovery(seed=0, repeat=5, **corpus_options):
+  options = OrderedDict([("num_files", 10), ("elements_per_file", 5000), ("i18n_density", 0.02)])
+  options.update(corpus_options)
+  options = corpus.corpus_options(options)
+  rng = random.Random(seed)
+  document_options = OrderedDict((k, v) for (k, v) in options.items() if k != "num_files")
+  roots = [lxml.html.document_fromstring(corpus.synthetic_document(rng, **document_options))
+           for i in range(options["num_files"])]
+  expected = None
+  for discovery in message.DISCOVERY_MODES:
+    found = [list(message.parse_messages(root, discovery=discovery)) for root in roots]
+    if expected is None:
+      expected = found
+    elif found != expected:
+      raise Error("Discovery mode {0} found different messages".format(discovery))
+  corpus_info = OrderedDict([("seed", seed)])
+  corpus_info.update(options)
+  corpus_info["elements"] = sum(1 for root in roots for node in root.iter())
+  corpus_info["messages"] = sum(len(ids) for ids in expected)
+  results = OrderedDict([("benchmark", "discovery"), ("corpus", corpus_info)])
+  for discovery in message.DISCOVERY_MODES:
+    elapsed = _time(lambda: [message.parse_messages(root, discovery=discovery) for root in roots], repeat)
+    results[discovery] = OrderedDict([("seconds", round(elapsed, 4)),
+                                      ("elements_per_second", int(corpus_info["elements"] / elapsed))])
+  return results
+
+
+# Compares rendering num_locales locales of synthetic templates by parsing the
+# source once per locale (translation.translate_html_file) with parsing it
+# once and rendering every locale from the AnalyzedDocument (sequentially and
+# on a thread pool.)  Every locale gets its own pseudo translator and fragment
+# cache shared across the templates, as in a real build.
+def measure_locales(num_locales=40, seed=0, repeat=3, jobs=None, **corpus_options):
+  options = OrderedDict([("num_files", 5), ("elements_per_file", 1000)])
+  options.update(corpus_options)
+  options = corpus.corpus_options(options)
+  def make_translators():
+    return OrderedDict(("x{0:02d}".format(i), pseudo_translation.PseudoTranslator(expansion=i / 100.0))
+                       for i in range(num_locales))
+  def reparse(fnames):
+    translators = make_translators()
+    caches = dict((locale, translation.FragmentCache()) for locale in translators)
+    for fname in fnames:
+      for (locale, translator) in translators.items():
+        translation.translate_html_file(fname, translator, caches[locale])
+  def fan_out(fnames, jobs):
+    translators = make_translators()
+    caches = dict((locale, translation.FragmentCache()) for locale in translators)
+    with tempfile.TemporaryDirectory(prefix="i18n-benchmark-out-") as out_dir:
+      for (i, fname) in enumerate(fnames):
+        analyzed = translation.AnalyzedDocument.from_file(fname)
+        translation.render_locales(analyzed, translators,
+                                   os.path.join(out_dir, "{locale}", "%d.html" % i),
+                                   jobs=jobs, fragment_caches=caches)
+  with tempfile.TemporaryDirectory(prefix="i18n-benchmark-") as corpus_dir:
+    fnames = corpus.generate_corpus(corpus_dir, seed=seed, **options)
+    timings = OrderedDict()
+    timings["reparse_per_locale"] = _time(lambda: reparse(fnames), repeat)
+    timings["fan_out"] = _time(lambda: fan_out(fnames, 1), repeat)
+    timings["fan_out_threads"] = _time(lambda: fan_out(fnames, jobs), repeat)
+  corpus_info = OrderedDict([("seed", seed)])
+  corpus_info.update(options)
+  results = OrderedDict([("benchmark", "locales"), ("locales", num_locales), ("corpus", corpus_info)])
+  for (name, elapsed) in timings.items():
+    results[name] = OrderedDict([("seconds", round(elapsed, 4)),
+                                 ("documents_per_second", int(len(fnames) * num_locales / elapsed))])
+  return results
@@ -0,0 +1,437 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import io
+import mmap
+import struct
+import hashlib
+import tempfile
+import collections.abc
+from collections import OrderedDict
+
+from . import message
+from . import fingerprint
+
+
+class Error(Exception):
+  pass
+
+
+# Compact, memory mapped catalog of messages (e.g. all the translations for one
+# locale.)  Opening a catalog only reads the header; a Message is decoded when
+# its ID is looked up.  Since the file is mapped read only, every process that
+# opens the same catalog shares the pages through the page cache.
+#
+# File layout (all integers little endian):
+#
+#   header:   MAGIC, u32 format version, u32 fingerprint version,
+#             u32 message count, u32 slot count,
+#             u64 offset of the hash index, u64 offset of the order table
+#   records:  one per message: u32 length followed by the encoded message
+#   index:    open addressing hash table of (u64 hash of the ID,
+#             u64 record offset + 1) slots.  0 marks an empty slot.
+#   order:    u64 record offset per message in the order they were written.
+#
+# An encoded message is the ID, meaning and comment followed by the
+# placeholder table (in placeholders_by_name order) and the parts.  Placeholders
+# and tag pairs carry their auto_named flag since it affects fingerprinting.  Strings are
+# u32 length prefixed UTF-8 (NONE_LENGTH for None), lists are u32 count
+# prefixed.  The ID comes first so that it can be checked without decoding the
+# rest of the record.
+MAGIC = b"NGI18NCT"
+FORMAT_VERSION = 2
+
+_HEADER = struct.Struct("<8sIIIIQQ")
+_U8 = struct.Struct("<B")
+_U32 = struct.Struct("<I")
+_U64 = struct.Struct("<Q")
+_SLOT = struct.Struct("<QQ")
+
+NONE_LENGTH = 0xFFFFFFFF
+
+# Placeholder table entries.
+PH_PLACEHOLDER = 0
+PH_NG_EXPR = 1
+PH_TAG_BEGIN = 2
+PH_TAG_END = 3
+
+# Message parts.
+PART_TEXT = 0
+PART_PLACEHOLDER = 1
+PART_HTML_TAG_PAIR = 2
+
+
+def _hash_id(message_id):
+  digest = hashlib.blake2b(message_id.encode("utf-8"), digest_size=8).digest()
+  return int.from_bytes(digest, "little")
+
+
+class _Encoder(object):
+  def __init__(self):
+    self.buf = bytearray()
+
+  def u8(self, value):
+    self.buf += _U8.pack(value)
+
+  def u32(self, value):
+    self.buf += _U32.pack(value)
+
+  def str(self, value):
+    if value is None:
+      self.u32(NONE_LENGTH)
+      return
+    data = value.encode("utf-8")
+    self.u32(len(data))
+    self.buf += data
+
+  def strs(self, values):
+    if values is None:
+      self.u32(NONE_LENGTH)
+      return
+    self.u32(len(values))
+    for value in values:
+      self.str(value)
+
+  def placeholder(self, name, placeholder):
+    if isinstance(placeholder, message.TagPairBeginRef):
+      self.u8(PH_TAG_BEGIN)
+      self.str(name)
+    elif isinstance(placeholder, message.TagPairEndRef):
+      self.u8(PH_TAG_END)
+      self.str(name)
+    else:
+      self.u8(PH_NG_EXPR if isinstance(placeholder, message.NgExpr) else PH_PLACEHOLDER)
+      self.str(name)
+      self.u8(placeholder.auto_named)
+      self.str(placeholder.text)
+      self.str(placeholder.comment)
+      self.strs(placeholder.examples)
+
+  def parts(self, parts):
+    self.u32(len(parts))
+    for part in parts:
+      if isinstance(part, str):
+        self.u8(PART_TEXT)
+        self.str(part)
+      elif isinstance(part, message.Placeholder):
+        self.u8(PART_PLACEHOLDER)
+        self.str(part.name)
+      elif isinstance(part, message.HtmlTagPair):
+        self.u8(PART_HTML_TAG_PAIR)
+        for value in (part.tag, part.begin, part.end, part.canonical_key,
+                      part.ph_begin.name, part.ph_end.name):
+          self.str(value)
+        self.u8(part.ph_begin.auto_named)
+        self.strs(part.examples)
+        self.parts(part.parts)
+      else:
+        raise Error("Cannot encode message part of type {0}".format(type(part)))
+
+  def message(self, msg):
+    self.str(msg.id)
+    self.str(msg.meaning)
+    self.str(msg.comment)
+    self.u32(len(msg.placeholders_by_name))
+    for (name, placeholder) in msg.placeholders_by_name.items():
+      self.placeholder(name, placeholder)
+    self.parts(msg.parts)
+
+
+def encode_message(msg):
+  encoder = _Encoder()
+  encoder.message(msg)
+  return bytes(encoder.buf)
+
+
+class _Decoder(object):
+  def __init__(self, buf, pos):
+    self.buf = buf
+    self.pos = pos
+
+  def u8(self):
+    (value,) = _U8.unpack_from(self.buf, self.pos)
+    self.pos += 1
+    return value
+
+  def u32(self):
+    (value,) = _U32.unpack_from(self.buf, self.pos)
+    self.pos += 4
+    return value
+
+  def str(self):
+    length = self.u32()
+    if length == NONE_LENGTH:
+      return None
+    start = self.pos
+    self.pos += length
+    return str(self.buf[start:self.pos], "utf-8")
+
+  def skip_str(self):
+    length = self.u32()
+    if length != NONE_LENGTH:
+      self.pos += length
+
+  def strs(self):
+    count = self.u32()
+    if count == NONE_LENGTH:
+      return None
+    return [self.str() for i in range(count)]
+
+  def placeholder(self):
+    kind = self.u8()
+    name = self.str()
+    if kind in (PH_TAG_BEGIN, PH_TAG_END):
+      return (kind, name, None)
+    auto_named = bool(self.u8())
+    text, comment, examples = self.str(), self.str(), self.strs()
+    cls = message.NgExpr if kind == PH_NG_EXPR else message.Placeholder
+    placeholder = cls(name=name, text=text, examples=examples, comment=comment)
+    placeholder.auto_named = auto_named
+    return (kind, name, placeholder)
+
+  def parts(self, placeholders, tag_refs):
+    parts = []
+    for i in range(self.u32()):
+      kind = self.u8()
+      if kind == PART_TEXT:
+        parts.append(self.str())
+      elif kind == PART_PLACEHOLDER:
+        parts.append(placeholders[self.str()])
+      elif kind == PART_HTML_TAG_PAIR:
+        tag, begin, end, canonical_key, begin_name, end_name = [self.str() for j in range(6)]
+        auto_named = bool(self.u8())
+        examples = self.strs()
+        subparts = self.parts(placeholders, tag_refs)
+        tag_pair = message.HtmlTagPair(tag=tag, begin=begin, end=end, parts=subparts,
+                                       examples=examples, canonical_key=canonical_key)
+        tag_pair.ph_begin.name, tag_pair.ph_end.name = begin_name, end_name
+        tag_pair.ph_begin.auto_named = tag_pair.ph_end.auto_named = auto_named
+        tag_refs[begin_name] = tag_pair.ph_begin
+        tag_refs[end_name] = tag_pair.ph_end
+        parts.append(tag_pair)
+      else:
+        raise Error("Unknown message part kind {0} at offset {1}".format(kind, self.pos))
+    return parts
+
+  def message(self):
+    id, meaning, comment = self.str(), self.str(), self.str()
+    table = [self.placeholder() for i in range(self.u32())]
+    placeholders = dict((name, placeholder) for (kind, name, placeholder) in table
+                        if placeholder is not None)
+    tag_refs = {}
+    parts = self.parts(placeholders, tag_refs)
+    placeholders_by_name = OrderedDict(
+        (name, placeholder if placeholder is not None else tag_refs[name])
+        for (kind, name, placeholder) in table)
+    return message.Message(id=id, meaning=meaning, comment=comment, parts=parts,
+                           placeholders_by_name=placeholders_by_name)
+
+
+def decode_message(data):
+  return _Decoder(data, 0).message()
+
+
+def _num_slots(count):
+  num_slots = 8
+  while num_slots < 2 * count:
+    num_slots *= 2
+  return num_slots
+
+
+# Writes the messages (an iterable of Message or a mapping of ID to Message)
+# to fname.  The file is written to a temporary file first and renamed into
+# place so that readers that have the old catalog mapped are not affected.
+def write_catalog(fname, messages):
+  if isinstance(messages, collections.abc.Mapping):
+    messages = messages.values()
+  dirname = os.path.dirname(os.path.abspath(fname))
+  fd, tmp_fname = tempfile.mkstemp(dir=dirname, suffix=".tmp")
+  try:
+    with os.fdopen(fd, "wb") as f:
+      f.write(b"\0" * _HEADER.size)
+      offsets = []
+      hashes = []
+      seen_ids = set()
+      offset = _HEADER.size
+      for msg in messages:
+        if msg.id in seen_ids:
+          raise Error("Duplicate message id {0}".format(msg.id))
+        seen_ids.add(msg.id)
+        record = encode_message(msg)
+        f.write(_U32.pack(len(record)))
+        f.write(record)
+        offsets.append(offset)
+        hashes.append(_hash_id(msg.id))
+        offset += _U32.size + len(record)
+      num_slots = _num_slots(len(offsets))
+      slots = [(0, 0)] * num_slots
+      mask = num_slots - 1
+      for (hash, record_offset) in zip(hashes, offsets):
+        slot = hash & mask
+        while slots[slot][1]:
+          slot = (slot + 1) & mask
+        slots[slot] = (hash, record_offset + 1)
+      index_offset = offset
+      f.write(b"".join(_SLOT.pack(*slot) for slot in slots))
+      order_offset = index_offset + num_slots * _SLOT.size
+      f.write(b"".join(_U64.pack(record_offset) for record_offset in offsets))
+      f.seek(0)
+      f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, fingerprint.default_version(),
+                           len(offsets), num_slots, index_offset, order_offset))
+    # mkstemp creates the file private to the user.  Catalogs are meant to be
+    # shared.
+    os.chmod(tmp_fname, 0o644)
+    os.replace(tmp_fname, fname)
+  except:
+    os.unlink(tmp_fname)
+    raise
+
+
+# Read only mapping of message ID to Message backed by a memory mapped catalog
+# file written by write_catalog.  Iteration yields the IDs in the order in which
+# the messages were written.
+class BinaryCatalog(collections.abc.Mapping):
+  def __init__(self, fname):
+    self.fname = fname
+    with io.open(fname, "rb") as f:
+      # Empty files cannot be mapped.
+      if os.fstat(f.fileno()).st_size < _HEADER.size:
+        raise Error("{0}: Not a message catalog".format(fname))
+      self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    (magic, format_version, fingerprint_version, self._count, self._num_slots,
+     self._index_offset, self._order_offset) = _HEADER.unpack_from(self._mmap, 0)
+    if magic != MAGIC:
+      raise Error("{0}: Not a message catalog".format(fname))
+    if format_version != FORMAT_VERSION:
+      raise Error("{0}: Unsupported catalog format version {1}".format(fname, format_version))
+    if fingerprint_version != fingerprint.default_version():
+      raise Error("{0}: Catalog uses fingerprint version {1} but version {2} is in use".format(
+          fname, fingerprint_version, fingerprint.default_version()))
+
+  def close(self):
+    self._mmap.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+  def _record_id(self, record_offset):
+    # The ID is the first field of the record (after its length.)
+    return _Decoder(self._mmap, record_offset + _U32.size).str()
+
+  def _find_record(self, message_id):
+    hash = _hash_id(message_id)
+    mask = self._num_slots - 1
+    slot = hash & mask
+    while True:
+      (slot_hash, record_offset) = _SLOT.unpack_from(self._mmap, self._index_offset + slot * _SLOT.size)
+      if not record_offset:
+        return None
+      if slot_hash == hash and self._record_id(record_offset - 1) == message_id:
+        return record_offset - 1
+      slot = (slot + 1) & mask
+
+  def _decode_record(self, record_offset):
+    return _Decoder(self._mmap, record_offset + _U32.size).message()
+
+  # Low level access for tools that work on many records at once (see
+  # catalog_diff.)  Records are identified by their offset.
+
+  # Returns a list of the (ID hash, record offset) of every message in catalog
+  # order.  The hashes come straight from the index so nothing is decoded.
+  def hashed_records(self):
+    index = self._mmap[self._index_offset:self._index_offset + self._num_slots * _SLOT.size]
+    hashes = dict((record_offset - 1, hash) for (hash, record_offset) in _SLOT.iter_unpack(index)
+                  if record_offset)
+    order = self._mmap[self._order_offset:self._order_offset + self._count * _U64.size]
+    return [(hashes[record_offset], record_offset) for (record_offset,) in _U64.iter_unpack(order)]
+
+  # The encoded record.  Two records of the same message ID are equal unless
+  # the details that do not affect the ID (comment, examples, ...) differ.
+  def raw_record(self, record_offset):
+    (length,) = _U32.unpack_from(self._mmap, record_offset)
+    start = record_offset + _U32.size
+    return self._mmap[start:start + length]
+
+  def record_id(self, record_offset):
+    return self._record_id(record_offset)
+
+  def record_comment(self, record_offset):
+    decoder = _Decoder(self._mmap, record_offset + _U32.size)
+    decoder.skip_str()
+    decoder.skip_str()
+    return decoder.str()
+
+  def record_message(self, record_offset):
+    return self._decode_record(record_offset)
+
+  # Message has no equality so a message is compared with the record of its
+  # ID by its encoding.
+  def _has_message(self, message_id, msg):
+    if not isinstance(msg, message.Message):
+      return False
+    record_offset = self._find_record(message_id)
+    return record_offset is not None and encode_message(msg) == self.raw_record(record_offset)
+
+  def __getitem__(self, message_id):
+    record_offset = self._find_record(message_id)
+    if record_offset is None:
+      raise KeyError(message_id)
+    return self._decode_record(record_offset)
+
+  def __contains__(self, message_id):
+    return self._find_record(message_id) is not None
+
+  def __len__(self):
+    return self._count
+
+  def _iter_record_offsets(self):
+    for i in range(self._count):
+      (record_offset,) = _U64.unpack_from(self._mmap, self._order_offset + i * _U64.size)
+      yield record_offset
+
+  def __iter__(self):
+    for record_offset in self._iter_record_offsets():
+      yield self._record_id(record_offset)
+
+  # Yields the messages in catalog order, decoding each record once.
+  def iter_messages(self):
+    for record_offset in self._iter_record_offsets():
+      yield self._decode_record(record_offset)
+
+  def values(self):
+    return _MessagesView(self)
+
+  def items(self):
+    return _ItemsView(self)
+
+
+# Views of a BinaryCatalog that decode every record once while iterating
+# instead of looking every ID up again.  Every iteration decodes new Message
+# objects.
+class _MessagesView(collections.abc.ValuesView):
+  __slots__ = ()
+
+  def __contains__(self, msg):
+    return isinstance(msg, message.Message) and self._mapping._has_message(msg.id, msg)
+
+  def __iter__(self):
+    return self._mapping.iter_messages()
+
+
+class _ItemsView(collections.abc.ItemsView):
+  __slots__ = ()
+
+  def __contains__(self, item):
+    (message_id, msg) = item
+    return self._mapping._has_message(message_id, msg)
+
+  def __iter__(self):
+    for msg in self._mapping.iter_messages():
+      yield (msg.id, msg)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import io
+import json
+import fnmatch
+import hashlib
+import tempfile
+from collections import OrderedDict
+
+from . import message
+
+
+class Error(Exception):
+  pass
+
+
+# Runtime translation bundles.
+#
+# A bundle holds the translations of one locale for one shard (a template or
+# a route, i.e. a group of templates) so that a client only downloads the
+# messages of the page it renders:
+#
+#   {"locale": "de", "shard": "app/home", "messages": {"<message id>": SLOTS, ...}}
+#
+# SLOTS is the translated message pre-split into text and placeholder slots
+# (see message.message_slots) so that the client does not need to parse
+# anything.
+#
+# Bundle filenames contain a hash of their contents so they can be cached
+# forever.  Clients find them through the (uncached) manifest:
+#
+#   OUT_DIR/manifest.json: {"<locale>": {"<shard>": "<locale>/<shard>.<hash>.json"}}
+
+BUNDLE_FORMATS = ("json", "js")
+
+# The shard for messages that occur in at least common_threshold shards (see
+# shard_message_ids.)
+COMMON_SHARD = "common"
+
+DEFAULT_JS_CALLBACK = "ngI18nLoadBundle"
+
+_HASH_LENGTH = 16
+
+
+# The shard of a template without routes: its path relative to base_dir
+# without the extension and with "/" as separator.
+def shard_name(filename, base_dir):
+  relative_fname = os.path.relpath(os.path.abspath(filename), os.path.abspath(base_dir))
+  return os.path.splitext(relative_fname)[0].replace(os.sep, "/")
+
+
+# Reads a routes file: a JSON object of route name -> list of glob patterns
+# matched against the template paths relative to the base directory.
+def load_routes(fname):
+  with io.open(fname, "rt", encoding="utf-8") as f:
+    routes = json.load(f, object_pairs_hook=OrderedDict)
+  if not isinstance(routes, dict) or not all(isinstance(patterns, list) for patterns in routes.values()):
+    raise Error("{0}: expected an object of route -> list of patterns".format(fname))
+  return routes
+
+
+# Returns an OrderedDict of shard -> list of message IDs for a catalog.Catalog.
+#
+# With routes (see load_routes), every route is a shard holding the messages
+# of all the templates it matches.  A template may belong to several routes.
+# Templates that match no route (or all templates without routes) get a shard
+# of their own named after their path (see shard_name.)
+#
+# With common_threshold, messages that occur in at least that many shards are
+# moved into the COMMON_SHARD instead of being repeated in every shard.
+def shard_message_ids(catalog, base_dir, routes=None, common_threshold=None):
+  shards = OrderedDict()
+  for (filename, message_ids) in catalog.message_ids_by_file().items():
+    relative_fname = shard_name(filename, base_dir) + os.path.splitext(filename)[1]
+    names = [route for (route, patterns) in (routes or {}).items()
+             if any(fnmatch.fnmatch(relative_fname, pattern) for pattern in patterns)]
+    for name in names or [shard_name(filename, base_dir)]:
+      shard = shards.setdefault(name, OrderedDict())
+      for message_id in message_ids:
+        shard[message_id] = True
+  if COMMON_SHARD in shards and common_threshold:
+    raise Error("A shard is named {0!r} which is reserved for common messages".format(COMMON_SHARD))
+  if common_threshold:
+    counts = {}
+    for message_ids in shards.values():
+      for message_id in message_ids:
+        counts[message_id] = counts.get(message_id, 0) + 1
+    common = OrderedDict((message_id, True) for message_id in catalog
+                         if counts.get(message_id, 0) >= common_threshold)
+    if common:
+      for message_ids in shards.values():
+        for message_id in common:
+          message_ids.pop(message_id, None)
+      shards[COMMON_SHARD] = common
+  return OrderedDict((name, list(message_ids)) for (name, message_ids) in shards.items() if message_ids)
+
+
+def encode_bundle(locale, shard, slots_by_id, fmt="json", js_callback=DEFAULT_JS_CALLBACK):
+  if fmt not in BUNDLE_FORMATS:
+    raise Error("Unknown bundle format: {0}".format(fmt))
+  bundle = OrderedDict([("locale", locale), ("shard", shard), ("messages", slots_by_id)])
+  data = json.dumps(bundle, ensure_ascii=False, separators=(",", ":"))
+  if fmt == "js":
+    data = "{0}({1});\n".format(js_callback, data)
+  return data.encode("utf-8")
+
+
+def content_hash(data):
+  return hashlib.sha256(data).hexdigest()[:_HASH_LENGTH]
+
+
+def _write_atomically(fname, data):
+  dirname = os.path.dirname(fname)
+  os.makedirs(dirname, exist_ok=True)
+  fd, tmp_fname = tempfile.mkstemp(dir=dirname, suffix=".tmp")
+  try:
+    with os.fdopen(fd, "wb") as f:
+      f.write(data)
+    os.chmod(tmp_fname, 0o644)
+    os.replace(tmp_fname, fname)
+  except:
+    os.unlink(tmp_fname)
+    raise
+
+
+# Writes the bundles of every locale in translators (an ordered mapping of
+# locale -> translator, see translation.catalog_translator) and the manifest.
+# shards is the result of shard_message_ids.  Messages without a translation
+# fall back to the source message.  Returns the manifest.
+def write_bundles(out_dir, catalog, translators, shards, fmt="json", js_callback=DEFAULT_JS_CALLBACK):
+  message_ids = OrderedDict((message_id, True) for ids in shards.values() for message_id in ids)
+  manifest = OrderedDict()
+  for (locale, translator) in translators.items():
+    slots_by_id = {}
+    missing = 0
+    for message_id in message_ids:
+      source_message = catalog[message_id]
+      translated_message = translator(source_message)
+      if translated_message is None:
+        translated_message = source_message
+        missing += 1
+      slots_by_id[message_id] = message.message_slots(translated_message)
+    if missing:
+      logger.warning("%s: %d of %d messages have no translation", locale, missing, len(message_ids))
+    locale_manifest = manifest[locale] = OrderedDict()
+    for (shard, ids) in shards.items():
+      data = encode_bundle(locale, shard, OrderedDict((message_id, slots_by_id[message_id]) for message_id in ids),
+                           fmt=fmt, js_callback=js_callback)
+      bundle_fname = "{0}/{1}.{2}.{3}".format(locale, shard, content_hash(data), fmt)
+      path = os.path.join(out_dir, *bundle_fname.split("/"))
+      # Same name, same contents.
+      if not os.path.exists(path):
+        _write_atomically(path, data)
+      locale_manifest[shard] = bundle_fname
+  _write_atomically(os.path.join(out_dir, "manifest.json"),
+                    (json.dumps(manifest, indent=2, ensure_ascii=False) + "\n").encode("utf-8"))
+  return manifest
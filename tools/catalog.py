@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+logger = logging.getLogger(__name__)
+
+import array
+import collections.abc
+from collections import OrderedDict
+
+from . import message
+
+
+class Error(Exception):
+  pass
+
+
+# The messages of a whole source tree keyed by message ID.
+#
+# Every message is stored once no matter how often it occurs.  The occurrences
+# are kept as source references in array backed columns: per message, a flat
+# array of (file index, line) pairs where the file index points into a table of
+# interned SourceFile's.  An occurrence therefore costs 8 bytes and the memory
+# use is dominated by the number of unique messages.
+#
+# Iteration yields the message IDs in the order in which they were first added.
+class Catalog(collections.abc.Mapping):
+  def __init__(self):
+    self._messages = OrderedDict()
+    self._files = []          # file index -> SourceFile
+    self._file_indexes = {}   # filename -> file index
+    self._refs = {}           # message ID -> array of file index, line pairs
+    # file index -> dict of the IDs of the messages that occur in the file (as
+    # an ordered set) so that a file can be dropped without a scan of _refs.
+    self._ids_by_file = {}
+
+  def __getitem__(self, message_id):
+    return self._messages[message_id]
+
+  def __contains__(self, message_id):
+    return message_id in self._messages
+
+  def __iter__(self):
+    return iter(self._messages)
+
+  def __len__(self):
+    return len(self._messages)
+
+  @property
+  def files(self):
+    return [source_file for source_file in self._files if source_file is not None]
+
+  def get_file(self, filename):
+    file_index = self._file_indexes.get(filename)
+    return None if file_index is None else self._files[file_index]
+
+  # Registers (or updates the blob sha of) a source file and returns its index.
+  def add_file(self, filename, blob_sha=None):
+    file_index = self._file_indexes.get(filename)
+    if file_index is None:
+      file_index = len(self._files)
+      self._files.append(None)
+      self._file_indexes[filename] = file_index
+    self._files[file_index] = message.SourceFile(filename=filename, blob_sha=blob_sha)
+    return file_index
+
+  # Adds the message (if its ID is new) and records the occurrence, if any.
+  # Raises message.MessageIdConflictError if a different message with the
+  # same ID is already present.  Returns the message in the catalog.
+  def add_message(self, msg, filename=None, line=None):
+    msg = message.add_message(self._messages, msg)
+    if filename is not None:
+      file_index = self._file_indexes.get(filename)
+      if file_index is None:
+        file_index = self.add_file(filename)
+      self._add_reference(msg.id, file_index, line)
+    return msg
+
+  def _add_reference(self, message_id, file_index, line):
+    refs = self._refs.get(message_id)
+    if refs is None:
+      refs = self._refs[message_id] = array.array("I")
+    refs.append(file_index)
+    refs.append(line or 0)
+    file_ids = self._ids_by_file.get(file_index)
+    if file_ids is None:
+      file_ids = self._ids_by_file[file_index] = {}
+    file_ids[message_id] = None
+
+  # Adds the messages and occurrences of an extraction.FileExtraction.  On an
+  # ID conflict nothing of the extraction is added.
+  def add_extraction(self, extraction):
+    new_ids = []
+    try:
+      for msg in extraction.messages.values():
+        if msg.id not in self._messages:
+          new_ids.append(msg.id)
+        message.add_message(self._messages, msg)
+    except message.MessageIdConflictError as e:
+      for message_id in new_ids:
+        del self._messages[message_id]
+      raise message.MessageIdConflictError("{0}: {1}".format(extraction.filename, e))
+    file_index = self.add_file(extraction.filename, extraction.blob_sha)
+    for (message_id, line) in extraction.occurrences:
+      self._add_reference(message_id, file_index, line)
+
+  # Removes all occurrences in filename.  Messages that no longer occur
+  # anywhere are removed too.  Returns the IDs of the removed messages.
+  def remove_file(self, filename):
+    file_index = self._file_indexes.pop(filename, None)
+    if file_index is None:
+      return []
+    self._files[file_index] = None
+    removed_ids = []
+    for message_id in self._ids_by_file.pop(file_index, ()):
+      refs = self._refs[message_id]
+      kept = array.array("I")
+      for i in range(0, len(refs), 2):
+        if refs[i] != file_index:
+          kept.extend(refs[i:i+2])
+      if kept:
+        self._refs[message_id] = kept
+      else:
+        del self._refs[message_id]
+        del self._messages[message_id]
+        removed_ids.append(message_id)
+    return removed_ids
+
+  # Returns the list of SourceReference's of a message.
+  def sources(self, message_id):
+    refs = self._refs.get(message_id, ())
+    return [message.SourceReference(source_file=self._files[refs[i]], line=refs[i+1] or None)
+            for i in range(0, len(refs), 2)]
+
+  # Returns the IDs of the messages that occur in filename (in the order of
+  # their first occurrence in the file.)
+  def message_ids_in_file(self, filename):
+    file_index = self._file_indexes.get(filename)
+    if file_index is None:
+      return []
+    return list(self._ids_by_file.get(file_index, ()))
+
+  # Returns an OrderedDict of filename -> list of the IDs of the messages that
+  # occur in it (each ID once, in catalog order.)
+  def message_ids_by_file(self):
+    result = OrderedDict((source_file.filename, []) for source_file in self.files)
+    for message_id in self._messages:
+      refs = self._refs.get(message_id, ())
+      for file_index in sorted(set(refs[::2])):
+        result[self._files[file_index].filename].append(message_id)
+    return result
+
+
+def catalog_from_extractions(extractions):
+  catalog = Catalog()
+  for extraction in extractions:
+    catalog.add_extraction(extraction)
+  return catalog
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+logger = logging.getLogger(__name__)
+
+import io
+import json
+import hashlib
+from collections import namedtuple
+
+from . import binary_catalog
+from . import message
+
+
+class Error(Exception):
+  pass
+
+
+# Diff categories.  A message ID covers the meaning and the text (including
+# the placeholders) of a message so a message with the same ID can only have
+# changed in its comment or in the details of its placeholders (examples, tag
+# attributes.)  A message whose comment and examples both changed counts as
+# COMMENT_CHANGED since that is the change translators need to look at.
+ADDED = "added"
+REMOVED = "removed"
+COMMENT_CHANGED = "comment_changed"
+EXAMPLES_CHANGED = "examples_changed"
+UNCHANGED = "unchanged"
+
+CATEGORIES = (ADDED, REMOVED, COMMENT_CHANGED, EXAMPLES_CHANGED, UNCHANGED)
+
+# The categories that need (re)translation or review by the vendor.
+WORKLOAD_CATEGORIES = (ADDED, COMMENT_CHANGED, EXAMPLES_CHANGED)
+
+# words is the word count of the text of the message (of the old catalog for
+# REMOVED and of the new one otherwise.)  Placeholders do not count.
+DiffEntry = namedtuple("DiffEntry", ("category", "message_id", "words"))
+
+
+def count_words(parts):
+  return sum(len(part.split()) for part in parts if isinstance(part, str))
+
+
+# A catalog index maps a key derived from the message ID to a handle of the
+# message's record and supports:
+#   records(): list of (key, handle) in catalog order.
+#   lookup(key): the handle or None.
+#   content(handle): a value that is equal for two records of the same ID
+#       if and only if they do not differ in their comment and examples.
+#   message_id(handle), comment(handle), words(handle): decode the record.
+# Only the records that differ or get reported are ever decoded.
+
+
+# Index of a catalog written by binary_catalog.write_catalog, keyed by the ID
+# hashes of its hash index.  The contents are the raw records.
+class BinaryCatalogIndex(object):
+  def __init__(self, fname):
+    self.fname = fname
+    self._catalog = binary_catalog.BinaryCatalog(fname)
+    self._records = self._catalog.hashed_records()
+    self._offsets = dict(self._records)
+    if len(self._offsets) != len(self._records):
+      raise Error("{0}: ID hash collision; cannot diff this catalog".format(fname))
+
+  def close(self):
+    self._catalog.close()
+
+  def __len__(self):
+    return len(self._records)
+
+  def records(self):
+    return self._records
+
+  def keys(self):
+    return self._offsets.keys()
+
+  def lookup(self, key):
+    return self._offsets.get(key)
+
+  def content(self, record_offset):
+    return self._catalog.raw_record(record_offset)
+
+  def message_id(self, record_offset):
+    return self._catalog.record_id(record_offset)
+
+  def comment(self, record_offset):
+    return self._catalog.record_comment(record_offset)
+
+  def words(self, record_offset):
+    return count_words(message.iter_flat_parts(self._catalog.record_message(record_offset).parts))
+
+
+# Index of a JSON Lines catalog as printed by "extract_messages --format
+# jsonl", keyed by message ID.  Only the ID, a digest of the line and its
+# offset in the file are kept in memory; lines are parsed again on demand.
+class JsonLinesCatalogIndex(object):
+  # message_printer.message_json always writes the ID first.  IDs with escapes
+  # fall back to parsing the line.
+  _ID_PREFIX = b'{"id":"'
+
+  def __init__(self, fname):
+    self.fname = fname
+    self._file = io.open(fname, "rb")
+    self._records = []
+    offset = 0
+    for line in self._file:
+      if line.strip():
+        raw_id = None
+        id_end = line.find(b'"', len(self._ID_PREFIX))
+        if line.startswith(self._ID_PREFIX) and id_end > 0:
+          raw_id = line[len(self._ID_PREFIX):id_end]
+        if raw_id and b"\\" not in raw_id:
+          message_id = raw_id.decode("utf-8")
+        else:
+          message_id = self._parse_line(line, offset)["id"]
+        self._records.append((message_id, (_digest(line.rstrip(b"\r\n")), offset)))
+      offset += len(line)
+    self._handles = dict(self._records)
+
+  def close(self):
+    self._file.close()
+
+  def __len__(self):
+    return len(self._records)
+
+  def _parse_line(self, line, offset):
+    try:
+      return json.loads(line.decode("utf-8"))
+    except ValueError as e:
+      raise Error("{0}: invalid JSON at offset {1}: {2}".format(self.fname, offset, e))
+
+  def _record(self, handle):
+    offset = handle[1]
+    self._file.seek(offset)
+    return self._parse_line(self._file.readline(), offset)
+
+  def records(self):
+    return self._records
+
+  def keys(self):
+    return self._handles.keys()
+
+  def lookup(self, message_id):
+    return self._handles.get(message_id)
+
+  def content(self, handle):
+    return handle[0]
+
+  def message_id(self, handle):
+    return self._record(handle)["id"]
+
+  def comment(self, handle):
+    return self._record(handle).get("comment")
+
+  def words(self, handle):
+    return count_words(self._record(handle)["parts"])
+
+
+def _digest(data):
+  return hashlib.blake2b(data, digest_size=16).digest()
+
+
+# Opens the index of a catalog file: JSON Lines (.jsonl) or binary.
+def open_catalog_index(fname):
+  if fname.endswith(".jsonl"):
+    return JsonLinesCatalogIndex(fname)
+  try:
+    return BinaryCatalogIndex(fname)
+  except binary_catalog.Error as e:
+    raise Error(str(e))
+
+
+# Yields a DiffEntry per message of the old and new catalog indexes as it is
+# found: the messages of new in their order followed by the messages that were
+# removed from old.  UNCHANGED messages are only yielded with unchanged=True.
+#
+# The IDs present in both catalogs are found with the key indexes and their
+# records compared as a whole; only the ones that differ are decoded to tell
+# a comment change from an examples change.
+#
+# summary (if given) is updated with the number of messages and words per
+# category: {category: [messages, words]}.  Words of unchanged messages are
+# only counted with unchanged=True.
+def diff_catalogs(old, new, summary=None, unchanged=False):
+  if type(old) is not type(new):
+    raise Error("Cannot diff catalogs of different formats: {0} and {1}".format(old.fname, new.fname))
+  if summary is None:
+    summary = {}
+  for category in CATEGORIES:
+    summary.setdefault(category, [0, 0])
+  def entry(category, index, handle):
+    words = index.words(handle)
+    counts = summary[category]
+    counts[0] += 1
+    counts[1] += words
+    return DiffEntry(category, index.message_id(handle), words)
+  unchanged_counts = summary[UNCHANGED]
+  old_lookup, old_content, new_content = old.lookup, old.content, new.content
+  for (key, handle) in new.records():
+    old_handle = old_lookup(key)
+    if old_handle is None:
+      yield entry(ADDED, new, handle)
+    elif old_content(old_handle) == new_content(handle):
+      if unchanged:
+        yield entry(UNCHANGED, new, handle)
+      else:
+        unchanged_counts[0] += 1
+    elif old.message_id(old_handle) != new.message_id(handle):
+      raise Error("ID hash collision between {0} and {1}".format(old.fname, new.fname))
+    elif old.comment(old_handle) != new.comment(handle):
+      yield entry(COMMENT_CHANGED, new, handle)
+    else:
+      yield entry(EXAMPLES_CHANGED, new, handle)
+  removed = old.keys() - new.keys()
+  if removed:
+    for (key, handle) in old.records():
+      if key in removed:
+        yield entry(REMOVED, old, handle)
+
+
+def format_summary(summary, unchanged_words=True):
+  lines = ["{0:18} {1:>10} {2:>12}".format("category", "messages", "words")]
+  for category in CATEGORIES:
+    (messages, words) = summary[category]
+    if category == UNCHANGED and not unchanged_words:
+      words = "-"
+    lines.append("{0:18} {1:>10} {2:>12}".format(category, messages, words))
+  workload = [summary[category] for category in WORKLOAD_CATEGORIES]
+  lines.append("{0:18} {1:>10} {2:>12}".format(
+      "workload", sum(counts[0] for counts in workload), sum(counts[1] for counts in workload)))
+  return "\n".join(lines)
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+logger = logging.getLogger(__name__)
+
+from collections import OrderedDict
+
+import lxml.etree
+
+from . import message
+
+
+class Error(Exception):
+  pass
+
+
+# Readers and writers for the catalog exchange formats (XLIFF 1.2 and XMB/XTB.)
+#
+# All of them stream: the writers emit one message element at a time through
+# lxml.etree.xmlfile and the readers use iterparse and discard each message
+# element once it has been converted.  Memory use therefore only depends on the
+# size of the largest message and not on the size of the catalog.
+#
+# Placeholders (including the begin and end of tag pairs) are written as empty
+# elements naming the placeholder.  Readers turn the message contents back into
+# a flat list of text and placeholder names and rebuild the translated message
+# against the source message with the same ID (see build_translated_message.)
+
+XLIFF_NS = "urn:oasis:names:tc:xliff:document:1.2"
+_XLIFF = "{%s}" % XLIFF_NS
+
+
+# Placeholder reference used while rebuilding translated messages.
+class PlaceholderName(object):
+  __slots__ = ("name",)
+
+  def __init__(self, name):
+    self.name = name
+
+  def __repr__(self):
+    return "PlaceholderName(%r)" % self.name
+
+
+# Rebuilds a translated message from tokens (an iterable of text and
+# PlaceholderName) using the placeholders of source_message.  The tag pairs of
+# the translation must nest properly but may otherwise move around.
+def build_translated_message(source_message, tokens):
+  placeholders = source_message.placeholders_by_name
+  parts = []
+  stack = []  # of (tag_pair, enclosing parts)
+  for token in tokens:
+    if isinstance(token, str):
+      if not token:
+        continue
+      if parts and isinstance(parts[-1], str):
+        parts[-1] += token
+      else:
+        parts.append(token)
+      continue
+    placeholder = placeholders.get(token.name)
+    if placeholder is None:
+      raise Error("Message id={0}: unknown placeholder {1}".format(source_message.id, token.name))
+    if isinstance(placeholder, message.TagPairBeginRef):
+      stack.append((placeholder.html_tag_pair, parts))
+      parts = []
+    elif isinstance(placeholder, message.TagPairEndRef):
+      if not stack or stack[-1][0] is not placeholder.html_tag_pair:
+        raise Error("Message id={0}: unexpected {1}".format(source_message.id, token.name))
+      (tag_pair, enclosing_parts) = stack.pop()
+      enclosing_parts.append(tag_pair.copy_with_parts(parts))
+      parts = enclosing_parts
+    else:
+      parts.append(placeholder)
+  if stack:
+    raise Error("Message id={0}: {1} is never closed".format(
+        source_message.id, stack[-1][0].ph_begin.name))
+  return message.Message(id=source_message.id,
+                         meaning=source_message.meaning,
+                         comment=source_message.comment,
+                         parts=parts,
+                         placeholders_by_name=placeholders)
+
+
+# Appends the message parts as mixed content to elem.  make_placeholder(elem,
+# name, placeholder) must append and return the element for a placeholder.
+def _append_parts(elem, parts, make_placeholder):
+  last = None
+  for part in message.iter_flat_parts(parts):
+    if not isinstance(part, str):
+      last = make_placeholder(elem, *part)
+    elif last is None:
+      elem.text = (elem.text or "") + part
+    else:
+      last.tail = (last.tail or "") + part
+
+
+# Yields the mixed content of elem as text and PlaceholderName tokens.
+# get_name(child) returns the placeholder name of a child element.
+def _iter_tokens(elem, get_name):
+  if elem.text:
+    yield elem.text
+  for child in elem:
+    if isinstance(child.tag, str):
+      yield PlaceholderName(get_name(child))
+    if child.tail:
+      yield child.tail
+
+
+def _build_or_report(source_message, tokens, on_error):
+  if on_error is None:
+    return build_translated_message(source_message, tokens)
+  try:
+    return build_translated_message(source_message, tokens)
+  except Error as e:
+    on_error(source_message.id, e)
+    return None
+
+
+def _free_element(elem):
+  elem.clear()
+  while elem.getprevious() is not None:
+    del elem.getparent()[0]
+
+
+# ---------------------------------------------------------------------------
+# XLIFF 1.2
+
+def _placeholder_ctype(placeholder):
+  if isinstance(placeholder, (message.TagPairBeginRef, message.TagPairEndRef)):
+    return "x-" + placeholder.html_tag_pair.tag
+  return None
+
+
+# The units are built without a namespace and written inside the <body> that
+# declares XLIFF_NS as the default namespace.  Elements of XLIFF_NS written with
+# xmlfile.write each repeat the xmlns declaration; unqualified elements inherit
+# the default namespace of the enclosing element in the output instead.
+def _make_xliff_placeholder(elem, name, placeholder):
+  x = lxml.etree.SubElement(elem, "x", id=name)
+  ctype = _placeholder_ctype(placeholder)
+  if ctype:
+    x.set("ctype", ctype)
+  equiv_text = placeholder.text if not isinstance(placeholder, message.NgExpr) else placeholder.unparse()
+  if equiv_text:
+    x.set("equiv-text", equiv_text)
+  return x
+
+
+def _xliff_trans_unit(msg, translated_message):
+  unit = lxml.etree.Element("trans-unit", id=msg.id, datatype="html")
+  source = lxml.etree.SubElement(unit, "source")
+  _append_parts(source, msg.parts, _make_xliff_placeholder)
+  if translated_message is not None:
+    target = lxml.etree.SubElement(unit, "target")
+    _append_parts(target, translated_message.parts, _make_xliff_placeholder)
+  for (source_name, text) in (("description", msg.comment), ("meaning", msg.meaning)):
+    if text:
+      note = lxml.etree.SubElement(unit, "note", priority="1")
+      note.set("from", source_name)
+      note.text = text
+  return unit
+
+
+# Writes messages (an iterable of Message) to out (a filename or binary file
+# object.)  If translations (a mapping of message ID to translated Message) is
+# given, the translations are written as <target> elements.
+def write_xliff(out, messages, source_language="en", target_language=None,
+                translations=None, original="ng.template"):
+  file_attrib = {"source-language": source_language, "datatype": "plaintext",
+                 "original": original}
+  if target_language:
+    file_attrib["target-language"] = target_language
+  with lxml.etree.xmlfile(out, encoding="utf-8") as xf:
+    xf.write_declaration()
+    with xf.element(_XLIFF + "xliff", version="1.2", nsmap={None: XLIFF_NS}):
+      with xf.element(_XLIFF + "file", file_attrib):
+        with xf.element(_XLIFF + "body"):
+          for msg in messages:
+            translated_message = translations.get(msg.id) if translations is not None else None
+            xf.write(_xliff_trans_unit(msg, translated_message), pretty_print=True)
+
+
+# Yields the translated messages (the <target> of each <trans-unit>) from the
+# XLIFF file source.  source_messages maps message IDs to the source messages
+# (e.g. a BinaryCatalog.)  Units without a target or without a known source
+# message are skipped.  Units that cannot be rebuilt against their source
+# message raise Error unless on_error is given; on_error(message_id, error) is
+# then called and the unit skipped.
+def read_xliff(source, source_messages, on_error=None):
+  for (message_id, tokens) in iter_xliff_tokens(source, source_messages):
+    translated_message = _build_or_report(source_messages[message_id], tokens, on_error)
+    if translated_message is not None:
+      yield translated_message
+
+
+# Yields (message ID, tokens) for the units of an XLIFF file source whose ID is
+# in message_ids (any container, e.g. a mapping of message ID -> source
+# Message.)  The tokens are a list of text and PlaceholderName (see
+# build_translated_message.)
+def iter_xliff_tokens(source, message_ids):
+  for (event, unit) in lxml.etree.iterparse(source, events=("end",), tag=_XLIFF + "trans-unit"):
+    message_id = unit.get("id")
+    target = unit.find(_XLIFF + "target")
+    if target is None:
+      pass
+    elif message_id not in message_ids:
+      logger.warning("Skipping translation of unknown message id=%s", message_id)
+    else:
+      yield (message_id, list(_iter_tokens(target, lambda x: x.get("id"))))
+    _free_element(unit)
+
+
+# ---------------------------------------------------------------------------
+# XMB (messages for translation) and XTB (translations.)
+
+def _make_xmb_placeholder(elem, name, placeholder):
+  ph = lxml.etree.SubElement(elem, "ph", name=name)
+  original = placeholder.text if not isinstance(placeholder, message.NgExpr) else placeholder.unparse()
+  if placeholder.examples:
+    ex = lxml.etree.SubElement(ph, "ex")
+    ex.text = placeholder.examples[0]
+    ex.tail = original
+  else:
+    ph.text = original
+  return ph
+
+
+def _xmb_msg(msg):
+  attrib = {"id": msg.id}
+  if msg.comment:
+    attrib["desc"] = msg.comment
+  if msg.meaning:
+    attrib["meaning"] = msg.meaning
+  elem = lxml.etree.Element("msg", attrib)
+  _append_parts(elem, msg.parts, _make_xmb_placeholder)
+  return elem
+
+
+def write_xmb(out, messages):
+  with lxml.etree.xmlfile(out, encoding="utf-8") as xf:
+    xf.write_declaration()
+    with xf.element("messagebundle"):
+      for msg in messages:
+        xf.write(_xmb_msg(msg), pretty_print=True)
+
+
+def _make_xtb_placeholder(elem, name, placeholder):
+  return lxml.etree.SubElement(elem, "ph", name=name)
+
+
+def _xtb_translation(translated_message):
+  elem = lxml.etree.Element("translation", id=translated_message.id)
+  _append_parts(elem, translated_message.parts, _make_xtb_placeholder)
+  return elem
+
+
+# Writes translations (an iterable of translated Message) to out as the XTB file
+# of the language lang.  Placeholders are written as empty <ph> elements.
+def write_xtb(out, translations, lang):
+  with lxml.etree.xmlfile(out, encoding="utf-8") as xf:
+    xf.write_declaration()
+    xf.write_doctype("<!DOCTYPE translationbundle>")
+    with xf.element("translationbundle", lang=lang):
+      for translated_message in translations:
+        xf.write(_xtb_translation(translated_message), pretty_print=True)
+
+
+# Yields the messages in an XMB (<msg>) or XTB (<translation>) file rebuilt
+# against source_messages.  For XMB files, this is mostly useful for round
+# tripping; the vendors return translations as XTB files.  on_error as for
+# read_xliff.
+def read_xmb(source, source_messages, on_error=None):
+  for (message_id, tokens) in iter_xmb_tokens(source, source_messages):
+    translated_message = _build_or_report(source_messages[message_id], tokens, on_error)
+    if translated_message is not None:
+      yield translated_message
+
+
+# Yields (message ID, tokens) for the messages of an XMB or XTB file source
+# whose ID is in message_ids, as iter_xliff_tokens.
+def iter_xmb_tokens(source, message_ids):
+  for (event, elem) in lxml.etree.iterparse(source, events=("end",), tag=("msg", "translation")):
+    message_id = elem.get("id")
+    if message_id not in message_ids:
+      logger.warning("Skipping translation of unknown message id=%s", message_id)
+    else:
+      yield (message_id, list(_iter_tokens(elem, lambda ph: ph.get("name"))))
+    _free_element(elem)
+
+
+# ---------------------------------------------------------------------------
+
+# Reads the translations in fname (XLIFF or XTB, by extension) into an
+# OrderedDict of message ID -> translated Message.  on_error as for read_xliff.
+def read_translations(fname, source_messages, on_error=None):
+  if fname.endswith(".xtb"):
+    messages = read_xmb(fname, source_messages, on_error=on_error)
+  elif fname.endswith((".xlf", ".xliff")):
+    messages = read_xliff(fname, source_messages, on_error=on_error)
+  else:
+    raise Error("Unknown translation file format: {0}".format(fname))
+  return OrderedDict((msg.id, msg) for msg in messages)
+
+
+# Reads the translations in fname whose ID is in message_ids into an
+# OrderedDict of message ID -> tokens without rebuilding them against the
+# source messages (see build_translated_message.)
+def read_translation_tokens(fname, message_ids):
+  if fname.endswith(".xtb"):
+    tokens = iter_xmb_tokens(fname, message_ids)
+  elif fname.endswith((".xlf", ".xliff")):
+    tokens = iter_xliff_tokens(fname, message_ids)
+  else:
+    raise Error("Unknown translation file format: {0}".format(fname))
+  return OrderedDict(tokens)
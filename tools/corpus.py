@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import io
+import random
+from collections import OrderedDict
+
+
+class Error(Exception):
+  pass
+
+
+# Seeded generator of synthetic HTML templates for benchmarks.  The same
+# parameters and seed always produce the same corpus.
+
+WORDS = ("the quick brown fox jumps over lazy dog hello world your account "
+         "settings profile message inbox search results page next previous "
+         "save cancel delete confirm welcome back sign in out").split()
+
+TAGS = ("b", "i", "em", "strong", "span", "a")
+
+CONTAINER_TAGS = ("div", "section", "article", "ul", "form")
+
+
+# The knobs of a synthetic corpus.
+#   num_files: number of templates.
+#   elements_per_file: number of leaf elements (paragraphs, list items, ...)
+#   i18n_density: fraction of the leaf elements that are i18n messages.
+#   depth: nesting depth of the container elements around the leaves.
+#   num_expressions: {{ }} expressions per message.
+#   num_tags: (possibly nested) HTML tags per message.
+#   num_attributes: plain attributes per element.  The same fraction
+#       (i18n_density) of leaves also gets a translatable title attribute.
+#   words_per_message: approximate number of words per message.
+DEFAULT_OPTIONS = OrderedDict([
+    ("num_files", 100),
+    ("elements_per_file", 200),
+    ("i18n_density", 0.3),
+    ("depth", 4),
+    ("num_expressions", 1),
+    ("num_tags", 1),
+    ("num_attributes", 2),
+    ("words_per_message", 8),
+])
+
+
+def _synthetic_words(rng, num_words):
+  return " ".join(rng.choice(WORDS) for i in range(num_words))
+
+
+# Returns the inner HTML of a message with roughly num_words words,
+# num_expressions {{ }} expressions and num_tags (possibly nested) tags.
+def synthetic_message_html(rng, num_words=8, num_expressions=1, num_tags=1):
+  chunks = [_synthetic_words(rng, max(1, num_words // (num_expressions + num_tags + 1)))
+            for i in range(num_expressions + num_tags + 1)]
+  for i in range(num_expressions):
+    chunks[rng.randrange(len(chunks))] += " {{%s.%s}} " % (rng.choice(WORDS), rng.choice(WORDS))
+  for i in range(num_tags):
+    tag = rng.choice(TAGS)
+    attrs = ' href="/%s"' % rng.choice(WORDS) if tag == "a" else ""
+    start = rng.randrange(len(chunks))
+    end = rng.randrange(start, len(chunks))
+    chunks[start] = "<%s%s>%s" % (tag, attrs, chunks[start])
+    chunks[end] = "%s</%s>" % (chunks[end], tag)
+  return " ".join(chunks)
+
+
+def _synthetic_attributes(rng, num_attributes):
+  return "".join(' data-%s="%s"' % (WORDS[i % len(WORDS)], rng.choice(WORDS))
+                 for i in range(num_attributes))
+
+
+def _synthetic_leaf(rng, options):
+  attrs = _synthetic_attributes(rng, options["num_attributes"])
+  if rng.random() < options["i18n_density"]:
+    attrs += ' title="%s" i18n-title="Tooltip"' % _synthetic_words(rng, 3)
+  if rng.random() < options["i18n_density"]:
+    return '<p%s i18n="%s">%s</p>' % (
+        attrs, _synthetic_words(rng, 3),
+        synthetic_message_html(rng, num_words=options["words_per_message"],
+                               num_expressions=options["num_expressions"],
+                               num_tags=options["num_tags"]))
+  return '<p%s>%s</p>' % (attrs, _synthetic_words(rng, options["words_per_message"]))
+
+
+def _write_tree(rng, out, depth, num_leaves, options):
+  if depth <= 0 or num_leaves <= 1:
+    for i in range(num_leaves):
+      out.append(_synthetic_leaf(rng, options))
+    return
+  num_children = min(num_leaves, rng.randint(2, 4))
+  per_child = num_leaves // num_children
+  for i in range(num_children):
+    child_leaves = per_child if i < num_children - 1 else num_leaves - per_child * (num_children - 1)
+    tag = rng.choice(CONTAINER_TAGS)
+    out.append("<%s%s>\n" % (tag, _synthetic_attributes(rng, options["num_attributes"])))
+    _write_tree(rng, out, depth - 1, child_leaves, options)
+    out.append("</%s>\n" % tag)
+
+
+# Returns DEFAULT_OPTIONS updated with the options in the dict kwargs.
+def corpus_options(kwargs):
+  unknown = set(kwargs) - set(DEFAULT_OPTIONS)
+  if unknown:
+    raise Error("Unknown corpus options: {0}".format(", ".join(sorted(unknown))))
+  options = OrderedDict(DEFAULT_OPTIONS)
+  options.update(kwargs)
+  return options
+
+
+# Returns the HTML of a single synthetic template.
+def synthetic_document(rng, **kwargs):
+  options = corpus_options(kwargs)
+  out = ['<!DOCTYPE html>\n<html>\n<head>\n<title i18n="Page title">%s</title>\n</head>\n<body>\n'
+         % _synthetic_words(rng, 3)]
+  _write_tree(rng, out, options["depth"], options["elements_per_file"], options)
+  out.append("</body>\n</html>\n")
+  return "".join(out)
+
+
+# Writes a corpus of options["num_files"] templates to dest_dir and returns
+# their filenames.
+def generate_corpus(dest_dir, seed=0, **kwargs):
+  options = corpus_options(kwargs)
+  document_options = OrderedDict((k, v) for (k, v) in options.items() if k != "num_files")
+  rng = random.Random(seed)
+  fnames = []
+  for i in range(options["num_files"]):
+    subdir = os.path.join(dest_dir, "d%02d" % (i % 16))
+    os.makedirs(subdir, exist_ok=True)
+    fname = os.path.join(subdir, "template%05d.html" % i)
+    with io.open(fname, "wt", encoding="utf-8") as f:
+      f.write(synthetic_document(rng, **document_options))
+    fnames.append(fname)
+  return fnames
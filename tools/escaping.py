@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class Error(Exception):
+  pass
+
+
+# Escaping Contexts.
+# A message can be either plain text, html text (whitespace coalescing doesn't
+# change the fingerprint) or HTML dom nodes.
+# The escaping context is the surrounding context in which the message appears.
+# For instance, the following two messages wlll be considered identical and
+# only translated once.
+#   1. <!--i18n-->1,"2",3<!--/i18n-->
+#   2. <foo bar="1,&quot;,2,&quot;3" i18n-bar>
+# However, they will be escaped differently when they are substituted back into
+# the DOM (the attribute will need to be escaped for use in as an attribute.)
+CONTEXT_RAW = 0
+CONTEXT_HTML = 1
+CONTEXT_ATTRIBUTE_VALUE = 2
+
+CONTEXTS = (CONTEXT_RAW, CONTEXT_HTML, CONTEXT_ATTRIBUTE_VALUE)
+
+# The escapers replace the same characters cgi.escape used to replace without
+# and with quote=True.
+#
+# Most text needs no escaping at all so the escapers first check for the
+# special characters (a handful of C level scans) and return such text as is.
+# Chained str.replace is much faster than str.translate (or re.sub) for the
+# text that does need escaping.
+def escape_html(text):
+  if "&" in text or "<" in text or ">" in text:
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+  return text
+
+
+def escape_attribute_value(text):
+  if "&" in text or "<" in text or ">" in text or '"' in text:
+    return (text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+            .replace('"', "&quot;"))
+  return text
+
+
+_ESCAPERS = {
+    CONTEXT_RAW: lambda text: text,
+    CONTEXT_HTML: escape_html,
+    CONTEXT_ATTRIBUTE_VALUE: escape_attribute_value,
+}
+
+
+def escaper(escaping_context):
+  try:
+    return _ESCAPERS[escaping_context]
+  except KeyError:
+    raise Error("Unknown escaping context: {0}".format(escaping_context))
+
+
+def escape(text, escaping_context):
+  return escaper(escaping_context)(text)
+
+
+# Returns the text of a message.Message for substitution in escaping_context.
+# The text parts are escaped for the context; tag pairs and placeholders
+# unparse themselves (tag pairs escape their own contents.)
+def escape_message(msg, escaping_context):
+  escape_text = escaper(escaping_context)
+  return "".join(escape_text(part) if isinstance(part, str) else part.unparse()
+                 for part in msg.parts)
+
+
+# Escaped message texts keyed by (message id, escaping context) so that a
+# message that is substituted over and over again is only escaped once per
+# context.  Only valid for a single locale.
+class EscapedMessageCache(object):
+  def __init__(self):
+    self._escaped = {}
+
+  def get(self, message_id, escaping_context):
+    return self._escaped.get((message_id, escaping_context))
+
+  def add(self, message_id, msg, escaping_context):
+    text = escape_message(msg, escaping_context)
+    self._escaped[(message_id, escaping_context)] = text
+    return text
+
+  def __len__(self):
+    return len(self._escaped)
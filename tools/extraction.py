@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import io
+import glob
+import fnmatch
+import time
+import concurrent.futures
+from collections import namedtuple
+
+import lxml.html
+import lxml.etree
+
+from . import message
+from . import catalog
+from . import fingerprint
+from . import extraction_cache
+from . import metrics
+
+
+class Error(Exception):
+  pass
+
+
+DEFAULT_PATTERNS = ("*.html",)
+
+# Result of extracting the messages from a single template.
+#   filename: the path as given to extract_files.
+#   messages: OrderedDict of message ID -> Message as returned by parse_messages.
+#   elapsed: seconds spent parsing the file and building its messages (or
+#       loading them from the extraction cache.)
+#   occurrences: list of (message ID, line number) for every occurrence of a
+#       message in the file (in the order parse_messages visits them.)
+#   blob_sha: git blob SHA1 of the file contents that were extracted.
+#   cached: True if the messages came from the extraction cache.
+FileExtraction = namedtuple("FileExtraction",
+                            ("filename", "messages", "occurrences", "elapsed", "blob_sha", "cached"))
+
+
+# Records where each message occurs.
+class SourceLineRecorder(message.OnParseBase):
+  def __init__(self):
+    self.occurrences = []
+
+  def on_attrib(self, message, node, attr):
+    self.occurrences.append((message.id, node.sourceline))
+
+  def on_node(self, message, node):
+    self.occurrences.append((message.id, node.sourceline))
+
+
+def extract_messages_from_html_file(fname):
+  with metrics.active().phase("html_parse"):
+    doc = lxml.html.parse(fname)
+  return message.parse_messages(doc.getroot())
+
+
+# Returns (messages, occurrences) for the HTML document in data.
+def extract_occurrences_from_html_bytes(data):
+  with metrics.active().phase("html_parse"):
+    doc = lxml.html.parse(io.BytesIO(data))
+  recorder = SourceLineRecorder()
+  messages = message.parse_messages(doc.getroot(), on_parse=recorder)
+  return (messages, recorder.occurrences)
+
+
+# Lazily yields the messages of a template without building the whole tree.
+# See message.iter_messages for the differences to parse_messages.
+def iter_messages_from_html_file(fname):
+  events = lxml.etree.iterparse(fname, events=("start", "end"), html=True)
+  return message.iter_messages(events)
+
+
+def _read_file(fname):
+  with io.open(fname, "rb") as f:
+    return f.read()
+
+
+# Runs in the worker processes so it must be a picklable module level function.
+# data is the contents of the file if the caller has already read them.
+def _extract_file(fname, data=None):
+  start = time.perf_counter()
+  if data is None:
+    data = _read_file(fname)
+  (messages, occurrences) = extract_occurrences_from_html_bytes(data)
+  return FileExtraction(filename=fname, messages=messages, occurrences=occurrences,
+                        elapsed=time.perf_counter() - start,
+                        blob_sha=extraction_cache.blob_sha(data), cached=False)
+
+
+# Returns (FileExtraction or None, contents of the file.)  The contents are
+# handed on to _extract_file on a miss so that the file is only read once.
+def _lookup_cached_file(fname, cache):
+  start = time.perf_counter()
+  data = _read_file(fname)
+  sha = extraction_cache.blob_sha(data)
+  cached = cache.get(sha)
+  if cached is None:
+    return (None, data)
+  (messages, occurrences) = cached
+  return (FileExtraction(filename=fname, messages=messages, occurrences=occurrences,
+                         elapsed=time.perf_counter() - start,
+                         blob_sha=sha, cached=True), data)
+
+
+def _matches(fname, patterns):
+  return any(fnmatch.fnmatch(fname, pattern) for pattern in patterns)
+
+
+# Expands the paths into a sorted list of template filenames.  Each path may be
+# a file (used as is), a directory (walked recursively for files matching one
+# of patterns) or a glob pattern (which may use ** to match subdirectories.)
+# The result is sorted so that the order (and hence the merged catalog) does
+# not depend on the file system.  walked_dirs (if given) is a set that the
+# absolute paths of the walked directories are added to.
+def find_template_files(paths, patterns=DEFAULT_PATTERNS, walked_dirs=None):
+  fnames = set()
+  for path in paths:
+    if os.path.isdir(path):
+      for (dirpath, dirnames, filenames) in os.walk(path):
+        if walked_dirs is not None:
+          walked_dirs.add(os.path.abspath(dirpath))
+        fnames.update(os.path.join(dirpath, fname)
+                      for fname in filenames if _matches(fname, patterns))
+    elif os.path.exists(path):
+      fnames.add(path)
+    else:
+      matches = glob.glob(path, recursive=True)
+      if not matches:
+        raise Error("No such file, directory or glob match: {0}".format(path))
+      fnames.update(fname for fname in matches if os.path.isfile(fname))
+  return sorted(fnames)
+
+
+# Yields a FileExtraction per filename in the same order as filenames.  The
+# files are parsed on a pool of jobs worker processes (defaults to the number
+# of CPUs.)  With jobs=1 or a single file, everything happens in this process.
+#
+# If an ExtractionCache is given, only the files whose contents are not in the
+# cache are parsed and their results are added to the cache.
+def extract_files(fnames, jobs=None, cache=None):
+  fnames = list(fnames)
+  if cache is None:
+    for extraction in _extract_files(fnames, jobs):
+      yield extraction
+    return
+  cached = {}
+  contents = {}
+  for fname in fnames:
+    (extraction, data) = _lookup_cached_file(fname, cache)
+    if extraction is not None:
+      cached[fname] = extraction
+    else:
+      contents[fname] = data
+  logger.debug("Extraction cache: %d of %d files unchanged", len(cached), len(fnames))
+  missed = [fname for fname in fnames if fname not in cached]
+  fresh = _extract_files(missed, jobs, [contents.pop(fname) for fname in missed])
+  for fname in fnames:
+    extraction = cached.get(fname)
+    if extraction is None:
+      extraction = next(fresh)
+      cache.put(extraction.blob_sha, (extraction.messages, extraction.occurrences))
+    yield extraction
+
+
+# contents (if given) lists the contents of each of fnames.
+def _extract_files(fnames, jobs, contents=None):
+  if contents is None:
+    contents = [None] * len(fnames)
+  if jobs is None:
+    jobs = os.cpu_count() or 1
+  jobs = min(jobs, len(fnames))
+  if jobs <= 1:
+    for (fname, data) in zip(fnames, contents):
+      yield _extract_file(fname, data)
+    return
+  # Keep the per task overhead low for large trees of small templates but
+  # still give every worker several chunks to balance out large files.
+  chunksize = max(1, len(fnames) // (jobs * 8))
+  with concurrent.futures.ProcessPoolExecutor(
+      max_workers=jobs, initializer=fingerprint.set_default_version,
+      initargs=(fingerprint.default_version(),)) as executor:
+    for extraction in executor.map(_extract_file, fnames, contents, chunksize=chunksize):
+      yield extraction
+
+
+# Merges the per file results into a single catalog.Catalog keyed by message
+# ID.  Merging happens in the order of extractions (extract_files preserves the
+# order of its input) which keeps the result deterministic regardless of which
+# worker finished first.  Raises message.MessageIdConflictError on conflicts.
+def merge_extractions(extractions):
+  return catalog.catalog_from_extractions(extractions)
+
+
+def log_timings(extractions, total_elapsed=None):
+  for extraction in extractions:
+    logger.info("%8.2f ms  %4d messages  %s%s", extraction.elapsed * 1000,
+                len(extraction.messages), extraction.filename,
+                " (cached)" if extraction.cached else "")
+  cpu_elapsed = sum(extraction.elapsed for extraction in extractions)
+  num_cached = sum(1 for extraction in extractions if extraction.cached)
+  logger.info("%d files (%d cached), %.2f s parse time%s", len(extractions), num_cached, cpu_elapsed,
+              "" if total_elapsed is None else ", %.2f s wall time" % total_elapsed)
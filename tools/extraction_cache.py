@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import io
+import errno
+import pickle
+import hashlib
+import tempfile
+
+from . import fingerprint
+
+
+class Error(Exception):
+  pass
+
+
+# Bump this when the on disk layout or the pickled payload changes.
+CACHE_FORMAT_VERSION = 4
+
+
+# The git blob SHA1 of the file contents (i.e. "git hash-object FILE").  Using
+# the same hash as git means the key can also serve as a source reference.
+def blob_sha(data):
+  hasher = hashlib.sha1(b"blob %d\0" % len(data))
+  hasher.update(data)
+  return hasher.hexdigest()
+
+
+# Persistent cache of the messages extracted from a template, keyed by the
+# content hash of the template.  Entries live under a directory named after
+# the cache format and fingerprint versions so that changing either one simply
+# starts a new (empty) cache instead of returning stale message IDs.
+#
+#   CACHE_DIR/v<CACHE_FORMAT_VERSION>-f<fingerprint scheme version>/ab/abcdef....pickle
+class ExtractionCache(object):
+  def __init__(self, cache_dir):
+    self.version_stamp = "v{0}-f{1}".format(CACHE_FORMAT_VERSION, fingerprint.default_version())
+    self.cache_dir = cache_dir
+    self._root = os.path.join(cache_dir, self.version_stamp)
+    self.hits = 0
+    self.misses = 0
+
+  def _path(self, sha):
+    return os.path.join(self._root, sha[:2], sha + ".pickle")
+
+  # Returns the cached (messages, occurrences) of the blob or None.
+  def get(self, sha):
+    try:
+      with io.open(self._path(sha), "rb") as f:
+        version_stamp, value = pickle.load(f)
+    except (IOError, OSError) as e:
+      if e.errno != errno.ENOENT:
+        logger.warning("Ignoring unreadable cache entry %s: %s", sha, e)
+      self.misses += 1
+      return None
+    except (pickle.UnpicklingError, EOFError, ValueError, TypeError) as e:
+      logger.warning("Ignoring corrupt cache entry %s: %s", sha, e)
+      self.misses += 1
+      return None
+    if version_stamp != self.version_stamp:
+      self.misses += 1
+      return None
+    self.hits += 1
+    return value
+
+  # Writes are atomic (write to a temporary file and rename) so that
+  # concurrent extraction runs never observe partially written entries.
+  def put(self, sha, value):
+    path = self._path(sha)
+    dirname = os.path.dirname(path)
+    os.makedirs(dirname, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=dirname, suffix=".tmp")
+    try:
+      with os.fdopen(fd, "wb") as f:
+        pickle.dump((self.version_stamp, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+      os.replace(tmp_path, path)
+    except BaseException:
+      os.unlink(tmp_path)
+      raise
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+logger = logging.getLogger(__name__)
+
+import hashlib
+from collections import OrderedDict
+
+from . import message
+
+
+class Error(Exception):
+  pass
+
+
+# Message fingerprinting.
+#
+# Fingerprinting requires unique digests for unique messages.  The approach is
+# to construct a unique long string for unique messages and use a fixed and
+# good fingerprinting algorithm to get a smaller digest out of it (64/128 bits
+# should be sufficient.)
+#
+# A FingerprintScheme fixes both the serialization and the digest.  Every scheme
+# has a version which is stamped on anything that persists message IDs (the
+# extraction cache, binary catalogs.)  Existing schemes must never change;
+# add a new version instead.
+#
+#   1: md5 (the original scheme.)
+#   2: blake2b with a 128 bit digest (same ID length as md5 but faster.)
+
+# Escape sequences used in generating the unique long string per message.
+ESCAPE_CHAR = "\x10"
+ESCAPE_END = ESCAPE_CHAR + "."
+BEGIN_TEXT = ESCAPE_CHAR + "'"
+BEGIN_PH = ESCAPE_CHAR + "X"
+BEGIN_TAG = ESCAPE_CHAR + "<"
+END_TAG = ESCAPE_CHAR + ">"
+
+_ESCAPED_ESCAPE_CHAR = ESCAPE_CHAR + ESCAPE_CHAR
+
+
+def _escape_text_for_message_id(text):
+  if ESCAPE_CHAR not in text:
+    return text
+  return text.replace(ESCAPE_CHAR, _ESCAPED_ESCAPE_CHAR)
+
+
+# Only explicit placeholder names contribute to the ID.  MessageBuilder computes
+# the ID before the PlaceholderRegistry makes up the remaining names so those
+# have always been serialized as None.  Treating auto named placeholders the
+# same way keeps the IDs of already built messages stable when they are
+# fingerprinted again (e.g. by recompute_ids.)
+def _id_name(placeholder):
+  return None if placeholder.auto_named else placeholder.name
+
+
+# Sort the unnamed (None) placeholders first instead of failing on the
+# comparison with a str.
+def _placeholder_sort_key(name):
+  return (name is not None, name or "")
+
+
+# Serializes messages into the unique long strings that are hashed.  One list
+# of chunks is reused for every message and the placeholder and tag pair
+# headers are formatted once per serializer, so a serializer that is reused for
+# a batch of messages (see FingerprintScheme.iter_ids) formats each distinct
+# header only once.
+class _Serializer(object):
+  __slots__ = ("_chunks", "_headers")
+
+  def __init__(self):
+    self._chunks = []
+    self._headers = {}
+
+  def _header(self, prefix, name, part):
+    key = (prefix, name, type(part))
+    header = self._headers.get(key)
+    if header is None:
+      header = self._headers[key] = "{0}{1},{2}{3}".format(prefix, name, type(part).__name__, ESCAPE_END)
+    return header
+
+  # Appends the serialization of parts to the chunks (append is their append
+  # method.)
+  def _serialize_parts(self, parts, append):
+    placeholders = None
+    for part in parts:
+      if isinstance(part, str):
+        append(BEGIN_TEXT)
+        append(part if ESCAPE_CHAR not in part else part.replace(ESCAPE_CHAR, _ESCAPED_ESCAPE_CHAR))
+        append(ESCAPE_END)
+      elif isinstance(part, message.Placeholder):
+        if placeholders is None:
+          placeholders = {}
+        placeholders[_id_name(part)] = part
+      elif isinstance(part, message.TagPair):
+        append(self._header(BEGIN_TAG, _id_name(part.ph_begin), part))
+        self._serialize_parts(part.parts, append)
+      else:
+        raise Error("Encountered unknown message part type while computing message ID: {0}".format(type(part)))
+    if placeholders:
+      header = self._header
+      for name in sorted(placeholders, key=_placeholder_sort_key):
+        append(header(BEGIN_PH, name, placeholders[name]))
+
+  # Returns the unique long string for a message encoded as UTF-8.  The chunks
+  # are joined and encoded once at the end.
+  #
+  # The comment does not contribute to the hash.
+  # Placeholders are allowed to move around so their order should not change the ID.
+  # TagPair's (HtmlTagPair) nesting should be preserved.  They can't be
+  #   removed.  Placeholders inside tag pairs may be reordered.  However,
+  #   you shouldn't introduce new placeholders or increase/decrease their count.
+  #   TODO: pluralization is a different beast wrt placeholders.
+  # TODO: Incorporate namespace/"project ID"?
+  def serialize(self, meaning, parts):
+    chunks = self._chunks
+    chunks.clear()
+    chunks.append(_escape_text_for_message_id(meaning or ""))
+    self._serialize_parts(parts, chunks.append)
+    return "".join(chunks).encode("utf-8")
+
+
+class FingerprintScheme(object):
+  version = None
+  name = None
+
+  def serialize(self, meaning, parts):
+    return _Serializer().serialize(meaning, parts)
+
+  def digest(self, data):
+    raise NotImplementedError("Override in subclass")
+
+  def compute_id(self, meaning, parts):
+    return self.digest(self.serialize(meaning, parts))
+
+  # Yields (message, ID computed by this scheme) for every message.  The
+  # messages share one serializer (see _Serializer.)
+  def iter_ids(self, messages):
+    serialize = _Serializer().serialize
+    digest = self.digest
+    for msg in messages:
+      yield (msg, digest(serialize(msg.meaning, msg.parts)))
+
+
+class Md5Scheme(FingerprintScheme):
+  version = 1
+  name = "md5"
+
+  def digest(self, data):
+    return hashlib.md5(data).hexdigest()
+
+
+class Blake2bScheme(FingerprintScheme):
+  version = 2
+  name = "blake2b"
+
+  def digest(self, data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+SCHEMES = OrderedDict((scheme.version, scheme) for scheme in (Md5Scheme(), Blake2bScheme()))
+
+DEFAULT_VERSION = Md5Scheme.version
+
+_default_scheme = SCHEMES[DEFAULT_VERSION]
+
+
+def get_scheme(version=None):
+  if version is None:
+    return _default_scheme
+  scheme = SCHEMES.get(version)
+  if scheme is None:
+    raise Error("Unknown fingerprint scheme version: {0}".format(version))
+  return scheme
+
+
+# Selects the scheme used by MessageBuilder.  This is process wide state; worker
+# processes need to call this too (see extraction.extract_files.)
+def set_default_version(version):
+  global _default_scheme
+  _default_scheme = get_scheme(version)
+
+
+def default_version():
+  return _default_scheme.version
+
+
+def compute_id(meaning, parts, version=None):
+  return get_scheme(version).compute_id(meaning, parts)
+
+
+# Yields (old ID, message with its ID computed by the given scheme) for every
+# message.  The new messages share their parts and placeholders with the old
+# ones.  Use this to migrate a whole catalog to a different scheme version.
+def iter_recomputed(messages, version=None):
+  for (msg, new_id) in get_scheme(version).iter_ids(messages):
+    yield (msg.id, message.Message(id=new_id, meaning=msg.meaning, comment=msg.comment,
+                                   parts=msg.parts, placeholders_by_name=msg.placeholders_by_name))
+
+
+# Returns an OrderedDict of old ID -> new ID for the messages.  No messages are
+# built so this is the faster way to map the IDs of a whole catalog.
+def recompute_ids(messages, version=None):
+  return OrderedDict((msg.id, new_id) for (msg, new_id) in get_scheme(version).iter_ids(messages))
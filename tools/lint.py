@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import io
+import hashlib
+import subprocess
+from collections import namedtuple, OrderedDict
+
+import lxml.html
+import lxml.etree
+
+from . import message
+from . import extraction_cache
+
+
+class Error(Exception):
+  pass
+
+
+ERROR = "error"
+WARNING = "warning"
+
+# A problem found in a template.  line is the line of the element that
+# carries the i18n markup (None if the whole file is affected.)
+Diagnostic = namedtuple("Diagnostic", ("filename", "line", "rule", "severity", "message"))
+
+
+def format_diagnostic(diagnostic):
+  return "{0}:{1}: {2}: {3} [{4}]".format(
+      diagnostic.filename, diagnostic.line or 0, diagnostic.severity, diagnostic.message, diagnostic.rule)
+
+
+# Lint rules by name.  A rule's check(msg, node, attr) is called for every
+# message that could be built and returns an iterable of problem descriptions
+# (attr is None for the message of an i18n element.)  Rules without a check
+# are reported by the engine itself while building the messages.
+Rule = namedtuple("Rule", ("name", "severity", "description", "check"))
+
+RULES = OrderedDict()
+
+
+def add_rule(name, severity, description, check=None):
+  if name in RULES:
+    raise Error("A lint rule named {0!r} is already registered".format(name))
+  if severity not in (ERROR, WARNING):
+    raise Error("Unknown severity: {0}".format(severity))
+  RULES[name] = Rule(name=name, severity=severity, description=description, check=check)
+
+
+# Decorator that registers check as a lint rule, e.g.
+#
+#   @lint.rule("no-todo", lint.WARNING, "TODO in a message")
+#   def check_no_todo(msg, node, attr):
+#     if "TODO" in msg.unparse():
+#       yield "message contains a TODO"
+def rule(name, severity, description):
+  def register(check):
+    add_rule(name, severity, description, check)
+    return check
+  return register
+
+
+add_rule("parse-error", ERROR, "the template could not be read or parsed")
+add_rule("invalid-message", ERROR,
+         "the message could not be built, e.g. an empty meaning or an invalid placeholder name")
+add_rule("missing-attribute", ERROR, "i18n-FOO on an element without a FOO attribute")
+add_rule("id-conflict", ERROR, "different messages with the same ID in one template")
+add_rule("comment-conflict", WARNING, "the same message with different descriptions in one template")
+add_rule("ng-expression", WARNING,
+         "suspicious {{ }} markup: empty or nested expressions, spaces in i18n-ph()")
+
+
+@rule("missing-comment", WARNING, "a message without a description for the translators")
+def check_missing_comment(msg, node, attr):
+  if not msg.comment:
+    yield "message has no description for the translators"
+
+
+@rule("empty-message", ERROR, "a message without any text or placeholders")
+def check_empty_message(msg, node, attr):
+  if not "".join(part for part in msg.parts if isinstance(part, str)).strip() and not msg.placeholders_by_name:
+    yield "message is empty"
+
+
+def _warning_line(warning, node):
+  # Only the text directly inside an element tells where it starts.
+  for element in node.iter():
+    if element.text == warning.text:
+      return element.sourceline + warning.text.count("\n", 0, warning.offset)
+  return node.sourceline
+
+
+# Lints templates with the enabled rules (names of RULES, defaults to all.)
+class Linter(object):
+  def __init__(self, rules=None):
+    if rules is None:
+      rules = list(RULES)
+    unknown = [name for name in rules if name not in RULES]
+    if unknown:
+      raise Error("Unknown lint rules: {0}".format(", ".join(unknown)))
+    self.rules = [RULES[name] for name in rules]
+    self._enabled = set(rules)
+    self._checks = [rule for rule in self.rules if rule.check is not None]
+
+  # Returns a list of (line, rule, severity, message) for a template.
+  def lint_html_bytes(self, data):
+    problems = []
+    def report(line, rule_name, description):
+      if rule_name in self._enabled:
+        problems.append((line, rule_name, RULES[rule_name].severity, description))
+    try:
+      root = lxml.html.parse(io.BytesIO(data)).getroot()
+    except (lxml.etree.LxmlError, ValueError) as e:
+      report(None, "parse-error", str(e))
+      return problems
+    if root is None:
+      return problems
+    messages = OrderedDict()
+    for node in message.iter_i18n_elements(root):
+      def on_warning(warning):
+        report(_warning_line(warning, node), "ng-expression", warning.message)
+      for (attr, raw_comment) in node.items():
+        if not attr.startswith(message.I18N_ATTRIB_PREFIX):
+          continue
+        attr = attr[len(message.I18N_ATTRIB_PREFIX):]
+        raw_message = node.get(attr)
+        if raw_message is None:
+          report(node.sourceline, "missing-attribute",
+                 "i18n-{0} without a {0} attribute on <{1}>".format(attr, node.tag))
+          continue
+        self._check(messages, report, node, attr, raw_comment, raw_message, on_warning)
+      raw_comment = node.get("i18n")
+      if raw_comment is not None:
+        self._check(messages, report, node, None, raw_comment, node, on_warning)
+    return problems
+
+  def _check(self, messages, report, node, attr, raw_comment, raw_message, on_warning):
+    try:
+      msg = message.MessageBuilder(raw_comment=raw_comment, raw_message=raw_message,
+                                   on_warning=on_warning).build()
+    except message.Error as e:
+      report(node.sourceline, "invalid-message", str(e))
+      return
+    # Same checks as message.add_message but reported instead of raised/logged.
+    existing = messages.setdefault(msg.id, msg)
+    if existing is not msg:
+      if existing.meaning != msg.meaning or existing.unparse() != msg.unparse():
+        report(node.sourceline, "id-conflict", "message ID {0} is also used for {1!r}".format(
+            msg.id, existing.unparse()))
+      elif existing.comment != msg.comment:
+        report(node.sourceline, "comment-conflict", "the same message is described as {0!r}".format(
+            existing.comment))
+    for rule in self._checks:
+      for description in rule.check(msg, node, attr):
+        report(node.sourceline, rule.name, description)
+
+
+# Bump this when the rules or the cached payload change.
+LINT_CACHE_VERSION = 1
+
+
+# Lint results keyed by the git blob SHA1 of the template (see
+# extraction_cache.ExtractionCache.)  The set of enabled rules is part of the
+# version stamp so that enabling or disabling a rule starts a new cache.
+class LintCache(extraction_cache.ExtractionCache):
+  def __init__(self, cache_dir, linter):
+    super(LintCache, self).__init__(cache_dir)
+    rules_hash = hashlib.sha1(",".join(rule.name for rule in linter.rules).encode("utf-8")).hexdigest()
+    self.version_stamp = "lint{0}-{1}-{2}".format(LINT_CACHE_VERSION, self.version_stamp, rules_hash[:12])
+    self._root = os.path.join(cache_dir, self.version_stamp)
+
+
+def _git(*args):
+  try:
+    return subprocess.check_output(("git",) + args, stderr=subprocess.PIPE, universal_newlines=True)
+  except OSError as e:
+    raise Error("Cannot run git: {0}".format(e))
+  except subprocess.CalledProcessError as e:
+    raise Error("git {0} failed: {1}".format(" ".join(args), e.stderr.strip()))
+
+
+def _normpath(fname):
+  return os.path.normpath(os.path.relpath(fname))
+
+
+# The files (relative to the current directory) that differ from rev in the
+# index or the working tree (i.e. "git diff --name-only rev") and the
+# untracked files.
+def changed_files(rev="HEAD"):
+  changed = _git("diff", "--name-only", "--relative", "-z", rev).split("\0")
+  changed += _git("ls-files", "--others", "--exclude-standard", "-z").split("\0")
+  return set(_normpath(fname) for fname in changed if fname)
+
+
+# Returns {filename: blob SHA1} of the files in rev below the current
+# directory, i.e. the cache keys of the files that have not changed.
+def committed_blob_shas(rev="HEAD"):
+  shas = {}
+  for line in _git("ls-tree", "-r", "-z", rev).split("\0"):
+    if not line:
+      continue
+    (info, fname) = line.split("\t", 1)
+    (mode, kind, sha) = info.split()
+    if kind == "blob":
+      shas[_normpath(fname)] = sha
+  return shas
+
+
+def _read_file(fname):
+  with io.open(fname, "rb") as f:
+    return f.read()
+
+
+def _diagnostics(fname, problems):
+  return [Diagnostic(fname, line, rule_name, severity, description)
+          for (line, rule_name, severity, description) in problems]
+
+
+# Yields the Diagnostics of the templates fnames as they are found (in the
+# order of fnames.)  Results are looked up in and added to cache (a LintCache)
+# if given.
+#
+# With changed (a set of normalized filenames, see changed_files) the results
+# of the other files are looked up in the cache by the blob SHAs git already
+# knows (see committed_blob_shas) so they are not even read.  Unchanged files
+# that are not in the cache yet are linted (and added to the cache) like the
+# changed ones.  stats (if given) counts the files "linted" and "cached".
+def lint_files(fnames, linter, cache=None, changed=None, committed_shas=None, stats=None):
+  if stats is None:
+    stats = {}
+  for key in ("linted", "cached"):
+    stats.setdefault(key, 0)
+  for fname in fnames:
+    problems = None
+    if changed is not None and cache is not None and _normpath(fname) not in changed:
+      sha = (committed_shas or {}).get(_normpath(fname))
+      if sha is not None:
+        problems = cache.get(sha)
+    if problems is not None:
+      stats["cached"] += 1
+    else:
+      try:
+        data = _read_file(fname)
+      except (IOError, OSError) as e:
+        stats["linted"] += 1
+        for diagnostic in _diagnostics(fname, [(None, "parse-error", ERROR, str(e))]):
+          yield diagnostic
+        continue
+      sha = extraction_cache.blob_sha(data)
+      problems = cache.get(sha) if cache is not None else None
+      if problems is None:
+        problems = linter.lint_html_bytes(data)
+        stats["linted"] += 1
+        if cache is not None:
+          cache.put(sha, problems)
+      else:
+        stats["cached"] += 1
+    for diagnostic in _diagnostics(fname, problems):
+      yield diagnostic
@@ -4,13 +4,17 @@
 import logging
 logger = logging.getLogger(__name__)
 
-import cgi
+import re
+import functools
 import itertools
 from collections import deque, OrderedDict, namedtuple, defaultdict
-import re
-import hashlib
+
+import lxml.etree
 
 from .pretty_print import pp, pf
+from . import escaping
+from . import fingerprint
+from . import metrics
 
 class Error(Exception):
   pass
@@ -18,6 +22,9 @@ class Error(Exception):
 class LintError(Error):
   pass
 
+class MessageIdConflictError(Error):
+  pass
+
 # Callback:  During (pseudo-)translation, we parse the source files and want to
 # perform DOM transforms.  For each extracted message, we would see if we have
 # a translated version of the message available and if it is, transform the DOM
@@ -27,42 +34,31 @@ class LintError(Error):
 # are compatible.  However, whenever the user had overridden the message ID in
 # either the old or newly extracted message, we should still perform an
 # explicit check to confirm that the structures and placeholders are still
-# compatible.
+# compatible (see validation.py; translation.OnParse does.)
+#
+# on_warning is called with an NgExprWarning and the element of the message
+# for suspicious markup in the message (by default it is logged.)
 class OnParseBase(object):
   def on_attrib(self, message, node, attr): pass
   def on_node(self, message, node): pass
+  def on_warning(self, warning, node): _log_ng_expr_warning(warning)
 
 
-# Escaping Contexts.
-# A message can be either plain text, html text (whitespace coalescing doesn't
-# change the fingerprint) or HTML dom nodes.
-# The escaping context is the surrounding context in which the message appears.
-# For instance, the following two messages wlll be considered identical and
-# only translated once.
-#   1. <!--i18n-->1,"2",3<!--/i18n-->
-#   2. <foo bar="1,&quot;,2,&quot;3" i18n-bar>
-# However, they will be escaped differently when they are substituted back into
-# the DOM (the attribute will need to be escaped for use in as an attribute.)
-CONTEXT_RAW = 0
-CONTEXT_HTML = 1
-CONTEXT_ATTRIBUTE_VALUE = 2
-
-def _escape(text, escaping_context):
-  if escaping_context == CONTEXT_RAW:
-    return text
-  elif escaping_context == CONTEXT_HTML:
-    return cgi.escape(text)
-  elif escaping_context == CONTEXT_ATTRIBUTE_VALUE:
-    return cgi.escape(text, True)
-  else:
-    raise Error("Unknown escaping context: {0}".format(escaping_context))
+# Escaping contexts (see escaping.py.)
+CONTEXT_RAW = escaping.CONTEXT_RAW
+CONTEXT_HTML = escaping.CONTEXT_HTML
+CONTEXT_ATTRIBUTE_VALUE = escaping.CONTEXT_ATTRIBUTE_VALUE
 
+_escape = escaping.escape
 
-# TODO: Messages could optionally link to the SourceFile(s) from which they
-# were extracted.  This isn't strictly necessary but nice to have.  This
-# information can be exposed in XLIFF files (<header><skl><external-file href=...">)
-# At the minimum, we want to store the filename here.  We might also store the
-# line number and file sha1 (e.g. "git rev-parse HEAD:path/to/file").
+
+# Messages can link to the SourceFile(s) from which they were extracted.  This
+# isn't strictly necessary but nice to have.  This information can be exposed in
+# XLIFF files (<header><skl><external-file href=...">)
+# We store the filename, the line number and the git blob sha1 of the file
+# (e.g. "git rev-parse HEAD:path/to/file").  The references are not stored on
+# the Message itself (the same message may occur in many places) but in the
+# catalog (see catalog.Catalog.)
 # In the prototype web UI of extracted messages, they server can then allow one
 # to click through the extracted messages and see all the places they were
 # extracted from and exactly what the file looked like at that point.  (For
@@ -71,8 +67,8 @@ def _escape(text, escaping_context):
 # - line and column number
 # - blob sha
 # - URL
-class SourceFile(object): pass
-class SourceReference(object): pass
+SourceFile = namedtuple("SourceFile", ("filename", "blob_sha"))
+SourceReference = namedtuple("SourceReference", ("source_file", "line"))
 
 
 # SPECIAL PLACEHOLDERS
@@ -86,7 +82,12 @@ class SourceReference(object): pass
 # sources
 #
 # id: the canonical fingerprint of this message.  Messages are immutable.
+#
+# The message object model uses __slots__ throughout since large catalogs hold
+# millions of these objects.
 class Message(object):
+  __slots__ = ("id", "meaning", "comment", "parts", "placeholders_by_name")
+
   def __init__(self, id, meaning, comment, parts, placeholders_by_name):
     self.id = id
     self.meaning = meaning
@@ -94,6 +95,12 @@ class Message(object):
     self.parts = parts
     self.placeholders_by_name = placeholders_by_name
 
+  # Returns a FrozenMessage with the same contents.  The parts (including the
+  # parts of tag pairs) become tuples.
+  def frozen(self):
+    return FrozenMessage(self.id, self.meaning, self.comment,
+                         _freeze_parts(self.parts), self.placeholders_by_name)
+
   def _unparse_part(self, part):
     return part if isinstance(part, str) else part.unparse()
 
@@ -111,6 +118,43 @@ class Message(object):
     return str(self)
 
 
+# A Message that enforces its immutability.  Useful for messages shared across
+# many documents or threads (e.g. the source messages of a catalog.)
+class FrozenMessage(Message):
+  __slots__ = ()
+
+  def __init__(self, id, meaning, comment, parts, placeholders_by_name):
+    set_slot = super(FrozenMessage, self).__setattr__
+    set_slot("id", id)
+    set_slot("meaning", meaning)
+    set_slot("comment", comment)
+    set_slot("parts", tuple(parts))
+    set_slot("placeholders_by_name", placeholders_by_name)
+
+  def __setattr__(self, name, value):
+    raise AttributeError("FrozenMessage is immutable")
+
+  def __delattr__(self, name):
+    raise AttributeError("FrozenMessage is immutable")
+
+  # The default reduce protocol restores slots through setattr.
+  def __reduce__(self):
+    return (FrozenMessage, (self.id, self.meaning, self.comment, self.parts,
+                            self.placeholders_by_name))
+
+  def frozen(self):
+    return self
+
+
+def _freeze_parts(parts):
+  frozen_parts = []
+  for part in parts:
+    if isinstance(part, TagPair) and not isinstance(part.parts, tuple):
+      part = part.copy_with_parts(tuple(_freeze_parts(part.parts)))
+    frozen_parts.append(part)
+  return tuple(frozen_parts)
+
+
 ParsedComment = namedtuple("ParsedComment", ("meaning", "comment"))
 
 def parse_raw_comment(raw_comment):
@@ -129,12 +173,47 @@ def get_fingerprint(obj):
   return obj if isinstance(obj, str) else obj.get_fingerprint()
 
 
+# Fixed mapping of HTML tags to the hint used to make up their placeholder
+# names, e.g. <a> becomes LINK_BEGIN/LINK_END instead of A_BEGIN/A_END.  The
+# made up names end up in exported translation files so this mapping cannot be
+# changed later.
+HTML_TAG_NAME_HINTS = {"A": "LINK"}
+
+# Maximum number of distinct examples kept when the same placeholder occurs
+# more than once in a message.
+MAX_PLACEHOLDER_EXAMPLES = 5
+
+
+# Returns the (begin, end) base names for the placeholders of an HTML tag.
+@functools.lru_cache(maxsize=None)
+def _html_tag_base_names(tag):
+  name_hint = HTML_TAG_NAME_HINTS.get(tag.upper(), tag.upper())
+  return (name_hint + "_BEGIN", name_hint + "_END")
+
+
+def _merge_examples(examples, more_examples):
+  if not more_examples:
+    return examples
+  merged = list(examples) if examples else []
+  for example in more_examples:
+    if len(merged) >= MAX_PLACEHOLDER_EXAMPLES:
+      break
+    if example not in merged:
+      merged.append(example)
+  return merged
+
+
 # Used by the message builder.
 # Store all placeholders and tag pairs with or without IDs/names until the
 # point at which we can definitively assign IDs to them in a deterministic
 # fashion.  Sub-messages will use this same registry for placeholders in order
 # to support export formats that require placeholders to be unique across the
 # entire message.
+#
+# Made up names are BASE, BASE_1, BASE_2, ...  Every base name has its own
+# counter that only moves forward so naming a placeholder never rescans the
+# names that were taken before.  Explicit names are reserved as they are seen
+# so that made up names never clash with them.
 class PlaceholderRegistry(object):
   def __init__(self):
     self._names_seen = set()
@@ -143,14 +222,16 @@ class PlaceholderRegistry(object):
     self.counter = itertools.count(1)
 
   def to_dict(self):
-    for placeholder_or_tag in self._by_canonical.values():
-      self._ensure_name(placeholder_or_tag)
     result = OrderedDict()
     for placeholder_or_tag in self._by_canonical.values():
       if isinstance(placeholder_or_tag, Placeholder):
+        if not placeholder_or_tag.name:
+          self._make_up_name_for_placeholder(placeholder_or_tag)
         result[placeholder_or_tag.name] = placeholder_or_tag
       elif isinstance(placeholder_or_tag, TagPair):
         tag_pair = placeholder_or_tag
+        if not tag_pair.ph_begin.name:
+          self._make_up_names_for_tag(tag_pair)
         result[tag_pair.ph_begin.name] = tag_pair.ph_begin
         result[tag_pair.ph_end.name] = tag_pair.ph_end
       else:
@@ -158,52 +239,38 @@ class PlaceholderRegistry(object):
     return result
 
   def _generate_name_hint(self, placeholder):
-    if isinstance(placeholder, TagPair):
-      # TODO: Define and use a FIXED mapping registry for HtmlTagPair's.  For instance,
-      # the <a> tag can be "LINK" instead of "A".  Such a mapping cannot be
-      # changed later because it would break message fingerprinting.
-      MAPPINGS = defaultdict(dict, {
-        HtmlTagPair.__name__: dict(A="LINK")
-      })
-      return MAPPINGS.get(placeholder.__class__.__name__).get(placeholder.tag.upper(), placeholder.tag.upper())
-    else:
-      # TODO: Here too, define and use a more friendly fixed mapping for auto-generating placeholder names.
-      # For NgExpr, while it might be nice to use the actual expression, this
-      # is not advisable because a change in the expression should not result
-      # in a retranslation.
-      return "EXPRESSION" if isinstance(placeholder, NgExpr) else "PH"
-
-  def _ensure_names_for_tag(self, placeholder):
-    if placeholder.ph_begin.name:
-      return
-    name_hint = self._generate_name_hint(placeholder)
-    begin_basename = ph_begin_name = name_hint + "_BEGIN"
-    end_basename   = ph_end_name   = name_hint + "_END"
+    # TODO: Here too, define and use a more friendly fixed mapping for auto-generating placeholder names.
+    # For NgExpr, while it might be nice to use the actual expression, this
+    # is not advisable because a change in the expression should not result
+    # in a retranslation.
+    return "EXPRESSION" if isinstance(placeholder, NgExpr) else "PH"
+
+  def _make_up_names_for_tag(self, tag_pair):
+    if not isinstance(tag_pair, HtmlTagPair):
+      raise Error("No placeholder names for tag pair type {0}".format(type(tag_pair).__name__))
+    (begin_basename, end_basename) = _html_tag_base_names(tag_pair.tag)
+    ph_begin_name, ph_end_name = begin_basename, end_basename
+    names_seen = self._names_seen
     counter = self._counts_by_prefix[begin_basename]
-    while (ph_begin_name in self._names_seen or ph_end_name in self._names_seen):
+    while ph_begin_name in names_seen or ph_end_name in names_seen:
       count = next(counter)
       ph_begin_name = '{0}_{1}'.format(begin_basename, count)
       ph_end_name =   '{0}_{1}'.format(end_basename,   count)
-    self._names_seen.add(ph_begin_name)
-    self._names_seen.add(ph_end_name)
-    placeholder.ph_begin.name = ph_begin_name
-    placeholder.ph_end.name = ph_end_name
+    names_seen.add(ph_begin_name)
+    names_seen.add(ph_end_name)
+    tag_pair.ph_begin.name = ph_begin_name
+    tag_pair.ph_end.name = ph_end_name
+    tag_pair.ph_begin.auto_named = tag_pair.ph_end.auto_named = True
 
-  def _ensure_name_for_placeholder(self, placeholder):
-    if placeholder.name:
-      return
+  def _make_up_name_for_placeholder(self, placeholder):
     basename = name = self._generate_name_hint(placeholder)
+    names_seen = self._names_seen
     counter = self._counts_by_prefix[basename]
-    while name in self._names_seen:
+    while name in names_seen:
       name = '{0}_{1}'.format(basename, next(counter))
-    self._names_seen.add(name)
+    names_seen.add(name)
     placeholder.name = name
-
-  def _ensure_name(self, placeholder):
-    if isinstance(placeholder, TagPair):
-      self._ensure_names_for_tag(placeholder)
-    else:
-      self._ensure_name_for_placeholder(placeholder)
+    placeholder.auto_named = True
 
   # Tag order is important for message fingerprinting.  The placeholder names
   # that are auto-generated should be deterministic but not conflict with any
@@ -230,94 +297,49 @@ class PlaceholderRegistry(object):
     self._by_canonical[canonical_key] = placeholder
     return placeholder
 
+  # Repeated occurrences of the same placeholder share the first placeholder
+  # object so that every occurrence ends up with the same (possibly made up)
+  # name and all the examples.
   def _update_simple_placeholder(self, placeholder):
+    if placeholder.name:
+      self._names_seen.add(placeholder.name)
     canonical_key = placeholder.get_fingerprint()
     existing_placeholder = self._by_canonical.get(canonical_key)
-    if existing_placeholder is not None:
-      num_names = bool(placeholder.name) + bool(existing_placeholder.name)
-      if num_names == 2:
-        # These two names should match.
-        if placeholder.name != existing_placeholder.name:
-          raise Error("The same placeholder occurs more than once with a different placeholder name.")
-      elif num_names == 1:
-        if placeholder.name is None:
-          placeholder.name = existing_placeholder.name
-        else:
-          existing_placeholder.name = placeholder.name
-      # TODO: merge the examples from both placeholders
-    else:
+    if existing_placeholder is None:
       self._by_canonical[canonical_key] = placeholder
-    return placeholder
-
-
-# Escape sequences for fingerprinting.
-# Fingerprinting requires unique digests for unique messages.  The approach is
-# to construct a unique long string for unique messages and use a fixed and
-# good fingerprinting algorithm to get a smaller digest out of it (64/128 bits
-# should be sufficient.)  These escape sequences are used in generating the
-# unique long string per message.
-ESCAPE_CHAR = "\x10"
-ESCAPE_END = ESCAPE_CHAR + "."
-BEGIN_TEXT = ESCAPE_CHAR + "'"
-BEGIN_PH = ESCAPE_CHAR + "X"
-BEGIN_TAG = ESCAPE_CHAR + "<"
-END_TAG = ESCAPE_CHAR + ">"
-
-
-def _escape_text_for_message_id(text):
-  return text.replace(ESCAPE_CHAR, ESCAPE_CHAR+ESCAPE_CHAR)
+      return placeholder
+    if placeholder.name:
+      if not existing_placeholder.name:
+        existing_placeholder.name = placeholder.name
+      elif placeholder.name != existing_placeholder.name:
+        raise Error("The same placeholder occurs more than once with a different placeholder name.")
+    existing_placeholder.examples = _merge_examples(existing_placeholder.examples, placeholder.examples)
+    return existing_placeholder
 
 
 class MessageBuilder(object):
-  def __init__(self, raw_comment=None, parent=None, raw_message=None):
+  def __init__(self, raw_comment=None, parent=None, raw_message=None, on_warning=None):
     self.parent = parent
     parsed_comment = parse_raw_comment(raw_comment)
     self.meaning = parsed_comment.meaning
     self.comment = parsed_comment.comment
     self.placeholder_registry = parent.placeholder_registry if parent else PlaceholderRegistry()
-    if isinstance(raw_message, str):
-      self.parts = parse_message_text_for_ng_expressions(raw_message, self.placeholder_registry)
-    else:
-      self.parts = parse_node_contents(raw_message, self.placeholder_registry)
-
-  def _gen_id_parts_for_subparts(self, parts):
-    placeholders = {}
-    for part in parts:
-      if isinstance(part, str):
-        yield "{0}{2}{1}".format(BEGIN_TEXT, ESCAPE_END, _escape_text_for_message_id(part))
-      elif isinstance(part, Placeholder):
-        placeholders[part.name] = part
-      elif isinstance(part, TagPair):
-        yield "{0}{1},{2}{3}".format(BEGIN_TAG, part.ph_begin.name, type(part).__name__, ESCAPE_END)
-        for i in self._gen_id_parts_for_subparts(part.parts):
-          yield i
+    with metrics.active().phase("message_builder"):
+      if isinstance(raw_message, str):
+        self.parts = parse_message_text_for_ng_expressions(raw_message, self.placeholder_registry, on_warning)
       else:
-        raise Error("Encountered unknown message part type while computing message ID: {0}".format(type(part)))
-    for name in sorted(placeholders):
-      placeholder = placeholders[name]
-      yield "{0}{1},{2}{3}".format(BEGIN_PH, name, type(placeholder).__name__, ESCAPE_END)
-
-  def _gen_id_parts(self):
-    # The comment does not contribute to the hash.
-    # Placeholders are allowed to move around so their order should not change the ID.
-    # TagPair's (HtmlTagPair) nesting should be preserved.  They can't be
-    #   removed.  Placeholders inside tag pairs may be reordered.  However,
-    #   you shouldn't introduce new placeholders or increase/decrease their count.
-    #   TODO: pluralization is a different beast wrt placeholders.
-    yield _escape_text_for_message_id(self.meaning or "")
-    # TODO: Incorporate namespace/"project ID"?
-    for i in self._gen_id_parts_for_subparts(self.parts):
-      yield i
+        self.parts = parse_node_contents(raw_message, self.placeholder_registry, on_warning)
 
   def _compute_id(self):
-    hasher = hashlib.md5()
-    for part in self._gen_id_parts():
-      hasher.update(part.encode("utf-8"))
-    return hasher.hexdigest()
+    return fingerprint.compute_id(self.meaning, self.parts)
 
   def build(self):
-    id = self._compute_id()
-    placeholders_by_name = self.placeholder_registry.to_dict()
+    m = metrics.active()
+    with m.phase("fingerprint"):
+      id = self._compute_id()
+    with m.phase("placeholder_naming"):
+      placeholders_by_name = self.placeholder_registry.to_dict()
+    m.count("placeholders", len(placeholders_by_name))
     return Message(id=id,
                    meaning=self.meaning,
                    comment=self.comment,
@@ -327,8 +349,31 @@ class MessageBuilder(object):
 
 I18N_ATTRIB_PREFIX="i18n-"
 
+# How MessageParser finds the elements that carry i18n markup.
+#   walk: visit every element in Python.
+#   xpath: let lxml find the elements with an i18n or i18n-* attribute and
+#       only visit those.  Much faster on pages where most elements carry no
+#       i18n markup.
+# Both find the same messages in the same order.
+DISCOVERY_MODES = ("walk", "xpath")
+DEFAULT_DISCOVERY = "xpath"
+
+_find_i18n_elements = lxml.etree.XPath(
+    "descendant-or-self::*[@i18n or @*[starts-with(name(), '{0}')]]".format(I18N_ATTRIB_PREFIX))
+
+
+# Yields the elements below (and including) root that carry i18n markup in
+# document order, skipping the ones inside i18n elements (which are part of
+# that element's message.)
+def iter_i18n_elements(root):
+  for node in _find_i18n_elements(root):
+    if not any(ancestor.get("i18n") is not None for ancestor in node.iterancestors()):
+      yield node
+
 
 class MessagePart(object):
+  __slots__ = ()
+
   def get_fingerprint(self):
     raise NotImplementedError("Override in subclass")
 
@@ -342,12 +387,18 @@ class MessagePart(object):
 # implementation class names and that's the name we should use.  If a brand new
 # type is added, we would give it a brand new unique name and update all the
 # places where a type check is done: fingerprinting, escaping contexts, etc.
+#
+# auto_named is set when the PlaceholderRegistry made up the name.  Such names
+# do not contribute to the message ID (see fingerprint.py.)
 class Placeholder(MessagePart):
+  __slots__ = ("name", "text", "examples", "comment", "auto_named")
+
   def __init__(self, name, text, examples, comment):
     self.name = name
     self.text = text
     self.examples = examples
     self.comment = comment
+    self.auto_named = False
 
   def __repr__(self):
     if self.name:
@@ -359,6 +410,8 @@ class Placeholder(MessagePart):
 
 
 class TagPairBeginRef(Placeholder):
+  __slots__ = ("html_tag_pair",)
+
   def __init__(self, html_tag_pair, examples=None, comment=None):
     self.html_tag_pair = html_tag_pair
     name = None
@@ -366,6 +419,8 @@ class TagPairBeginRef(Placeholder):
     super(TagPairBeginRef, self).__init__(name, text, examples, comment)
 
 class TagPairEndRef(Placeholder):
+  __slots__ = ("html_tag_pair",)
+
   def __init__(self, html_tag_pair, examples=None, comment=None):
     self.html_tag_pair = html_tag_pair
     name = None
@@ -374,8 +429,7 @@ class TagPairEndRef(Placeholder):
 
 
 class NgExpr(Placeholder):
-  def __init__(self, name, text, examples, comment):
-    super(NgExpr, self).__init__(name, text, examples, comment)
+  __slots__ = ()
 
   def get_fingerprint(self):
     # TODO: do this right.
@@ -386,6 +440,9 @@ class NgExpr(Placeholder):
 
 
 class TagPair(MessagePart):
+  __slots__ = ("tag", "begin", "end", "parts", "examples", "canonical_key",
+               "ph_begin", "ph_end")
+
   def __init__(self, tag, begin, end, parts, examples, canonical_key, ph_begin=None, ph_end=None):
     self.tag = tag
     self.begin = begin
@@ -393,8 +450,14 @@ class TagPair(MessagePart):
     self.parts = parts
     self.examples = examples
     self.canonical_key = canonical_key
-    self.ph_begin = ph_begin if ph_begin else TagPairBeginRef(self)
-    self.ph_end = ph_end if ph_end else TagPairEndRef(self)
+    self.ph_begin = ph_begin if ph_begin else self._make_ph_begin()
+    self.ph_end = ph_end if ph_end else self._make_ph_end()
+
+  def _make_ph_begin(self):
+    return TagPairBeginRef(self)
+
+  def _make_ph_end(self):
+    return TagPairEndRef(self)
 
   def unparse(self):
     raise NotImplementedError("Override in subclass")
@@ -410,14 +473,37 @@ class TagPair(MessagePart):
         ph_end_name)
 
 
+# The placeholder comments only depend on the tag so share them.
+@functools.lru_cache(maxsize=None)
+def _html_tag_comments(tag):
+  return ("Begin HTML <{0}> tag".format(tag), "End HTML </{0}> tag".format(tag))
+
+
 # TODO: must not de-dupe with other TagPair's even if they are an exact match
 class HtmlTagPair(TagPair):
+  __slots__ = ()
+
   def __init__(self, tag, begin, end, parts, examples, canonical_key):
     super(HtmlTagPair, self).__init__(tag, begin, end, parts, examples, canonical_key)
-    self.ph_begin = TagPairBeginRef(self, examples=[self.begin],
-                                    comment="Begin HTML <{0}> tag".format(self.tag))
-    self.ph_end = TagPairEndRef(self, examples=[self.end],
-                                comment="End HTML </{0}> tag".format(self.tag))
+
+  def _make_ph_begin(self):
+    return TagPairBeginRef(self, examples=(self.begin,),
+                           comment=_html_tag_comments(self.tag)[0])
+
+  def _make_ph_end(self):
+    return TagPairEndRef(self, examples=(self.end,),
+                         comment=_html_tag_comments(self.tag)[1])
+
+  # Returns a tag pair for the same tag (and placeholder names) with different
+  # contents, e.g. for the translation of a message.
+  def copy_with_parts(self, parts):
+    tag_pair = HtmlTagPair(tag=self.tag, begin=self.begin, end=self.end, parts=parts,
+                           examples=self.examples, canonical_key=self.canonical_key)
+    tag_pair.ph_begin.name = self.ph_begin.name
+    tag_pair.ph_end.name = self.ph_end.name
+    tag_pair.ph_begin.auto_named = self.ph_begin.auto_named
+    tag_pair.ph_end.auto_named = self.ph_end.auto_named
+    return tag_pair
 
   # because the translator can change stuff in the middle.
   def get_fingerprint(self):
@@ -431,7 +517,7 @@ class HtmlTagPair(TagPair):
       if isinstance(part, HtmlTagPair):
         part._unparse(unparsed_parts)
       else:
-        unparsed_parts.append(cgi.escape(
+        unparsed_parts.append(escaping.escape_html(
           part if isinstance(part, str) else part.unparse()))
 
   def _unparse(self, unparsed_parts):
@@ -445,6 +531,30 @@ class HtmlTagPair(TagPair):
     return "".join(unparsed_parts)
 
 
+# Flattens the message parts into text and (name, placeholder) tuples.  The
+# contents of tag pairs are inlined between their begin and end placeholders.
+def iter_flat_parts(parts):
+  for part in parts:
+    if isinstance(part, str):
+      yield part
+    elif isinstance(part, Placeholder):
+      yield (part.name, part)
+    elif isinstance(part, TagPair):
+      yield (part.ph_begin.name, part.ph_begin)
+      for subpart in iter_flat_parts(part.parts):
+        yield subpart
+      yield (part.ph_end.name, part.ph_end)
+    else:
+      raise Error("Unexpected message part: {0!r}".format(part))
+
+
+# The message split into text and placeholder slots: a list of strings and one
+# element lists naming a placeholder, e.g.
+#   ["Hello ", ["EXPRESSION"], ", see ", ["LINK_BEGIN"], "here", ["LINK_END"]]
+def message_slots(msg):
+  return [part if isinstance(part, str) else [part[0]] for part in iter_flat_parts(msg.parts)]
+
+
 def validate_valid_placeholder_name(ph_name):
   name = ph_name
   if not name:
@@ -454,49 +564,166 @@ def validate_valid_placeholder_name(ph_name):
   # Ensure it's ascii?
   name = name.replace("_", "")
   if not name.isalnum() or name.upper() != name:
-    raise Error("invalid placeholder name: %r: It may only be composed of capital letters, digits and underscores.")
-  if name == "EMBEDDED_MESSAGES":
-    raise Error("invalid placeholder name: %r: This name is reserved.")
+    raise Error("invalid placeholder name: %r: It may only be composed of capital letters, digits and underscores." % ph_name)
+  if ph_name == "EMBEDDED_MESSAGES":
+    raise Error("invalid placeholder name: %r: This name is reserved." % ph_name)
+
+
+# Tokens of lex_ng_expressions.  offset is the index into the lexed text at
+# which the text run or the "{{" of the expression starts.  An NgExprToken's
+# text is the stripped expression without its comment; ph_name and example
+# come from an i18n-ph(NAME|example) comment (both None without one.)
+NgTextToken = namedtuple("NgTextToken", ("offset", "text"))
+NgExprToken = namedtuple("NgExprToken", ("offset", "text", "ph_name", "example"))
+
+# Suspicious but legal syntax found while lexing (see OnParseBase.on_warning.)
+# offset is the index into text (the lexed text) of the offending expression.
+NgExprWarning = namedtuple("NgExprWarning", ("offset", "text", "message"))
+
+
+def _log_ng_expr_warning(warning):
+  logger.warning("%s at offset %d of %r", warning.message, warning.offset, warning.text)
+
+
+_I18N_PH_PREFIX = "i18n-ph("
+
+# Splits an expression (stripped and without the {{ }}) into its text and the
+# placeholder name and example of its i18n-ph comment.  Style warnings are
+# reported for the expression at offset of text.
+def _split_ng_expression(expr, on_warning, offset, text):
+  comment_start = expr.rfind("//")
+  if comment_start < 0:
+    return (expr, None, None)
+  code = expr[:comment_start].strip()
+  raw_comment = expr[comment_start+2:].strip()
+  # Same as matching i18n-ph\((.*)\) i.e. up to the last ")" on the line.
+  line_end = raw_comment.find("\n")
+  if line_end < 0:
+    line_end = len(raw_comment)
+  ph_end = raw_comment.rfind(")", len(_I18N_PH_PREFIX), line_end)
+  if not raw_comment.startswith(_I18N_PH_PREFIX) or ph_end < 0:
+    raise Error("Angular expression has a comment but it wasn't valid i18n-ph() syntax")
+  raw_ph_text = raw_comment[len(_I18N_PH_PREFIX):ph_end]
+  ph_text = raw_ph_text.strip()
+  if ph_text != raw_ph_text:
+    on_warning(NgExprWarning(offset, text, "i18n-ph() begins or ends with a space"))
+  separator = ph_text.find("|")
+  if separator < 0:
+    ph_name = example = ph_text
+  else:
+    ph_name = ph_text[:separator]
+    example = ph_text[separator+1:]
+    if ph_name != ph_name.rstrip() or example != example.lstrip():
+      on_warning(NgExprWarning(offset, text, "space before or after the | in i18n-ph()"))
+    ph_name, example = ph_name.strip(), example.strip()
+  validate_valid_placeholder_name(ph_name)
+  return (code, ph_name, example)
+
+
+# An expression runs from "{{" to the first "}}" and may not span lines except
+# for the whitespace around it.
+_NG_EXPR_RE = re.compile(r"\{\{\s*(.*?)\s*\}\}")
+
+# Braces and string literals may hide the real end of an expression (as in
+# {{ {a: {b: 1}} }} or {{ foo + "}}" }}) so an expression with a brace or a
+# quote is scanned again with _NG_EXPR_SCAN_RE, which matches the braces,
+# whole string literals and the "//" of the comment (which runs to the next
+# "}}".)
+_NG_EXPR_SCAN_RE = re.compile(r"""[{}]|'(?:[^'\\\n]|\\.)*'|"(?:[^"\\\n]|\\.)*"|//""")
+
+
+# Returns the index of the "}}" closing the expression whose code starts at
+# pos (just after its "{{") or -1 if its braces don't balance or a "{{"
+# outside a string literal starts another expression.
+def _find_ng_expression_end(text, pos):
+  depth = 0
+  for m in _NG_EXPR_SCAN_RE.finditer(text, pos):
+    token = m.group()
+    if token == "{":
+      if text.startswith("{", m.end()):
+        return -1
+      depth += 1
+    elif token == "}":
+      if depth:
+        depth -= 1
+      elif text.startswith("}", m.end()):
+        return m.start()
+    elif token == "//":
+      return text.find("}}", m.end())
+  return -1
+
+
+# The lexer proper.  Returns the tokens as plain tuples (which are much
+# cheaper to make than namedtuples): (offset, text) for text runs and
+# (offset, text, ph_name, example) for expressions.  Most expressions have no
+# brace or quote and are found by _NG_EXPR_RE alone; the others are scanned
+# again from their "{{" by _find_ng_expression_end.
+def _lex_ng_expressions(text, on_warning):
+  tokens = []
+  append = tokens.append
+  search = _NG_EXPR_RE.search
+  pos = 0
+  m = search(text)
+  while m:
+    start = m.start()
+    expr = m.group(1)
+    end = m.end()
+    if "{" in expr or "'" in expr or '"' in expr:
+      close = _find_ng_expression_end(text, start + 2)
+      if close >= 0:
+        scanned = text[start+2:close].strip()
+        if "\n" not in scanned:
+          (expr, end) = (scanned, close + 2)
+    if start > pos:
+      append((pos, text[pos:start]))
+    if not expr:
+      on_warning(NgExprWarning(start, text, "empty {{ }}"))
+    else:
+      if "{{" in expr:
+        on_warning(NgExprWarning(start, text, "nested {{ in an expression"))
+      if "//" in expr:
+        append((start,) + _split_ng_expression(expr, on_warning, start, text))
+      else:
+        append((start, expr, None, None))
+    pos = end
+    m = search(text, end)
+  if pos < len(text):
+    append((pos, text[pos:]))
+  return tokens
+
 
+# Splits text into NgTextToken and NgExprToken (see _lex_ng_expressions) and
+# reports (with on_warning, see NgExprWarning) empty {{ }} (which yield no
+# token), nested {{ such as {{ foo + "{{x}}" }}, which is legal but doesn't
+# work in AngularJS, and stray spaces in i18n-ph() comments.
+def lex_ng_expressions(text, on_warning=None):
+  for token in _lex_ng_expressions(text, on_warning or _log_ng_expr_warning):
+    yield (NgTextToken if len(token) == 2 else NgExprToken)._make(token)
+
+
+_NG_EXPR_COMMENT = "Angular Expression"
 
-ng_expr_ph_re = re.compile(r'i18n-ph\((.*)\)')
 # text should not have the {{ }} around it.
-def parse_ng_expression(text):
+def parse_ng_expression(text, on_warning=None):
   text = text.strip()
-  parts = text.rsplit("//", 1)
-  comment = "Angular Expression"
-  if len(parts) == 1:
-    return NgExpr(name=None, text=text, examples=None, comment=comment)
-  text = parts[0].strip()
-  raw_comment = parts[-1].strip()
-  m = ng_expr_ph_re.match(raw_comment)
-  if not m:
-    raise Error("Angular expression has a comment but it wasn't valid i18n-ph() syntax")
-  ph_text = m.group(1).strip()
-  parts = ph_text.split("|", 1)
-  if len(parts):
-    ph_name = parts[0].strip()
-    example = parts[-1].strip()
-  else:
-    ph_name = ph_text
-    example = None
-  validate_valid_placeholder_name(ph_name)
+  (code, ph_name, example) = _split_ng_expression(text, on_warning or _log_ng_expr_warning, 0, text)
   examples = None if not example else [example]
-  return NgExpr(name=ph_name, text=text, examples=examples, comment=comment)
+  return NgExpr(name=ph_name, text=code, examples=examples, comment=_NG_EXPR_COMMENT)
 
 
-ng_expr_re = re.compile(r'\{\{\s*(.*?)\s*\}\}')
-def parse_message_text_for_ng_expressions(text, placeholder_registry):
+def parse_message_text_for_ng_expressions(text, placeholder_registry, on_warning=None):
+  if "{{" not in text:
+    return [text] if text else []
   parts = []
-  splits = iter(ng_expr_re.split(text) + [""])
-  for (txt, expr) in zip(splits, splits):
-    if txt:
-      parts.append(txt)
-    expr = expr.strip()
-    if expr:
-      ng_expr = parse_ng_expression(expr)
-      ng_expr = placeholder_registry.update_placeholder(ng_expr)
-      parts.append(ng_expr)
+  append = parts.append
+  # Expressions are never tag pairs so skip update_placeholder's dispatch.
+  update_placeholder = placeholder_registry._update_simple_placeholder
+  for token in _lex_ng_expressions(text, on_warning or _log_ng_expr_warning):
+    if len(token) == 2:
+      append(token[1])
+    else:
+      (offset, code, ph_name, example) = token
+      append(update_placeholder(NgExpr(ph_name, code, [example] if example else None, _NG_EXPR_COMMENT)))
   return parts
 
 
@@ -509,7 +736,8 @@ def _serialize_html_attr(name, value):
   squote, dquote = "'", '"'
   have_squote, have_dquote = (squote in value), (dquote in value)
   quote_char = squote if (not have_squote and have_dquote) else dquote
-  escaped_value = cgi.escape(value, (have_squote and have_dquote))
+  escape = escaping.escape_attribute_value if (have_squote and have_dquote) else escaping.escape_html
+  escaped_value = escape(value)
   return "{0}={2}{1}{2}".format(name, escaped_value, quote_char)
 
 
@@ -527,16 +755,16 @@ def _get_html_begin_end_tags(node):
   return HtmlBeginEndTags(begin=begin, end=end)
 
 
-def __parse_node(node, placeholder_registry):
+def __parse_node(node, placeholder_registry, on_warning):
   canonical_key = placeholder_registry.reserve_new_tag(node.tag)
   begin, end = _get_html_begin_end_tags(node)
   parts = []
   if node.text:
-    parts.extend(parse_message_text_for_ng_expressions(node.text, placeholder_registry))
+    parts.extend(parse_message_text_for_ng_expressions(node.text, placeholder_registry, on_warning))
   for child in node:
-    parts.append(__parse_node(child, placeholder_registry))
+    parts.append(__parse_node(child, placeholder_registry, on_warning))
     if child.tail:
-      parts.extend(parse_message_text_for_ng_expressions(child.tail, placeholder_registry))
+      parts.extend(parse_message_text_for_ng_expressions(child.tail, placeholder_registry, on_warning))
   tag_pair = HtmlTagPair(tag=node.tag, begin=begin, end=end,
                          parts=parts, examples=None,
                          canonical_key=canonical_key)
@@ -544,12 +772,14 @@ def __parse_node(node, placeholder_registry):
   return tag_pair
 
 
-def parse_node_contents(root, placeholder_registry):
-  parts = parse_message_text_for_ng_expressions(root.text, placeholder_registry)
+def parse_node_contents(root, placeholder_registry, on_warning=None):
+  parts = []
+  if root.text:
+    parts.extend(parse_message_text_for_ng_expressions(root.text, placeholder_registry, on_warning))
   for child in root:
-    parts.append(__parse_node(child, placeholder_registry))
+    parts.append(__parse_node(child, placeholder_registry, on_warning))
     if child.tail:
-      parts.extend(parse_message_text_for_ng_expressions(child.tail, placeholder_registry))
+      parts.extend(parse_message_text_for_ng_expressions(child.tail, placeholder_registry, on_warning))
   return parts
 
 
@@ -560,6 +790,29 @@ def pretty_format_node_contents(node):
   return " ".join(parts)
 
 
+# Adds message to the messages map (keyed by message ID) unless an equivalent
+# message is already present.  Two messages with the same ID must have the same
+# meaning and the same content (anything else is either an explicit ID clash or
+# a fingerprint collision) and raise MessageIdConflictError.  They may differ in
+# their comments in which case the first one wins and we warn about it.
+# Returns the message that is now in the map.
+def add_message(messages, message):
+  existing = messages.get(message.id)
+  if existing is None:
+    messages[message.id] = message
+    return message
+  if existing is message:
+    return message
+  if existing.meaning != message.meaning or existing.unparse() != message.unparse():
+    raise MessageIdConflictError(
+        "Message ID conflict for id={0}: {1!r} vs. {2!r}".format(
+            message.id, existing.unparse(), message.unparse()))
+  if existing.comment != message.comment:
+    logger.warning("Message id=%s occurs with different comments: %r and %r.  Using the first one.",
+                   message.id, existing.comment, message.comment)
+  return existing
+
+
 class MessageParser(object):
   __id = object()
 
@@ -571,53 +824,172 @@ class MessageParser(object):
     self.messages = OrderedDict()
 
 
-  def _parse_i18n_attribs(self, node):
+  def _warning_callback(self, node):
+    return lambda warning: self.on_parse.on_warning(warning, node)
+
+
+  def _build_i18n_attrib_messages(self, node):
     # Do we have any i18n-FOO attributes?
     attribs = node.keys()
     i18n_attribs = [name for name in attribs if name.startswith(I18N_ATTRIB_PREFIX)]
-    if not i18n_attribs:
-      return
     for i18n_attrib in i18n_attribs:
       raw_comment = node.get(i18n_attrib)
       attr = i18n_attrib[len(I18N_ATTRIB_PREFIX):]
       raw_message = node.get(attr)
-      message = MessageBuilder(raw_comment=raw_comment, raw_message=raw_message).build()
-      # TODO(chirayu): what do you do when you have a message id conflict?
-      self.messages[message.id] = message
+      message = MessageBuilder(raw_comment=raw_comment, raw_message=raw_message,
+                               on_warning=self._warning_callback(node)).build()
+      yield (attr, message)
+
+
+  def _parse_i18n_attribs(self, node):
+    for (attr, message) in self._build_i18n_attrib_messages(node):
+      add_message(self.messages, message)
       self.on_parse.on_attrib(message, node, attr)
 
 
-  def _parse_messages_in_i18n_node(self, node):
+  def _build_i18n_node_message(self, node):
     i18n = node.get("i18n")
-    if i18n is None:
-      return
     logger.debug("i18n=%r", i18n)
-    message = MessageBuilder(raw_comment=i18n, raw_message=node).build()
-    # message = MessageBuilder(raw_comment=i18n, raw_message=pretty_format_node_contents(node)).build()
-    self.messages[message.id] = message
+    return MessageBuilder(raw_comment=i18n, raw_message=node, on_warning=self._warning_callback(node)).build()
+    # return MessageBuilder(raw_comment=i18n, raw_message=pretty_format_node_contents(node)).build()
+
+
+  def _parse_messages_in_i18n_node(self, node):
+    if node.get("i18n") is None:
+      return
+    message = self._build_i18n_node_message(node)
+    add_message(self.messages, message)
     self.on_parse.on_node(message, node)
 
 
   def _parse_messages(self, root):
-    self.nodes.append(root)
-    while self.nodes:
-      node = self.nodes.popleft()
-      self._parse_i18n_attribs(node)
-      i18n = node.get("i18n")
-      if i18n is not None:
+    m = metrics.active()
+    num_nodes = 0
+    with m.phase("parse_messages"):
+      self.nodes.append(root)
+      while self.nodes:
+        node = self.nodes.popleft()
+        num_nodes += 1
+        self._parse_i18n_attribs(node)
+        i18n = node.get("i18n")
+        if i18n is not None:
+          self._parse_messages_in_i18n_node(node)
+          continue
+        self.nodes.extend(node)
+    m.count("nodes_visited", num_nodes)
+    m.count("messages", len(self.messages))
+
+
+  # Returns the depth of node below root or None if node is inside an i18n
+  # element (and hence part of that message.)
+  @staticmethod
+  def _depth_below(node, root):
+    if node is root:
+      return 0
+    depth = 0
+    for ancestor in node.iterancestors():
+      if ancestor.get("i18n") is not None:
+        return None
+      depth += 1
+      if ancestor is root:
+        return depth
+    raise Error("Internal Error: element is not below the root")
+
+
+  # Same as _parse_messages but only visits the elements with i18n markup.
+  # _parse_messages walks breadth first, i.e. in the order of (depth, document
+  # order), and skips the contents of i18n elements.  XPath returns the
+  # elements in document order so compute their depth and sort on that.
+  def _discover_messages(self, root):
+    m = metrics.active()
+    with m.phase("parse_messages"):
+      candidates = []
+      for (position, node) in enumerate(_find_i18n_elements(root)):
+        depth = self._depth_below(node, root)
+        if depth is not None:
+          candidates.append((depth, position, node))
+      candidates.sort(key=lambda candidate: candidate[:2])
+      for (depth, position, node) in candidates:
+        self._parse_i18n_attribs(node)
         self._parse_messages_in_i18n_node(node)
-        continue
-      self.nodes.extend(node)
+    m.count("nodes_visited", len(candidates))
+    m.count("messages", len(self.messages))
+
 
+  # Finished elements are no longer needed.  Drop their contents and unlink
+  # the preceding siblings from the parent so that only the path from the root
+  # to the current element stays in memory.
+  @staticmethod
+  def _free_element(node):
+    node.clear()
+    parent = node.getparent()
+    if parent is not None:
+      while node.getprevious() is not None:
+        del parent[0]
+
+
+  def _iter_messages(self, events):
+    seen_ids = set()
+    i18n_node = None
+    for (event, node) in events:
+      if event == "start":
+        if i18n_node is not None:
+          continue
+        for (attr, message) in self._build_i18n_attrib_messages(node):
+          if message.id not in seen_ids:
+            seen_ids.add(message.id)
+            yield message
+        if node.get("i18n") is not None:
+          i18n_node = node
+      elif event == "end":
+        if node is i18n_node:
+          i18n_node = None
+          message = self._build_i18n_node_message(node)
+          if message.id not in seen_ids:
+            seen_ids.add(message.id)
+            yield message
+        elif i18n_node is not None:
+          # Still inside an i18n subtree which is needed for the message.
+          continue
+        self._free_element(node)
+
+  # discovery is one of DISCOVERY_MODES (defaults to DEFAULT_DISCOVERY.)
   @staticmethod
-  def parse_messages(root, on_parse=None):
+  def parse_messages(root, on_parse=None, discovery=None):
     if on_parse is None:
       on_parse = OnParseBase()
+    if discovery is None:
+      discovery = DEFAULT_DISCOVERY
     parser = MessageParser(on_parse, MessageParser.__id)
-    parser._parse_messages(root)
+    if discovery == "xpath":
+      parser._discover_messages(root)
+    elif discovery == "walk":
+      parser._parse_messages(root)
+    else:
+      raise Error("Unknown discovery mode: {0}".format(discovery))
     return parser.messages
 
+  # Streaming variant of parse_messages for documents too large to hold in
+  # memory.  events is an iterable of ("start" | "end", element) tuples such
+  # as returned by lxml.etree.iterparse(..., events=("start", "end")) or
+  # lxml.etree.HTMLPullParser.read_events().  Messages are yielded as soon as
+  # their i18n subtree (or, for attributes, their element) has been seen and
+  # elements are freed once they are no longer needed, so the tree must not be
+  # used afterwards.
+  #
+  # Differences from parse_messages:
+  # - Messages are yielded in document order rather than breadth first.
+  # - Every message ID is yielded once (the first occurrence) but repeated
+  #   occurrences are not checked for ID conflicts since earlier messages are
+  #   not retained.
+  # - There is no on_parse callback since the tree is being torn down.
+  @staticmethod
+  def iter_messages(events):
+    parser = MessageParser(OnParseBase(), MessageParser.__id)
+    return parser._iter_messages(events)
+
 parse_messages = MessageParser.parse_messages
+iter_messages = MessageParser.iter_messages
 
 
 # What are the operations on messages?
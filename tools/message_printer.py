@@ -7,6 +7,11 @@ logger = logging.getLogger(__name__)
 class Error(Exception):
   pass
 
+import sys
+import json
+import weakref
+from collections import OrderedDict
+
 from . import message
 from . import term_printer
 from . import term_styles as S
@@ -16,6 +21,9 @@ class MessagePrinter(object):
   def __init__(self, printer=None):
     self.printer = printer if printer else term_printer.TermPrinter()
 
+  def flush(self):
+    self.printer.flush()
+
   def _write_user_text(self, text):
     p = self.printer
     with p.show_nl(style=S.style_carriage_return):
@@ -84,3 +92,52 @@ class MessagePrinter(object):
       if msg.comment:
         self._print_label_and_text("comment", msg.comment)
       self._write_placeholders(msg.placeholders_by_name)
+
+
+def placeholder_json(placeholder):
+  return OrderedDict([("name", placeholder.name),
+                      ("text", placeholder.text),
+                      ("comment", placeholder.comment),
+                      ("examples", list(placeholder.examples or ()))])
+
+
+# The JSON form of a message.  parts holds the message as text and
+# [placeholder name] slots (see message.message_slots.)
+def message_json(msg):
+  return OrderedDict([
+      ("id", msg.id),
+      ("meaning", msg.meaning),
+      ("comment", msg.comment),
+      ("text", msg.unparse()),
+      ("parts", message.message_slots(msg)),
+      ("placeholders", [placeholder_json(placeholder) for placeholder in msg.placeholders_by_name.values()]),
+  ])
+
+
+# Prints every message as a line of JSON (JSON Lines) for piping into other
+# tools.  Output is written every buffer_size messages; call flush() when done
+# or use the printer as a context manager.  As with term_printer.TermPrinter,
+# the rest is written out when the printer is garbage collected.
+class JsonLinesPrinter(object):
+  def __init__(self, out=sys.stdout, buffer_size=term_printer.DEFAULT_BUFFER_SIZE):
+    self._out = out
+    self._buffer = []
+    self._buffer_size = buffer_size
+    self._encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+    weakref.finalize(self, term_printer.write_buffer, self._buffer, out)
+
+  def print_message(self, msg):
+    self._buffer.append(self._encoder.encode(message_json(msg)) + "\n")
+    if len(self._buffer) >= self._buffer_size:
+      self.flush()
+
+  def flush(self):
+    term_printer.write_buffer(self._buffer, self._out)
+    self._out.flush()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, tb):
+    self.flush()
+    return False
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+logger = logging.getLogger(__name__)
+
+import io
+import sys
+import json
+import time
+import threading
+import contextlib
+import tracemalloc
+from collections import OrderedDict
+
+
+class Error(Exception):
+  pass
+
+
+# Optional instrumentation of the extraction and rewrite hot paths.
+#
+# Instrumented code asks for the active metrics object and reports phases and
+# counters to it:
+#
+#   m = metrics.active()
+#   with m.phase("html_parse"):
+#     ...
+#   m.count("messages", len(messages))
+#
+# By default the active object is NULL_METRICS whose methods do nothing so that
+# the cost of disabled instrumentation is a function call per phase.  Inner
+# loops should sum their counts locally and report them once.
+#
+# Phases nest (e.g. fingerprint runs inside parse_messages) and their times are
+# inclusive.  Phases and counters may be reported from several threads (see
+# translation.render_locales); their times add up.  Only the current process
+# is measured; worker processes of extraction.extract_files are not.
+#
+# Phases:
+#   html_parse: lxml parse of a template.
+#   parse_messages: MessageParser's tree walk (including building messages.)
+#   message_builder: MessageBuilder construction (parsing the message parts.)
+#   fingerprint: computing message IDs.
+#   placeholder_naming: PlaceholderRegistry naming the placeholders.
+#   rewrite: translation.OnParse replacing messages with their translations.
+#   serialize: serializing translated documents.
+#
+# Counters:
+#   nodes_visited, messages, placeholders, rewritten_nodes, rewritten_attribs.
+
+
+class _NullPhase(object):
+  __slots__ = ()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, tb):
+    return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class NullMetrics(object):
+  enabled = False
+
+  def phase(self, name):
+    return _NULL_PHASE
+
+  def count(self, name, n=1):
+    pass
+
+  def _start_tracing(self):
+    pass
+
+  def _stop_tracing(self):
+    pass
+
+
+NULL_METRICS = NullMetrics()
+
+
+class _Phase(object):
+  __slots__ = ("_metrics", "_name", "_start")
+
+  def __init__(self, metrics, name):
+    self._metrics = metrics
+    self._name = name
+
+  def __enter__(self):
+    self._start = time.perf_counter()
+    return self
+
+  def __exit__(self, exc_type, exc_value, tb):
+    self._metrics._add_time(self._name, time.perf_counter() - self._start)
+    return False
+
+
+# Collects phase timings (total seconds and number of calls) and counters.
+# With trace_memory=True, collecting() also records the tracemalloc peak and
+# the top_allocations largest allocation sites that are still alive at the end.
+class Metrics(object):
+  enabled = True
+
+  def __init__(self, trace_memory=False, top_allocations=10):
+    self.trace_memory = trace_memory
+    self.top_allocations = top_allocations
+    self._phases = OrderedDict()   # name -> [seconds, calls]
+    self._counters = OrderedDict()
+    self._memory = None
+    # Guards _phases and _counters.
+    self._lock = threading.Lock()
+
+  def phase(self, name):
+    return _Phase(self, name)
+
+  def _add_time(self, name, elapsed):
+    with self._lock:
+      totals = self._phases.get(name)
+      if totals is None:
+        self._phases[name] = [elapsed, 1]
+      else:
+        totals[0] += elapsed
+        totals[1] += 1
+
+  def count(self, name, n=1):
+    with self._lock:
+      self._counters[name] = self._counters.get(name, 0) + n
+
+  def _start_tracing(self):
+    if self.trace_memory:
+      tracemalloc.start()
+
+  def _stop_tracing(self):
+    if not self.trace_memory:
+      return
+    try:
+      (current, peak) = tracemalloc.get_traced_memory()
+      statistics = tracemalloc.take_snapshot().statistics("lineno")[:self.top_allocations]
+    finally:
+      tracemalloc.stop()
+    self._memory = OrderedDict([
+        ("current_bytes", current),
+        ("peak_bytes", peak),
+        ("top_allocations", [OrderedDict([("location", "{0}:{1}".format(stat.traceback[0].filename,
+                                                                         stat.traceback[0].lineno)),
+                                          ("bytes", stat.size),
+                                          ("count", stat.count)])
+                             for stat in statistics]),
+    ])
+
+  # Copies of the phase totals and counters.
+  def _snapshot(self):
+    with self._lock:
+      return (OrderedDict((name, tuple(totals)) for (name, totals) in self._phases.items()),
+              OrderedDict(self._counters))
+
+  def to_dict(self):
+    (phases, counters) = self._snapshot()
+    result = OrderedDict()
+    result["phases"] = OrderedDict(
+        (name, OrderedDict([("seconds", round(seconds, 6)), ("calls", calls)]))
+        for (name, (seconds, calls)) in phases.items())
+    result["counters"] = counters
+    if self._memory is not None:
+      result["memory"] = self._memory
+    return result
+
+  def to_json(self):
+    return json.dumps(self.to_dict(), indent=2)
+
+  # Prometheus text exposition format.
+  def to_prometheus(self, prefix="ng_i18n"):
+    lines = []
+    def metric(name, kind, samples):
+      lines.append("# TYPE {0}_{1} {2}".format(prefix, name, kind))
+      for (labels, value) in samples:
+        lines.append("{0}_{1}{2} {3}".format(prefix, name, labels, value))
+    (phases, counters) = self._snapshot()
+    phases = phases.items()
+    if phases:
+      metric("phase_seconds_total", "counter",
+             [('{{phase="{0}"}}'.format(name), repr(seconds)) for (name, (seconds, calls)) in phases])
+      metric("phase_calls_total", "counter",
+             [('{{phase="{0}"}}'.format(name), calls) for (name, (seconds, calls)) in phases])
+    for (name, value) in counters.items():
+      metric(name + "_total", "counter", [("", value)])
+    if self._memory is not None:
+      metric("tracemalloc_current_bytes", "gauge", [("", self._memory["current_bytes"])])
+      metric("tracemalloc_peak_bytes", "gauge", [("", self._memory["peak_bytes"])])
+    return "\n".join(lines) + "\n"
+
+
+_active = NULL_METRICS
+
+
+def active():
+  return _active
+
+
+# Makes metrics the active metrics object for the duration of the with block.
+@contextlib.contextmanager
+def collecting(metrics):
+  global _active
+  previous = _active
+  _active = metrics
+  metrics._start_tracing()
+  try:
+    yield metrics
+  finally:
+    metrics._stop_tracing()
+    _active = previous
+
+
+FORMATS = ("json", "prometheus")
+
+
+# Command line options shared by the scripts.
+def add_arguments(parser):
+  parser.add_argument("--metrics", choices=FORMATS, default=None,
+                      help="Collect per phase timings and counters and report them in this format")
+  parser.add_argument("--metrics-file", default=None,
+                      help="Write the metrics report to this file (default: stderr)")
+  parser.add_argument("--trace-memory", action="store_true",
+                      help="Also report the tracemalloc peak and top allocations (slow)")
+
+
+def from_args(args):
+  if not args.metrics:
+    return NULL_METRICS
+  return Metrics(trace_memory=args.trace_memory)
+
+
+def write_report(metrics, fmt, fname=None):
+  if not metrics.enabled:
+    return
+  if fmt not in FORMATS:
+    raise Error("Unknown metrics format: {0}".format(fmt))
+  report = metrics.to_json() + "\n" if fmt == "json" else metrics.to_prometheus()
+  if fname is None:
+    sys.stderr.write(report)
+    return
+  with io.open(fname, "wt", encoding="utf-8") as f:
+    f.write(report)
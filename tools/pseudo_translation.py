@@ -4,6 +4,7 @@
 import logging
 logger = logging.getLogger(__name__)
 
+import functools
 import itertools
 from collections import deque, OrderedDict, namedtuple, defaultdict
 import lxml.html
@@ -18,27 +19,110 @@ class Error(Exception):
   pass
 
 
+# Pseudo translation: a fake locale that makes untranslated, truncated or
+# otherwise mangled strings easy to spot in the UI.
+#
+# PseudoTranslator is a translator (see translation.catalog_translator) that
+# returns a new Message and leaves the source message (and its parts) alone.
+# Strategies:
+#   accents: decorate every printable ASCII character of a word with a
+#       combining umlaut.
+#   keep_source_words: emit every word followed by its accented version.
+#   expansion: pad every text run with about expansion * its length "~"
+#       characters to simulate languages with longer strings (e.g. 0.3.)
+#   brackets: wrap the whole message in ⟦ ⟧ to reveal truncation and strings
+#       that were assembled from pieces.
+#   bidi: wrap every word in RIGHT-TO-LEFT OVERRIDE ... POP DIRECTIONAL
+#       FORMATTING so that the text renders right to left.
+# The defaults give the original pseudo translation ("word wöröd").
+#
+# Words and text runs repeat a lot across a catalog so both are memoized per
+# translator.  The caches are bounded LRU caches so that long running processes
+# do not keep every word and text run they ever saw.
+
 UMLAUT = "\u0308"
+EXPANSION_CHAR = "~"
+BEGIN_BRACKET = "\u27e6"
+END_BRACKET = "\u27e7"
+RLO = "\u202e"
+PDF = "\u202c"
+
+_ACCENT_TABLE = str.maketrans(dict((chr(c), chr(c) + UMLAUT) for c in range(33, 127)))
+
+_WORD_RE = re.compile(r"\w+")
+
+_WORD_CACHE_SIZE = 65536
+_TEXT_CACHE_SIZE = 65536
+
+
+class PseudoTranslator(object):
+  def __init__(self, accents=True, keep_source_words=True, expansion=0, brackets=False, bidi=False):
+    if expansion < 0:
+      raise Error("expansion must not be negative: {0}".format(expansion))
+    self.accents = accents
+    self.keep_source_words = keep_source_words
+    self.expansion = expansion
+    self.brackets = brackets
+    self.bidi = bidi
+    self.translate_word = functools.lru_cache(maxsize=_WORD_CACHE_SIZE)(self._translate_word)
+    self.translate_text = functools.lru_cache(maxsize=_TEXT_CACHE_SIZE)(self._translate_text)
+
+  def _translate_word(self, word):
+    translated = word.translate(_ACCENT_TABLE) if self.accents else word
+    if self.keep_source_words:
+      translated = word + " " + translated
+    if self.bidi:
+      translated = RLO + translated + PDF
+    return translated
 
-def _pseudo_translate_word(word):
-  accented_word = "".join(c + UMLAUT if 33 <= ord(c) <= 126 else c for c in word)
-  return word + " " + accented_word
+  def _translate_text(self, text):
+    translate_word = self.translate_word
+    translated = _WORD_RE.sub(lambda m: translate_word(m.group()), text)
+    if self.expansion:
+      stripped = translated.rstrip()
+      padding = EXPANSION_CHAR * int(round(len(text.strip()) * self.expansion))
+      translated = stripped + padding + translated[len(stripped):]
+    return translated
 
-def _pseudo_translate_text(text):
-  return re.sub(r"\w+", lambda m: _pseudo_translate_word(m.group()), text)
+  def _translate_part(self, part):
+    if isinstance(part, str):
+      return self.translate_text(part)
+    elif isinstance(part, message.Placeholder):
+      return part
+    elif isinstance(part, message.HtmlTagPair):
+      return part.copy_with_parts(self.translate_parts(part.parts))
+    else:
+      raise Error("Unexpected condition")
 
-def _pseudo_translate_part(part):
-  if isinstance(part, str):
-    return _pseudo_translate_text(part)
-  elif isinstance(part, message.Placeholder):
-    return part
-  elif isinstance(part, message.TagPair):
-    part.parts = list(map(_pseudo_translate_part, part.parts))
-    return part
-  else:
-    raise Error("Unexpected condition")
+  def translate_parts(self, parts):
+    return [self._translate_part(part) for part in parts]
 
+  def _add_brackets(self, parts):
+    parts = list(parts)
+    if parts and isinstance(parts[0], str):
+      parts[0] = BEGIN_BRACKET + parts[0]
+    else:
+      parts.insert(0, BEGIN_BRACKET)
+    if isinstance(parts[-1], str):
+      parts[-1] = parts[-1] + END_BRACKET
+    else:
+      parts.append(END_BRACKET)
+    return parts
 
+  def translate(self, msg):
+    parts = self.translate_parts(msg.parts)
+    if self.brackets:
+      parts = self._add_brackets(parts)
+    return message.Message(id=msg.id, meaning=msg.meaning, comment=msg.comment,
+                           parts=parts, placeholders_by_name=msg.placeholders_by_name)
+
+  __call__ = translate
+
+
+DEFAULT_PSEUDO_TRANSLATOR = PseudoTranslator()
+
+
+# Returns the pseudo translation of msg as a new Message.
 def pseudo_translate(msg):
-  msg.parts = list(map(_pseudo_translate_part, msg.parts))
-  return msg
+  return DEFAULT_PSEUDO_TRANSLATOR.translate(msg)
+
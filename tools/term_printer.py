@@ -7,18 +7,54 @@ logger = logging.getLogger(__name__)
 import sys, os, errno, io, subprocess, re, textwrap
 import collections, functools, itertools
 import contextlib
+import weakref
 
 
 nop = lambda x: x
 
+# Number of pieces of output (indents, styled text, newlines) collected before
+# they are written out in one go.
+DEFAULT_BUFFER_SIZE = 8192
 
+
+# Writes the pieces of output in buffer (a list of str) to out and empties it.
+def write_buffer(buffer, out):
+  if buffer:
+    out.write("".join(buffer))
+    del buffer[:]
+
+
+# Output is collected and written to out every buffer_size pieces (pass 0 to
+# write through.)  Call flush() when done printing or use the printer as a
+# context manager.  Whatever is still buffered when the printer is garbage
+# collected or the interpreter exits is written out then.
 class TermPrinter(object):
-  def __init__(self, out=sys.stdout):
+  def __init__(self, out=sys.stdout, buffer_size=DEFAULT_BUFFER_SIZE):
     self._indent = ""
     self._out = out
     self._at_newline = True
     self._nl_char = ""
     self._nl_style = nop
+    self._buffer = []
+    self._buffer_size = buffer_size
+    weakref.finalize(self, write_buffer, self._buffer, out)
+
+  def _emit(self, s):
+    buffer = self._buffer
+    buffer.append(s)
+    if len(buffer) >= self._buffer_size:
+      self.flush()
+
+  def flush(self):
+    write_buffer(self._buffer, self._out)
+    self._out.flush()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, tb):
+    self.flush()
+    return False
 
   @contextlib.contextmanager
   def show_nl(self, char="↵", style=None):
@@ -42,25 +78,32 @@ class TermPrinter(object):
     if not part:
       return
     if self._at_newline:
-      self._out.write(self._indent)
+      self._emit(self._indent)
       self._at_newline = False
-    self._out.write(style(part))
+    self._emit(part if style is nop else style(part))
 
   def _write_nl(self):
     if self._nl_char:
-      self._out.write(self._indent)
-      self._out.write(self._nl_style(self._nl_char))
-    self._out.write("\n")
+      self._emit(self._indent)
+      self._emit(self._nl_style(self._nl_char))
+    self._emit("\n")
     self._at_newline = True
 
   def print(self, s="", style=None):
-    self.write(s+"\n", style=style)
+    if "\n" in s:
+      self.write(s+"\n", style=style)
+      return
+    self._write_part_of_single_line(s, style=style or nop)
+    self._write_nl()
 
   def write(self, s, style=None):
     if not s:
       return
     if not style:
       style = nop
+    if "\n" not in s:
+      self._write_part_of_single_line(s, style=style)
+      return
     parts_iter = iter(s.split("\n"))
     self._write_part_of_single_line(next(parts_iter), style=style)
     for part in parts_iter:
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+logger = logging.getLogger(__name__)
+
+import io
+import os
+import copy
+import concurrent.futures
+from collections import namedtuple, OrderedDict
+
+import lxml.html
+
+from . import escaping
+from . import message
+from . import metrics
+from . import validation
+
+
+class Error(Exception):
+  pass
+
+
+# A translator is any callable that takes a source Message and returns the
+# translated Message or None if no translation is available.  This one looks
+# the translations up by message ID in a mapping such as the OrderedDict
+# returned by parse_messages.
+def catalog_translator(translated_messages):
+  return lambda msg: translated_messages.get(msg.id)
+
+
+def node_fromstring(html):
+  html = '<html><body>%s</body></html>' % html
+  doc = lxml.html.document_fromstring(html)
+  return next(e for e in doc if e.tag == 'body')
+
+
+# The parsed form of a translated message (given as HTML, see
+# escaping.escape_message): the leading text and the top level child elements
+# (with their tails) that replace the contents of the i18n node.
+class Fragment(object):
+  def __init__(self, translated_html):
+    translated_node = node_fromstring(translated_html)
+    self.text = translated_node.text
+    self.children = tuple(translated_node)
+
+  def apply(self, node):
+    node.text = self.text
+    node[:] = [copy.deepcopy(child) for child in self.children]
+
+
+# Fragments of translated messages keyed by message ID.  The same messages tend
+# to occur over and over again (e.g. in shared layout templates) so we only pay
+# for the HTML parse of a translated message once and just copy the prebuilt
+# elements for every other occurrence.  A cache is only valid for a single
+# locale (translator) but can and should be shared across documents.
+#
+# The translated messages are escaped once per context and kept in escaped (an
+# escaping.EscapedMessageCache) so that attribute values are not looked up
+# and escaped again for every occurrence either.
+class FragmentCache(object):
+  def __init__(self):
+    self._fragments = {}
+    self.escaped = escaping.EscapedMessageCache()
+
+  def get(self, message_id):
+    return self._fragments.get(message_id)
+
+  def add(self, message_id, translated_message):
+    fragment = Fragment(self.escaped.add(message_id, translated_message, escaping.CONTEXT_HTML))
+    self._fragments[message_id] = fragment
+    return fragment
+
+  def __len__(self):
+    return len(self._fragments)
+
+
+# Rewrites the DOM as it is being parsed.  Each message is translated right
+# after it has been built from its node so that a source document only needs to
+# be parsed and walked once to both extract and translate it.
+class OnParse(message.OnParseBase):
+  def __init__(self, translator, fragment_cache=None):
+    self._translator = translator
+    self._fragment_cache = fragment_cache if fragment_cache is not None else FragmentCache()
+    self.missing_ids = set()
+
+  # Translations are checked against the structure of the source message
+  # (once per message ID and fragment cache) and rejected with Error if they do
+  # not match.  Catalogs should be checked up front with
+  # validation.import_translations.
+  def _translate(self, msg):
+    translated_message = self._translator(msg)
+    if translated_message is None:
+      if msg.id not in self.missing_ids:
+        logger.warning("No translation for message id=%s: %r", msg.id, msg.unparse())
+        self.missing_ids.add(msg.id)
+      return None
+    problems = validation.check_message(msg, translated_message)
+    if problems:
+      raise Error("Translation of message id={0} does not match its source message: {1}".format(
+          msg.id, "; ".join(problems)))
+    return translated_message
+
+  def on_node(self, message, node):
+    m = metrics.active()
+    with m.phase("rewrite"):
+      fragment = self._fragment_cache.get(message.id)
+      if fragment is None and message.id not in self.missing_ids:
+        translated_message = self._translate(message)
+        if translated_message is not None:
+          fragment = self._fragment_cache.add(message.id, translated_message)
+      if fragment is not None:
+        fragment.apply(node)
+      del node.attrib["i18n"]
+    m.count("rewritten_nodes")
+
+  def on_attrib(self, message, node, attr):
+    m = metrics.active()
+    with m.phase("rewrite"):
+      # lxml escapes attribute values when serializing so the value is set
+      # unescaped (CONTEXT_RAW.)
+      escaped = self._fragment_cache.escaped
+      value = escaped.get(message.id, escaping.CONTEXT_RAW)
+      if value is None and message.id not in self.missing_ids:
+        translated_message = self._translate(message)
+        if translated_message is not None:
+          value = escaped.add(message.id, translated_message, escaping.CONTEXT_RAW)
+      if value is not None:
+        node.attrib[attr] = value
+      # TODO: this may not be present for implicitly extracted attributes.
+      del node.attrib["i18n-" + attr]
+    m.count("rewritten_attribs")
+
+
+# Result of translating a document.
+#   messages: the extracted source messages (as returned by parse_messages.)
+#   missing_ids: IDs of the messages that had no translation.
+TranslationResult = namedtuple("TranslationResult", ("messages", "missing_ids"))
+
+
+# Translates the DOM rooted at root in place in a single traversal.  Pass the
+# same fragment_cache when translating several documents into the same locale.
+def translate_document(root, translator, fragment_cache=None):
+  on_parse = OnParse(translator, fragment_cache)
+  messages = message.parse_messages(root, on_parse=on_parse)
+  return TranslationResult(messages=messages, missing_ids=on_parse.missing_ids)
+
+
+def translate_html_file(src_fname, translator, fragment_cache=None):
+  m = metrics.active()
+  with m.phase("html_parse"):
+    doc = lxml.html.parse(src_fname).getroot()
+  result = translate_document(doc, translator, fragment_cache)
+  with m.phase("serialize"):
+    translated_html = lxml.html.tostring(doc, method="html", encoding="unicode")
+  return (translated_html, result)
+
+
+def translate_html_file_to(src_fname, dest_fname, translator, fragment_cache=None):
+  (translated_html, result) = translate_html_file(src_fname, translator, fragment_cache)
+  with io.open(dest_fname, "wt", encoding="utf-8") as f:
+    f.write(translated_html)
+  return (translated_html, result)
+
+
+# Records where the messages of a document have to be substituted: the index
+# of the element in root.iter() order and the attribute (None for the contents
+# of an i18n element.)
+class _SubstitutionRecorder(message.OnParseBase):
+  def __init__(self):
+    self.points = []
+
+  def on_attrib(self, message, node, attr):
+    self.points.append((node, attr, message))
+
+  def on_node(self, message, node):
+    self.points.append((node, None, message))
+
+
+# A source document that has been parsed and analyzed once and can then be
+# rendered into any number of locales.  Rendering copies the pristine tree and
+# applies the recorded substitutions so the cost per locale is a tree copy plus
+# the substitutions rather than a parse and a full message extraction.
+class AnalyzedDocument(object):
+  def __init__(self, root):
+    self.root = root
+    recorder = _SubstitutionRecorder()
+    self.messages = message.parse_messages(root, on_parse=recorder)
+    element_indexes = dict((node, i) for (i, node) in enumerate(root.iter()))
+    self._points = [(element_indexes[node], attr, msg) for (node, attr, msg) in recorder.points]
+
+  @classmethod
+  def from_file(cls, fname):
+    with metrics.active().phase("html_parse"):
+      root = lxml.html.parse(fname).getroot()
+    return cls(root)
+
+  # Returns (translated root, TranslationResult.)  Thread safe as long as
+  # every thread uses its own fragment_cache.
+  def render(self, translator, fragment_cache=None):
+    root = copy.deepcopy(self.root)
+    nodes = list(root.iter())
+    on_parse = OnParse(translator, fragment_cache)
+    for (index, attr, msg) in self._points:
+      if attr is None:
+        on_parse.on_node(msg, nodes[index])
+      else:
+        on_parse.on_attrib(msg, nodes[index], attr)
+    return (root, TranslationResult(messages=self.messages, missing_ids=on_parse.missing_ids))
+
+  def render_html(self, translator, fragment_cache=None):
+    (root, result) = self.render(translator, fragment_cache)
+    with metrics.active().phase("serialize"):
+      translated_html = lxml.html.tostring(root, method="html", encoding="unicode")
+    return (translated_html, result)
+
+
+# Returns an OrderedDict of message ID -> Message of all the analyzed
+# documents (a mapping of filename -> AnalyzedDocument.)  Like
+# extraction.merge_extractions, raises message.MessageIdConflictError if two
+# documents have different messages with the same ID.
+def merge_analyzed_messages(analyzed):
+  messages = OrderedDict()
+  for (fname, document) in analyzed.items():
+    try:
+      for msg in document.messages.values():
+        message.add_message(messages, msg)
+    except message.MessageIdConflictError as e:
+      raise message.MessageIdConflictError("{0}: {1}".format(fname, e))
+  return messages
+
+
+def _render_html_to(analyzed, translator, fragment_cache, dest_fname):
+  (translated_html, result) = analyzed.render_html(translator, fragment_cache)
+  dirname = os.path.dirname(dest_fname)
+  if dirname:
+    os.makedirs(dirname, exist_ok=True)
+  with io.open(dest_fname, "wt", encoding="utf-8") as f:
+    f.write(translated_html)
+  return result
+
+
+# Renders an AnalyzedDocument into every locale of translators (an ordered
+# mapping of locale -> translator) on a pool of jobs threads and writes the
+# results to dest_fname_format.format(locale=locale).  fragment_caches maps
+# locales to their FragmentCache; pass the same dict for every document of a
+# build.  Returns an OrderedDict of locale -> TranslationResult.
+#
+# Threads rather than processes because the translators (often lambdas) and
+# fragment caches are not picklable; lxml releases the GIL while serializing.
+def render_locales(analyzed, translators, dest_fname_format, jobs=None, fragment_caches=None):
+  if fragment_caches is None:
+    fragment_caches = {}
+  for locale in translators:
+    if locale not in fragment_caches:
+      fragment_caches[locale] = FragmentCache()
+  dest_fnames = OrderedDict((locale, dest_fname_format.format(locale=locale)) for locale in translators)
+  if jobs is None:
+    jobs = os.cpu_count() or 1
+  if jobs <= 1 or len(translators) <= 1:
+    return OrderedDict(
+        (locale, _render_html_to(analyzed, translator, fragment_caches[locale], dest_fnames[locale]))
+        for (locale, translator) in translators.items())
+  with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+    futures = OrderedDict(
+        (locale, executor.submit(_render_html_to, analyzed, translator, fragment_caches[locale],
+                                 dest_fnames[locale]))
+        for (locale, translator) in translators.items())
+    return OrderedDict((locale, future.result()) for (locale, future) in futures.items())
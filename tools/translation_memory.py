@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+logger = logging.getLogger(__name__)
+
+import array
+import math
+import re
+from collections import Counter, namedtuple
+
+from . import message
+
+
+class Error(Exception):
+  pass
+
+
+# Translation memory: finds the translations of previous source messages that
+# are similar to a new one (e.g. a message whose text changed and thus got a
+# new ID.)
+#
+# Source messages are normalized to lower case text with every placeholder
+# reduced to its name (so "Hello <b>{{user}}</b>" and "Hello {{user}}" only
+# differ in the B_BEGIN / B_END names) and split into character or word
+# n-grams.  The similarity of two messages is the Jaccard index of their n-gram
+# sets.
+#
+# Lookups use an inverted index (n-gram -> entries) with count filtering: a
+# message with a similarity of at least min_score to a query of q n-grams
+# shares at least a = ceil(min_score * q) of them.  The posting lists of the
+# query's n-grams are scanned from the shortest up and the number of times
+# every entry is found counted.  Up to a - 1 of the longest lists (common
+# n-grams) are skipped; an entry then has to be found at least a - skipped
+# times to remain a candidate and only the candidates are scored.
+#
+# Word n-grams are the default: the posting lists of character n-grams are
+# much longer and lookups in a large memory take several times as long.
+
+CHAR_NGRAMS = "char"
+WORD_NGRAMS = "word"
+NGRAM_MODES = (CHAR_NGRAMS, WORD_NGRAMS)
+
+DEFAULT_N = {CHAR_NGRAMS: 3, WORD_NGRAMS: 1}
+DEFAULT_K = 3
+DEFAULT_MIN_SCORE = 0.5
+
+# source and translation are the normalized texts (see normalized_text.)
+Match = namedtuple("Match", ("score", "source_id", "source", "translation"))
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+# Posting lists longer than this (or than the number of entries divided by
+# _LONG_POSTINGS_DIVISOR) are skipped by lookups when possible.
+_MIN_LONG_POSTINGS = 1000
+_LONG_POSTINGS_DIVISOR = 100
+
+# Placeholders are mapped to single characters of the supplementary private
+# use area so that the n-grams can be taken by slicing strings.
+_PLACEHOLDER_CHAR_BASE = 0xF0000
+_MAX_PLACEHOLDER_NAMES = 0x10000
+
+
+# The text of a message as a list of strings and [placeholder name] slots
+# (see message.message_slots) with the placeholders written as {NAME}.
+def normalized_text(slots):
+  return "".join(slot if isinstance(slot, str) else "{%s}" % slot[0] for slot in slots)
+
+
+class TranslationMemory(object):
+  def __init__(self, mode=WORD_NGRAMS, n=None):
+    if mode not in NGRAM_MODES:
+      raise Error("Unknown n-gram mode: {0}".format(mode))
+    self.mode = mode
+    self.n = n or DEFAULT_N[mode]
+    if self.n < 1:
+      raise Error("Invalid n-gram size: {0}".format(self.n))
+    self._placeholder_chars = {}
+    self._vocabulary = {}     # n-gram -> n-gram ID
+    self._postings = []       # n-gram ID -> array of entry indexes
+    self._entries = []        # entry index -> (source ID, source, translation)
+    # The n-gram IDs of entry i are _entry_grams[_entry_offsets[i]:_entry_offsets[i + 1]].
+    self._entry_grams = array.array("I")
+    self._entry_offsets = array.array("L", [0])
+
+  def __len__(self):
+    return len(self._entries)
+
+  @property
+  def num_ngrams(self):
+    return len(self._vocabulary)
+
+  def _placeholder_char(self, name):
+    char = self._placeholder_chars.get(name)
+    if char is None:
+      if len(self._placeholder_chars) >= _MAX_PLACEHOLDER_NAMES:
+        raise Error("Too many distinct placeholder names")
+      char = self._placeholder_chars[name] = chr(_PLACEHOLDER_CHAR_BASE + len(self._placeholder_chars))
+    return char
+
+  def _symbols(self, slots):
+    text = "".join(slot.lower() if isinstance(slot, str) else self._placeholder_char(slot[0])
+                   for slot in slots)
+    return " ".join(text.split())
+
+  # The set of n-grams of a list of slots.  Character n-grams are taken over
+  # the text padded with a space on each side so that short messages and the
+  # start and end of a message count.
+  def ngrams(self, slots):
+    text = self._symbols(slots)
+    if not text:
+      return set()
+    n = self.n
+    if self.mode == CHAR_NGRAMS:
+      text = " " + text + " "
+      if len(text) <= n:
+        return set([text])
+      return set(text[i:i + n] for i in range(len(text) - n + 1))
+    words = _WORD_RE.findall(text)
+    if len(words) <= n:
+      return set([" ".join(words)])
+    return set(" ".join(words[i:i + n]) for i in range(len(words) - n + 1))
+
+  # Adds the translation of a source message.  source_slots and
+  # translation_slots as returned by message.message_slots.  Messages without
+  # any text are not indexed.
+  def add(self, source_id, source_slots, translation_slots):
+    grams = self.ngrams(source_slots)
+    if not grams:
+      return
+    entry = len(self._entries)
+    self._entries.append((source_id, normalized_text(source_slots), normalized_text(translation_slots)))
+    vocabulary, postings, entry_grams = self._vocabulary, self._postings, self._entry_grams
+    for gram in grams:
+      gram_id = vocabulary.get(gram)
+      if gram_id is None:
+        gram_id = vocabulary[gram] = len(postings)
+        postings.append(array.array("I"))
+      postings[gram_id].append(entry)
+      entry_grams.append(gram_id)
+    self._entry_offsets.append(len(entry_grams))
+
+  def add_message(self, source_message, translated_message):
+    self.add(source_message.id, message.message_slots(source_message), message.message_slots(translated_message))
+
+  # Returns up to k Matches for the slots of a message with a score of at
+  # least min_score (0 < min_score <= 1), best first.  Entries with the same
+  # source and translation are only returned once.  stats (if given) is
+  # updated with the number of posting list entries "scanned" and of
+  # "candidates" scored.
+  def lookup(self, slots, k=DEFAULT_K, min_score=DEFAULT_MIN_SCORE, stats=None):
+    if not 0 < min_score <= 1:
+      raise Error("min_score must be in (0, 1]: {0}".format(min_score))
+    grams = self.ngrams(slots)
+    size = len(grams)
+    if not size or k < 1:
+      return []
+    vocabulary, postings = self._vocabulary, self._postings
+    # n-grams that are not in the memory cannot be shared.
+    known = [vocabulary[gram] for gram in grams if gram in vocabulary]
+    min_overlap = max(1, int(math.ceil(min_score * size - 1e-9)))
+    if len(known) < min_overlap:
+      return []
+    known.sort(key=lambda gram_id: len(postings[gram_id]))
+    num_scanned = len(known)
+    long_postings = max(_MIN_LONG_POSTINGS, len(self._entries) // _LONG_POSTINGS_DIVISOR)
+    while num_scanned > len(known) - min_overlap + 1 and len(postings[known[num_scanned - 1]]) > long_postings:
+      num_scanned -= 1
+    counts = Counter()
+    for gram_id in known[:num_scanned]:
+      counts.update(postings[gram_id])
+    skipped = set(known[num_scanned:])
+    min_count = min_overlap - len(skipped)
+    # A similarity of min_score to an entry of e n-grams takes an overlap of
+    # at least min_score * (size + e) / (1 + min_score) n-grams.
+    overlap_factor = min_score / (1 + min_score)
+    min_size = min_score * size
+    max_size = size / min_score
+    entry_grams, entry_offsets = self._entry_grams, self._entry_offsets
+    num_candidates = 0
+    scored = []
+    for (entry, count) in counts.items():
+      if count < min_count:
+        continue
+      start = entry_offsets[entry]
+      end = entry_offsets[entry + 1]
+      entry_size = end - start
+      if entry_size < min_size or entry_size > max_size:
+        continue
+      if count + len(skipped) < overlap_factor * (size + entry_size) - 1e-9:
+        continue
+      num_candidates += 1
+      overlap = count
+      if skipped:
+        overlap += len(skipped.intersection(entry_grams[start:end]))
+      score = overlap / (size + entry_size - overlap)
+      if score >= min_score:
+        scored.append((score, -entry))
+    if stats is not None:
+      stats["scanned"] = stats.get("scanned", 0) + sum(len(postings[gram_id]) for gram_id in known[:num_scanned])
+      stats["candidates"] = stats.get("candidates", 0) + num_candidates
+    matches = []
+    seen = set()
+    # Ties go to the entry added first.
+    for (score, negative_entry) in sorted(scored, reverse=True):
+      (source_id, source, translation) = self._entries[-negative_entry]
+      if (source, translation) not in seen:
+        seen.add((source, translation))
+        matches.append(Match(score, source_id, source, translation))
+        if len(matches) == k:
+          break
+    return matches
+
+  def lookup_message(self, msg, k=DEFAULT_K, min_score=DEFAULT_MIN_SCORE, stats=None):
+    return self.lookup(message.message_slots(msg), k=k, min_score=min_score, stats=stats)
+
+
+# Builds a TranslationMemory from translations (message ID -> translated
+# Message, as returned by catalog_formats.read_translations) of the messages of
+# source_messages (message ID -> Message, e.g. a BinaryCatalog.)
+def build_memory(source_messages, translations, mode=WORD_NGRAMS, n=None):
+  memory = TranslationMemory(mode=mode, n=n)
+  for (message_id, translated_message) in translations.items():
+    source_message = source_messages.get(message_id)
+    if source_message is None:
+      logger.warning("Skipping translation of unknown message id=%s", message_id)
+    else:
+      memory.add_message(source_message, translated_message)
+  return memory
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import concurrent.futures
+from collections import Counter, namedtuple, OrderedDict
+
+import lxml.etree
+
+from . import catalog_formats
+from . import fingerprint
+from . import message
+
+
+class Error(Exception):
+  pass
+
+
+# Raised by import_translations when translation files do not match the source
+# messages.  violations lists every problem that was found.
+class ValidationError(Error):
+  def __init__(self, violations):
+    fnames = set(violation.fname for violation in violations)
+    super(ValidationError, self).__init__("{0} problems in {1} of the translation files".format(
+        len(violations), len(fnames)))
+    self.violations = violations
+
+
+# Structural validation of translated messages.
+#
+# A translation has to keep the structure of its source message: the same
+# placeholders (each as many times) and the same tag pairs nested the same way.
+# Text, the order of the placeholders and the order of sibling tag pairs may
+# change.  Message IDs only guarantee this for translations that were made for
+# the current source message, not for the messages of a vendor file against an
+# older catalog or for overridden IDs.
+#
+# The structure is captured in a Signature:
+#   placeholders: sorted tuple of (placeholder name, count) of the
+#       placeholders other than tag pairs.
+#   tags: the tag pairs as a sorted tuple of (begin placeholder name, end
+#       placeholder name, tags of its contents).
+#
+# The Signatures of the source messages are all that is needed to check the
+# tokens of a translation file (see check_tokens) so translation files can be
+# checked without the source messages.
+Signature = namedtuple("Signature", ("placeholders", "tags"))
+
+# A problem with the translation of message_id in the file fname (None for
+# translations that were not read from a file.)
+Violation = namedtuple("Violation", ("fname", "message_id", "problem"))
+
+
+def structural_signature(msg):
+  counts = Counter()
+  def tag_shape(parts):
+    tags = []
+    for part in parts:
+      if isinstance(part, message.TagPair):
+        tags.append((part.ph_begin.name, part.ph_end.name, tag_shape(part.parts)))
+      elif isinstance(part, message.Placeholder):
+        counts[part.name] += 1
+    return tuple(sorted(tags))
+  tags = tag_shape(msg.parts)
+  return Signature(tuple(sorted(counts.items())), tags)
+
+
+# Returns a dict of message ID -> Signature for a mapping of message ID ->
+# source Message.
+def structural_signatures(source_messages):
+  return dict((message_id, structural_signature(msg)) for (message_id, msg) in source_messages.items())
+
+
+def _format_tags(tags):
+  return " ".join(name + ("(" + _format_tags(children) + ")" if children else "")
+                  for (name, end_name, children) in tags) or "none"
+
+
+def _format_count(name, count):
+  return name if count == 1 else "{0} x {1}".format(count, name)
+
+
+# Returns a list of the differences between the Signature of a source message
+# (expected) and that of its translation (actual.)
+def signature_problems(expected, actual):
+  problems = []
+  if expected.placeholders != actual.placeholders:
+    expected_counts = Counter(dict(expected.placeholders))
+    actual_counts = Counter(dict(actual.placeholders))
+    for (name, count) in sorted((expected_counts - actual_counts).items()):
+      problems.append("missing placeholder " + _format_count(name, count))
+    for (name, count) in sorted((actual_counts - expected_counts).items()):
+      problems.append("unexpected placeholder " + _format_count(name, count))
+  if expected.tags != actual.tags:
+    problems.append("tags {0} instead of {1}".format(_format_tags(actual.tags), _format_tags(expected.tags)))
+  return problems
+
+
+# Returns a list of the problems of translated_message as the translation of
+# source_message (empty if it is compatible.)
+def check_message(source_message, translated_message):
+  return signature_problems(structural_signature(source_message), structural_signature(translated_message))
+
+
+# Returns a list of the problems of the tokens of a translation (text and
+# catalog_formats.PlaceholderName, see catalog_formats.read_translation_tokens)
+# against the Signature of its source message (expected.)  The tag pairs are
+# told apart by the placeholder names in expected; any other name counts as a
+# placeholder.  Tokens without problems can be rebuilt into a translated
+# message (see catalog_formats.build_translated_message.)
+def check_tokens(expected, tokens):
+  end_names = {}
+  def add_end_names(tags):
+    for (name, end_name, children) in tags:
+      end_names[name] = end_name
+      add_end_names(children)
+  add_end_names(expected.tags)
+  closing_names = set(end_names.values())
+  counts = Counter()
+  tags = []
+  stack = []  # of (begin name, enclosing tags)
+  for token in tokens:
+    if isinstance(token, str):
+      continue
+    name = token.name
+    if name in end_names:
+      stack.append((name, tags))
+      tags = []
+    elif stack and name == end_names[stack[-1][0]]:
+      (begin_name, enclosing_tags) = stack.pop()
+      enclosing_tags.append((begin_name, name, tuple(sorted(tags))))
+      tags = enclosing_tags
+    elif name in closing_names:
+      return ["unexpected " + name]
+    else:
+      counts[name] += 1
+  if stack:
+    return ["{0} is never closed".format(stack[-1][0])]
+  return signature_problems(expected, Signature(tuple(sorted(counts.items())), tuple(sorted(tags))))
+
+
+# Yields a Violation per problem of the translations (message ID -> translated
+# Message) against signatures (as returned by structural_signatures.)
+# Translations of unknown messages are not violations (see
+# catalog_formats.read_translations.)
+def check_translations(signatures, translations, fname=None):
+  for (message_id, translated_message) in translations.items():
+    expected = signatures.get(message_id)
+    if expected is None:
+      continue
+    for problem in signature_problems(expected, structural_signature(translated_message)):
+      yield Violation(fname, message_id, problem)
+
+
+# Reads the translation file fname and checks the tokens of its translations
+# against signatures (as returned by structural_signatures.)  Translations of
+# messages that are not in signatures are skipped.  Unlike
+# catalog_formats.read_translations, it does not stop at the first translation
+# that has problems.  Returns the tokens (an OrderedDict of message ID ->
+# tokens) and a list of every Violation.
+def validate_translation_file(fname, signatures):
+  try:
+    tokens_by_id = catalog_formats.read_translation_tokens(fname, signatures)
+  except (catalog_formats.Error, EnvironmentError, lxml.etree.LxmlError) as e:
+    # Unknown format, unreadable file or invalid XML.
+    return (OrderedDict(), [Violation(fname, None, str(e))])
+  violations = []
+  for (message_id, tokens) in tokens_by_id.items():
+    for problem in check_tokens(signatures[message_id], tokens):
+      violations.append(Violation(fname, message_id, problem))
+  return (tokens_by_id, violations)
+
+
+# The signatures of the worker processes of import_translations.
+_worker_signatures = None
+
+
+def _init_worker(fingerprint_version, signatures):
+  global _worker_signatures
+  fingerprint.set_default_version(fingerprint_version)
+  _worker_signatures = signatures
+
+
+def _validate_file_in_worker(fname):
+  return validate_translation_file(fname, _worker_signatures)
+
+
+def format_violation(violation):
+  if violation.message_id is None:
+    return "{0}: {1}".format(violation.fname, violation.problem)
+  return "{0}: id={1}: {2}".format(violation.fname, violation.message_id, violation.problem)
+
+
+# Reads and validates the translation files of fnames_by_locale (locale ->
+# filename) against source_messages (message ID -> source Message.)  The
+# signatures of the source messages are computed once and the files are read
+# and checked on a pool of jobs worker processes (defaults to the number of
+# CPUs; with jobs=1 or a single file, everything happens in this process.)
+# The workers only get the signatures; the translated messages are rebuilt
+# from the tokens they return in this process.
+#
+# Returns an OrderedDict of locale -> translations (message ID -> translated
+# Message.)  If any file has problems, raises ValidationError listing all of
+# them, so that bad vendor files are rejected before anything is built.
+def import_translations(fnames_by_locale, source_messages, jobs=None):
+  signatures = structural_signatures(source_messages)
+  locales = list(fnames_by_locale)
+  fnames = [fnames_by_locale[locale] for locale in locales]
+  if jobs is None:
+    jobs = os.cpu_count() or 1
+  jobs = min(jobs, len(fnames))
+  if jobs <= 1:
+    results = [validate_translation_file(fname, signatures) for fname in fnames]
+  else:
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=jobs, initializer=_init_worker,
+        initargs=(fingerprint.default_version(), signatures)) as executor:
+      results = list(executor.map(_validate_file_in_worker, fnames))
+  violations = [violation for (tokens_by_id, file_violations) in results for violation in file_violations]
+  if violations:
+    raise ValidationError(violations)
+  translations_by_locale = OrderedDict()
+  for (locale, (tokens_by_id, file_violations)) in zip(locales, results):
+    translations_by_locale[locale] = OrderedDict(
+        (message_id, catalog_formats.build_translated_message(source_messages[message_id], tokens))
+        for (message_id, tokens) in tokens_by_id.items())
+  return translations_by_locale
+
+
+# Parses the LOCALE=FILE arguments of --translations into an OrderedDict of
+# locale -> filename.
+def parse_translation_args(specs):
+  fnames_by_locale = OrderedDict()
+  for spec in specs:
+    (locale, sep, fname) = spec.partition("=")
+    if not sep:
+      raise Error("Expected LOCALE=FILE: {0}".format(spec))
+    fnames_by_locale[locale] = fname
+  return fnames_by_locale
+
+
+# import_translations for the LOCALE=FILE arguments of --translations (see
+# parse_translation_args) that logs every Violation before raising the
+# ValidationError, so the scripts exit listing every problem.
+def import_translation_args(specs, source_messages, jobs=None):
+  fnames_by_locale = parse_translation_args(specs)
+  try:
+    return import_translations(fnames_by_locale, source_messages, jobs=jobs)
+  except ValidationError as e:
+    for violation in e.violations:
+      logger.error("%s", format_violation(violation))
+    raise
@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import sys
+import json
+import time
+import errno
+import struct
+import select
+import ctypes
+import ctypes.util
+import threading
+import socketserver
+import http.server
+import urllib.parse
+from collections import OrderedDict, namedtuple, deque
+
+import lxml.etree
+
+from . import message
+from . import catalog
+from . import extraction
+from . import message_printer
+
+
+class Error(Exception):
+  pass
+
+
+# Keeps an in-memory catalog of a template tree current and answers queries
+# about it over HTTP (on a TCP port or a Unix socket) so that editor tooling
+# and dev servers don't need to run extract_messages from scratch.
+#
+# Changes are found by polling the mtimes and sizes of the templates.  On Linux
+# inotify is used to wake up as soon as something changes; the poll interval
+# then only matters for changes inotify can't see (e.g. network file systems.)
+# Only the templates that changed are extracted again.
+#
+# Every update that changes the catalog gets a new revision number so that
+# clients can ask for the messages added and removed since the revision they
+# last saw.
+
+
+# The catalog changes of a single update.
+#   revision: the revision after the update.
+#   added_ids, removed_ids: frozensets of message IDs.
+#   files: the filenames that were (re-)extracted or removed.
+Change = namedtuple("Change", ("revision", "added_ids", "removed_ids", "files"))
+
+# Number of Change's kept for changes_since.  Clients that are further behind
+# need to fetch everything again.
+MAX_HISTORY = 1000
+
+DEFAULT_POLL_INTERVAL = 1.0
+
+# Errors that make a single template unusable (invalid i18n markup, a file
+# that went away or cannot be parsed.)  They must not hold up the other
+# templates of an update.
+_TEMPLATE_ERRORS = (message.Error, lxml.etree.LxmlError, EnvironmentError)
+
+
+# Minimal ctypes binding of Linux inotify.  Only used as a wake up signal for
+# TemplateWatcher; what changed is always determined by scanning.
+class _Inotify(object):
+  IN_MODIFY = 0x2
+  IN_ATTRIB = 0x4
+  IN_CLOSE_WRITE = 0x8
+  IN_MOVED_FROM = 0x40
+  IN_MOVED_TO = 0x80
+  IN_CREATE = 0x100
+  IN_DELETE = 0x200
+  IN_DELETE_SELF = 0x400
+  IN_IGNORED = 0x8000
+  IN_NONBLOCK = 0o4000
+  IN_CLOEXEC = 0o2000000
+
+  MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+          IN_CREATE | IN_DELETE | IN_DELETE_SELF)
+
+  # struct inotify_event without the name that follows it.
+  _EVENT = struct.Struct("iIII")
+
+  def __init__(self):
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    self._add_watch = libc.inotify_add_watch
+    self._add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+    self.fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+    if self.fd < 0:
+      raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+    self._watched = {}   # directory -> watch descriptor
+    self._dirnames = {}  # watch descriptor -> directory
+
+  # Returns None if inotify is not available on this system.
+  @classmethod
+  def create(cls):
+    if not sys.platform.startswith("linux"):
+      return None
+    try:
+      return cls()
+    except (OSError, AttributeError) as e:
+      logger.info("inotify is not available, polling only: %s", e)
+      return None
+
+  # Adds watches for the directories that are not watched yet.  Watches are
+  # kept until their directory goes away.
+  def watch_directories(self, dirnames):
+    for dirname in dirnames:
+      if dirname in self._watched:
+        continue
+      wd = self._add_watch(self.fd, os.fsencode(dirname), self.MASK)
+      if wd < 0:
+        logger.debug("Cannot watch %s: %s", dirname, os.strerror(ctypes.get_errno()))
+        continue
+      self._watched[dirname] = wd
+      self._dirnames[wd] = dirname
+
+  # The kernel drops the watch of a directory that went away (or was
+  # unmounted) and reports IN_IGNORED for it.
+  def _forget_ignored_watches(self, data):
+    offset = 0
+    while offset + self._EVENT.size <= len(data):
+      (wd, mask, cookie, name_length) = self._EVENT.unpack_from(data, offset)
+      offset += self._EVENT.size + name_length
+      if mask & self.IN_IGNORED:
+        dirname = self._dirnames.pop(wd, None)
+        if dirname is not None and self._watched.get(dirname) == wd:
+          del self._watched[dirname]
+
+  # Waits up to timeout seconds for events.  Returns True if there were any.
+  def wait(self, timeout):
+    (readable, writable, exceptional) = select.select([self.fd], [], [], timeout)
+    if not readable:
+      return False
+    while True:
+      try:
+        data = os.read(self.fd, 65536)
+      except BlockingIOError:
+        break
+      if not data:
+        break
+      self._forget_ignored_watches(data)
+    return True
+
+  def close(self):
+    os.close(self.fd)
+
+
+# Finds the templates below paths (see extraction.find_template_files) and
+# reports which of them changed between scans.
+class TemplateWatcher(object):
+  def __init__(self, paths, patterns=extraction.DEFAULT_PATTERNS, poll_interval=DEFAULT_POLL_INTERVAL,
+               use_inotify=True):
+    self.paths = list(paths)
+    self.patterns = patterns
+    self.poll_interval = poll_interval
+    self._stats = {}   # filename -> (mtime_ns, size)
+    self._inotify = _Inotify.create() if use_inotify else None
+
+  # Returns (changed, removed): the sorted filenames of the templates that are
+  # new or were modified and of those that went away since the last scan.
+  def scan(self):
+    dirnames = set()
+    try:
+      fnames = extraction.find_template_files(self.paths, self.patterns, walked_dirs=dirnames)
+    except extraction.Error as e:
+      logger.warning("%s", e)
+      fnames = []
+    stats = {}
+    for fname in fnames:
+      try:
+        st = os.stat(fname)
+      except OSError as e:
+        if e.errno != errno.ENOENT:
+          raise
+        continue
+      stats[fname] = (st.st_mtime_ns, st.st_size)
+    changed = sorted(fname for (fname, stat) in stats.items() if self._stats.get(fname) != stat)
+    removed = sorted(fname for fname in self._stats if fname not in stats)
+    self._stats = stats
+    if self._inotify is not None:
+      # The walked directories and those of the templates given as files or
+      # glob matches.
+      dirnames.update(os.path.dirname(os.path.abspath(fname)) for fname in stats)
+      self._inotify.watch_directories(dirnames)
+    return (changed, removed)
+
+  # Sleeps until something may have changed (or the poll interval passed.)
+  def wait(self):
+    if self._inotify is None:
+      time.sleep(self.poll_interval)
+    elif self._inotify.wait(self.poll_interval):
+      # Let editors finish writing (they often write several times.)
+      time.sleep(0.05)
+
+  def close(self):
+    if self._inotify is not None:
+      self._inotify.close()
+      self._inotify = None
+
+
+# The catalog of a template tree and its revision history.  All methods are
+# thread safe.
+class WatchedCatalog(object):
+  def __init__(self, watcher, jobs=1, cache=None):
+    self.watcher = watcher
+    self.jobs = jobs
+    self.cache = cache
+    self.catalog = catalog.Catalog()
+    self.revision = 0
+    self._history = deque(maxlen=MAX_HISTORY)
+    self._lock = threading.Lock()
+
+  # Returns the FileExtraction's of the templates fnames that could be
+  # extracted.  The changed templates are extracted together; if any of them
+  # fails, they are extracted again one by one to find the bad ones, which are
+  # logged and skipped.
+  def _extract(self, fnames):
+    try:
+      return list(extraction.extract_files(fnames, jobs=self.jobs, cache=self.cache))
+    except _TEMPLATE_ERRORS as e:
+      if len(fnames) == 1:
+        logger.error("Skipping %s until it changes again: %s", fnames[0], e)
+        return []
+    extractions = []
+    for fname in fnames:
+      try:
+        extractions.extend(extraction.extract_files([fname], jobs=1, cache=self.cache))
+      except _TEMPLATE_ERRORS as e:
+        logger.error("Skipping %s until it changes again: %s", fname, e)
+    return extractions
+
+  # Scans for changes and re-extracts the changed templates.  Returns the
+  # Change or None if the catalog did not change.  The messages of templates
+  # that cannot be extracted are removed until the template changes again.
+  def update(self):
+    (changed, removed) = self.watcher.scan()
+    if not changed and not removed:
+      return None
+    start = time.perf_counter()
+    extractions = self._extract(changed) if changed else []
+    with self._lock:
+      removed_ids = set()
+      added_ids = set()
+      for fname in removed + changed:
+        removed_ids.update(self.catalog.remove_file(fname))
+      for extracted in extractions:
+        new_ids = set(message_id for message_id in extracted.messages if message_id not in self.catalog)
+        try:
+          self.catalog.add_extraction(extracted)
+        except message.MessageIdConflictError as e:
+          logger.error("Skipping %s until it changes again: %s", extracted.filename, e)
+          continue
+        added_ids.update(new_ids)
+      # Messages that moved between files were removed and added again.
+      unchanged = added_ids & removed_ids
+      added_ids -= unchanged
+      removed_ids -= unchanged
+      if not added_ids and not removed_ids:
+        # e.g. a template was saved without changes to its messages.
+        logger.debug("%d files changed without changing the catalog", len(changed) + len(removed))
+        return None
+      change = Change(revision=self.revision + 1,
+                      added_ids=frozenset(added_ids),
+                      removed_ids=frozenset(removed_ids),
+                      files=tuple(changed + removed))
+      self.revision = change.revision
+      self._history.append(change)
+    logger.info("Revision %d: %d files, %d messages added, %d removed (%.2f s)", change.revision,
+                len(change.files), len(change.added_ids), len(change.removed_ids),
+                time.perf_counter() - start)
+    return change
+
+  def run(self, stop_event=None):
+    while stop_event is None or not stop_event.is_set():
+      self.watcher.wait()
+      try:
+        self.update()
+      except Exception:
+        logger.exception("Update failed")
+
+  # Returns (current revision, changes) where changes is (added IDs, removed
+  # IDs) since revision or None if the history does not reach back that far.
+  def changes_since(self, revision):
+    with self._lock:
+      return (self.revision, self._changes_since(revision))
+
+  def _changes_since(self, revision):
+    if revision >= self.revision:
+      return (set(), set())
+    changes = [change for change in self._history if change.revision > revision]
+    if not changes or changes[0].revision != revision + 1:
+      return None
+    # IDs are content hashes so a message that was removed and added back
+    # (or added and removed again) did not change.
+    (added_ids, removed_ids) = (set(), set())
+    for change in changes:
+      for message_id in change.removed_ids:
+        if message_id in added_ids:
+          added_ids.remove(message_id)
+        else:
+          removed_ids.add(message_id)
+      for message_id in change.added_ids:
+        if message_id in removed_ids:
+          removed_ids.remove(message_id)
+        else:
+          added_ids.add(message_id)
+    return (added_ids, removed_ids)
+
+  def message_json(self, message_id):
+    with self._lock:
+      msg = self.catalog.get(message_id)
+      return None if msg is None else _message_json(msg, self.catalog.sources(message_id))
+
+  def file_json(self, filename):
+    with self._lock:
+      if self.catalog.get_file(filename) is None:
+        return None
+      return [_message_json(self.catalog[message_id], self.catalog.sources(message_id))
+              for message_id in self.catalog.message_ids_in_file(filename)]
+
+  def status_json(self):
+    with self._lock:
+      return OrderedDict([("revision", self.revision),
+                          ("files", len(self.catalog.files)),
+                          ("messages", len(self.catalog))])
+
+
+def _message_json(msg, sources):
+  result = message_printer.message_json(msg)
+  result["sources"] = [OrderedDict([("file", source.source_file.filename), ("line", source.line)])
+                       for source in sources]
+  return result
+
+
+# GET /status
+# GET /messages/<message id>
+# GET /file?path=<template filename as reported in sources>
+# GET /changes?since=<revision>
+#     {"revision": N, "added": [...], "removed": [...]} or, if the history
+#     does not reach back far enough, {"revision": N, "resync": true}.
+class RequestHandler(http.server.BaseHTTPRequestHandler):
+  server_version = "ng-i18n-watch"
+
+  def _send_json(self, status, value):
+    body = json.dumps(value).encode("utf-8")
+    self.send_response(status)
+    self.send_header("Content-Type", "application/json; charset=utf-8")
+    self.send_header("Content-Length", str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def _not_found(self, what):
+    self._send_json(404, OrderedDict([("error", "not found"), ("what", what)]))
+
+  def do_GET(self):
+    watched = self.server.watched_catalog
+    url = urllib.parse.urlsplit(self.path)
+    query = urllib.parse.parse_qs(url.query)
+    if url.path == "/status":
+      self._send_json(200, watched.status_json())
+    elif url.path.startswith("/messages/"):
+      message_id = urllib.parse.unquote(url.path[len("/messages/"):])
+      result = watched.message_json(message_id)
+      if result is None:
+        return self._not_found(message_id)
+      self._send_json(200, result)
+    elif url.path == "/file":
+      filename = query.get("path", [""])[0]
+      result = watched.file_json(filename)
+      if result is None:
+        return self._not_found(filename)
+      self._send_json(200, result)
+    elif url.path == "/changes":
+      try:
+        since = int(query.get("since", ["0"])[0])
+      except ValueError:
+        return self._send_json(400, OrderedDict([("error", "since must be a revision number")]))
+      (revision, changes) = watched.changes_since(since)
+      if changes is None:
+        return self._send_json(200, OrderedDict([("revision", revision), ("resync", True)]))
+      (added_ids, removed_ids) = changes
+      self._send_json(200, OrderedDict([("revision", revision),
+                                        ("added", sorted(added_ids)),
+                                        ("removed", sorted(removed_ids))]))
+    else:
+      self._not_found(url.path)
+
+  # Unix socket clients have no address.
+  def address_string(self):
+    return self.client_address[0] if self.client_address else "unix"
+
+  def log_message(self, format, *args):
+    logger.debug("%s - %s", self.address_string(), format % args)
+
+
+class HTTPServer(http.server.ThreadingHTTPServer):
+  def __init__(self, address, watched_catalog):
+    self.watched_catalog = watched_catalog
+    http.server.ThreadingHTTPServer.__init__(self, address, RequestHandler)
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+  daemon_threads = True
+
+  def __init__(self, socket_path, watched_catalog):
+    self.watched_catalog = watched_catalog
+    if os.path.exists(socket_path):
+      os.unlink(socket_path)
+    socketserver.UnixStreamServer.__init__(self, socket_path, RequestHandler)
+
+  # BaseHTTPRequestHandler expects these.
+  server_name = "localhost"
+  server_port = 0
+
+  def server_close(self):
+    socketserver.UnixStreamServer.server_close(self)
+    try:
+      os.unlink(self.server_address)
+    except OSError:
+      pass